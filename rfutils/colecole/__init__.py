@@ -0,0 +1,4 @@
+from .colecole import ColeCole
+from .colecole_table import ColeColeTable
+from .colecole_coeffs import tissue_colecole, tissue_names, tissue_table
+from .colecole_fit import classify_tissues, fit_colecole
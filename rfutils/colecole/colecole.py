@@ -10,6 +10,12 @@ from math import pi
 from scipy.constants import epsilon_0
 
 class ColeCole(object):
+    """Cole-Cole model of the complex relative permittivity:
+    epsilon = ef + sigma/(j w eps0) + sum_n deltas[n]/(1 + (j w taus[n])^(1-alphas[n]))
+    freq (Hz) may be a scalar or an array; epsilon, epsilon_r and sigma_eff
+    then have the shape of freq.  Results are cached on the parameters and
+    the frequency, so repeated queries are free and edits are never missed.
+    """
     def __init__(self, ef=0, sig=0, deltas=[], taus=[], alphas=[], freq=300e6):
         self._ef = ef
         self._sigma = sig
@@ -31,22 +37,42 @@ class ColeCole(object):
             self._alphas.append(alphas)
 
         self._epsilon = None
+        self._epsilon_key = None
         self._frequency = freq
 
+    def _key(self):
+        """Return the parameters and frequency the permittivity depends on.
+        """
+        freq = np.asarray(self._frequency)
+        return (self._ef, self._sigma, tuple(self._deltas), tuple(self._taus),
+                tuple(self._alphas), freq.shape, freq.tobytes())
+
     def _update_epsilon(self):
         """
         Calculate complex electric permittivity over given frequencies.
+        All poles are evaluated at all frequencies in one broadcast expression.
         """
-        omega = self._frequency*2.0*pi
-        self._epsilon = self._ef + self._sigma/(1j*omega*epsilon_0)
-        for i in range(len(self._deltas)):
-            self._epsilon += self._deltas[i]/(1+(1j*omega*self._taus[i])**(1-self._alphas[i]))
+        omega = np.asarray(self._frequency, dtype=np.float64)*2.0*pi
+        # frequencies x poles
+        deltas = np.asarray(self._deltas, dtype=np.float64)
+        taus = np.asarray(self._taus, dtype=np.float64)
+        alphas = np.asarray(self._alphas, dtype=np.float64)
+        poles = deltas/(1+(1j*omega[..., np.newaxis]*taus)**(1-alphas))
+        epsilon = self._ef + self._sigma/(1j*omega*epsilon_0) + np.sum(poles, axis=-1)
+        self._epsilon = epsilon[()] if np.ndim(epsilon) == 0 else epsilon
+        self._epsilon_key = self._key()
 
     @property
     def ef(self):
         """Return the infinite frequency relative permittivity."""
         return self._ef
 
+    @ef.setter
+    def ef(self, ef):
+        """Setter for the infinite frequency relative permittivity."""
+        self._ef = ef
+        self._epsilon = None
+
     @property
     def sigma(self):
         """Return the conductivity."""
@@ -56,6 +82,7 @@ class ColeCole(object):
     def sigma(self, sigma):
         """Setter for the conductivity."""
         self._sigma = sigma
+        self._epsilon = None
 
     @property
     def deltas(self):
@@ -70,6 +97,7 @@ class ColeCole(object):
         else:
             self._deltas = []
             self._deltas.append(dels)
+        self._epsilon = None
 
     @property
     def alphas(self):
@@ -84,6 +112,7 @@ class ColeCole(object):
         else:
             self._alphas = []
             self._alphas.append(alphas)
+        self._epsilon = None
 
     @property
     def taus(self):
@@ -98,13 +127,37 @@ class ColeCole(object):
         else:
             self._taus = []
             self._taus.append(taus)
+        self._epsilon = None
+
+    @property
+    def frequency(self):
+        """Return the frequency (Hz), a scalar or an array."""
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, freq):
+        """Setter for the frequency (Hz), a scalar or an array."""
+        self._frequency = freq
+        self._epsilon = None
 
     @property
     def epsilon(self):
         """Return the complex permittivity."""
-        if self._epsilon is None:
+        # lists may also be edited in place, so check the parameters too
+        if self._epsilon is None or self._epsilon_key != self._key():
             self._update_epsilon()
         return self._epsilon
+
+    @property
+    def epsilon_r(self):
+        """Return the relative permittivity, the real part of epsilon."""
+        return np.real(self.epsilon)
+
+    @property
+    def sigma_eff(self):
+        """Return the effective conductivity (S/m), from the imaginary part
+        of epsilon: sigma_eff = -w eps0 imag(epsilon)."""
+        return -np.imag(self.epsilon)*2.0*pi*np.asarray(self._frequency)*epsilon_0
     
 def usage(process):
     """
@@ -1,3 +1,103 @@
-#/usr/bin/env python
-"""Data structure to hold cole-cole parameters.
-"""
\ No newline at end of file
+#/usr/bin/env python
+"""Data structure to hold cole-cole parameters.
+The 4-pole Cole-Cole parameters of the Gabriel tissues ship with the package
+in data/gabriel_tissues.csv, compiled to data/gabriel_tissues.npy.  The
+compiled table is read on first use; nothing is loaded at import.
+The table holds 39 of the 44 tissues of IFAC Appendix C.  Cervix, Eye Tissues
+(Sclera), Ovary, Thyroid and Trachea are left out: no verified copy of their
+parameters was available offline to transcribe.  They can be appended to the
+CSV and compiled with compile_tissue_data.
+"""
+
+import os
+import csv
+import numpy as np
+from .colecole import ColeCole
+from .colecole_table import ColeColeTable
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TISSUE_SOURCE_FILE = os.path.join(DATA_DIR, 'gabriel_tissues.csv')
+TISSUE_DATA_FILE = os.path.join(DATA_DIR, 'gabriel_tissues.npy')
+
+NPOLE = 4
+# source columns of pole n: delta, tau, alpha; tau units per pole
+TAU_UNITS = [1.0e-12, 1.0e-9, 1.0e-6, 1.0e-3]
+
+_tissues = None
+_tissue_index = None
+
+def tissue_dtype(name_length=32):
+    """Return the structured dtype of the compiled tissue table (SI units).
+    """
+    return np.dtype([('name', 'U' + str(name_length)), ('ef', np.float64),
+                     ('sigma', np.float64), ('deltas', np.float64, (NPOLE,)),
+                     ('taus', np.float64, (NPOLE,)), ('alphas', np.float64, (NPOLE,))])
+
+def compile_tissue_data(source_file=TISSUE_SOURCE_FILE, data_file=TISSUE_DATA_FILE):
+    """Compile the tissue parameter CSV into the binary table read at run time.
+    Args:
+        source_file: CSV in the IFAC Appendix C column order
+        data_file:   .npy file to write
+    """
+    with open(source_file) as fh:
+        rows = list(csv.DictReader(line for line in fh if not line.startswith('#')))
+    tissues = np.zeros(len(rows), dtype=tissue_dtype(max(len(row['name']) for row in rows)))
+    for tissue, row in zip(tissues, rows):
+        tissue['name'] = row['name']
+        tissue['ef'] = float(row['ef'])
+        tissue['sigma'] = float(row['sigma'])
+        for n in range(NPOLE):
+            tissue['deltas'][n] = float(row['del' + str(n + 1)])
+            tissue['taus'][n] = float(row['tau' + str(n + 1)])*TAU_UNITS[n]
+            tissue['alphas'][n] = float(row['alf' + str(n + 1)])
+    np.save(data_file, tissues)
+    return tissues
+
+def tissues():
+    """Return the tissue parameter table, loading it on first use.
+    """
+    global _tissues, _tissue_index
+    if _tissues is None:
+        _tissues = np.load(TISSUE_DATA_FILE)
+        _tissue_index = {str(name): i for i, name in enumerate(_tissues['name'])}
+    return _tissues
+
+def tissue_names():
+    """Return the names of the tissues.
+    """
+    return [str(name) for name in tissues()['name']]
+
+def tissue_index():
+    """Return the tissue name -> row index of the tissue table.
+    """
+    tissues()
+    return dict(_tissue_index)
+
+def tissue_colecole(name, freq=300e6):
+    """Return the ColeCole model of tissue name at freq (Hz).
+    """
+    tissue = tissues()[_tissue_lookup(name)]
+    return ColeCole(float(tissue['ef']), float(tissue['sigma']), list(tissue['deltas']),
+                    list(tissue['taus']), list(tissue['alphas']), freq)
+
+def tissue_table(names=None):
+    """Return the ColeColeTable of tissues names, by default all tissues.
+    """
+    table = tissues()
+    if names is not None:
+        table = table[[_tissue_lookup(name) for name in names]]
+    return ColeColeTable(table['ef'], table['sigma'], table['deltas'],
+                         table['taus'], table['alphas'],
+                         [str(name) for name in table['name']])
+
+def _tissue_lookup(name):
+    """Return the row of tissue name.
+    """
+    tissues()
+    if name not in _tissue_index:
+        raise KeyError("Unknown tissue: " + str(name))
+    return _tissue_index[name]
+
+if __name__ == "__main__":
+    compile_tissue_data()
+    print("Compiled ", len(tissues()), " tissues to ", TISSUE_DATA_FILE)
@@ -0,0 +1,307 @@
+"""
+Per-voxel Cole-Cole fitting of measured permittivity and conductivity maps.
+Every voxel is an independent small least-squares problem; the problems of a
+chunk of voxels are solved together by a vectorized Levenberg-Marquardt
+iteration with the analytic Jacobian of the Cole-Cole model, and chunks are
+spread over worker processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from math import pi
+from scipy.constants import epsilon_0
+from .colecole_table import ColeColeTable
+from .colecole_coeffs import tissue_table
+
+# voxels solved together
+DEFAULT_CHUNK = 2**14
+PARAMETERS = ['ef', 'sigma', 'deltas', 'taus', 'alphas']
+# upper bound of the pole broadness
+MAX_ALPHA = 0.99
+
+def measured_epsilon(freqs, eps_r, sigma):
+    """Return the complex relative permittivity eps_r - j sigma/(w eps0).
+    Args:
+        freqs: frequencies (Hz) (nfreq)
+        eps_r: relative permittivity (...)x(nfreq)
+        sigma: effective conductivity (S/m) (...)x(nfreq)
+    """
+    omega = 2.0*pi*np.asarray(freqs, dtype=np.float64)
+    return np.asarray(eps_r) - 1j*np.asarray(sigma)/(omega*epsilon_0)
+
+def _pack(table):
+    """Return the parameter vectors (ntissue, 2+3*npole) of a ColeColeTable:
+    ef, sigma, deltas, log taus, alphas.  Zero taus stay -inf.
+    """
+    with np.errstate(divide='ignore'):
+        log_taus = np.log(table.taus)
+    return np.concatenate([table.ef[:, np.newaxis], table.sigma[:, np.newaxis],
+                           table.deltas, log_taus, table.alphas], axis=1)
+
+def _unpack(params, npole):
+    """Return ef, sigma, deltas, taus and alphas of parameter vectors.
+    """
+    return (params[..., 0], params[..., 1], params[..., 2:2 + npole],
+            np.exp(params[..., 2 + npole:2 + 2*npole]), params[..., 2 + 2*npole:])
+
+def colecole_model(omega, params, npole, jacobian=False):
+    """Evaluate the Cole-Cole model of ColeCole._update_epsilon for a batch of
+    parameter vectors, and optionally its analytic Jacobian.
+    Args:
+        omega:    angular frequencies (nfreq)
+        params:   parameter vectors (nbatch)x(2+3*npole): ef, sigma, deltas,
+                  log taus, alphas
+        npole:    number of poles
+        jacobian: also return d epsilon / d params
+
+    Returns:
+        epsilon (nbatch)x(nfreq) and, with jacobian,
+        (nbatch)x(nfreq)x(2+3*npole) derivatives.
+    With z = j w tau, u = z^(1-alpha) and D = 1 + u, a pole delta/D has
+    d/d delta = 1/D, d/d log tau = -delta (1-alpha) u/D^2 and
+    d/d alpha = delta u log(z)/D^2.
+    """
+    ef, sigma, deltas, taus, alphas = _unpack(params, npole)
+    w = omega[np.newaxis, :, np.newaxis]
+    exponent = (1.0 - alphas)[:, np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # batch x frequencies x poles
+        log_z = np.log(w*taus[:, np.newaxis, :]) + 0.5j*pi
+        u = np.exp(exponent*log_z)
+    has_pole = taus[:, np.newaxis, :] > 0.0
+    u = np.where(has_pole, u, 0.0)
+    inv_d = 1.0/(1.0 + u)
+    static = 1.0/(1j*omega*epsilon_0)
+    epsilon = ef[:, np.newaxis] + sigma[:, np.newaxis]*static + \
+        np.sum(deltas[:, np.newaxis, :]*inv_d, axis=-1)
+    if not jacobian:
+        return epsilon
+    dpole = deltas[:, np.newaxis, :]*u*inv_d**2
+    jac = np.empty(np.shape(epsilon) + (2 + 3*npole,), dtype=np.complex128)
+    jac[..., 0] = 1.0
+    jac[..., 1] = static
+    jac[..., 2:2 + npole] = inv_d
+    jac[..., 2 + npole:2 + 2*npole] = -dpole*exponent
+    jac[..., 2 + 2*npole:] = np.where(has_pole, dpole*log_z, 0.0)
+    return epsilon, jac
+
+def _distances(omega, measured, table_eps):
+    """Return the squared relative distance (nvoxel)x(ntissue) of measured
+    dispersion curves to the tissue curves.
+    """
+    diff = (table_eps[np.newaxis, :, :] - measured[:, np.newaxis, :])/ \
+        np.abs(measured[:, np.newaxis, :])
+    return np.sum(diff.real**2 + diff.imag**2, axis=-1)
+
+def _classify_chunk(omega, measured, table_eps):
+    """Return the nearest tissue of every voxel of a chunk.
+    """
+    return np.argmin(_distances(omega, measured, table_eps), axis=-1)
+
+def _projection(params, npole):
+    """Keep parameter vectors physical: non-negative ef, sigma and deltas,
+    alphas in [0, MAX_ALPHA].
+    """
+    np.maximum(params[:, :2 + npole], 0.0, out=params[:, :2 + npole])
+    np.clip(params[:, 2 + 2*npole:], 0.0, MAX_ALPHA, out=params[:, 2 + 2*npole:])
+    return params
+
+def _residuals(omega, params, measured, npole, free=None):
+    """Return the relative residuals (nbatch)x(2 nfreq), real and imaginary
+    parts, and with free the Jacobian of the free parameters.
+    """
+    scale = 1.0/np.abs(measured)
+    if free is None:
+        diff = (colecole_model(omega, params, npole) - measured)*scale
+        return np.concatenate([diff.real, diff.imag], axis=-1)
+    epsilon, jac = colecole_model(omega, params, npole, jacobian=True)
+    diff = (epsilon - measured)*scale
+    jac = jac[..., free]*scale[..., np.newaxis]
+    return np.concatenate([diff.real, diff.imag], axis=-1), \
+        np.concatenate([jac.real, jac.imag], axis=-2)
+
+def _fit_chunk(omega, measured, params, npole, free, max_iter, tol):
+    """Levenberg-Marquardt fit of a chunk of voxels.
+    Args:
+        omega:    angular frequencies (nfreq)
+        measured: measured permittivity (nvoxel)x(nfreq)
+        params:   initial parameter vectors (nvoxel)x(2+3*npole)
+        npole:    number of poles
+        free:     indices of the fitted parameters
+        max_iter: maximum number of iterations
+        tol:      relative cost decrease below which a voxel has converged
+
+    Returns:
+        fitted parameter vectors and the final cost of every voxel.
+    """
+    params = _projection(np.array(params, dtype=np.float64), npole)
+    res, jac = _residuals(omega, params, measured, npole, free)
+    cost = np.sum(res**2, axis=-1)
+    lam = np.full(len(params), 1.0e-3)
+    active = np.flatnonzero(cost > 0.0)
+    nfree = len(free)
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        jac_a = jac[active]
+        jtj = np.einsum('bmi,bmj->bij', jac_a, jac_a)
+        jtr = np.einsum('bmi,bm->bi', jac_a, res[active])
+        # Marquardt damping scaled by the curvature of every parameter
+        diag = np.diagonal(jtj, axis1=1, axis2=2)
+        diag = np.maximum(diag, 1.0e-12*np.max(diag, axis=-1, keepdims=True) + 1.0e-300)
+        damped = jtj + (lam[active, np.newaxis]*diag)[..., np.newaxis]*np.eye(nfree)
+        step = np.linalg.solve(damped, -jtr[..., np.newaxis])[..., 0]
+
+        trial = params[active].copy()
+        trial[:, free] += step
+        _projection(trial, npole)
+        trial_res, trial_jac = _residuals(omega, trial, measured[active], npole, free)
+        trial_cost = np.sum(trial_res**2, axis=-1)
+
+        better = trial_cost < cost[active]
+        improved = active[better]
+        decrease = cost[improved] - trial_cost[better]
+        params[improved] = trial[better]
+        res[improved] = trial_res[better]
+        jac[improved] = trial_jac[better]
+        lam[improved] /= 10.0
+        lam[active[~better]] *= 10.0
+        converged = np.zeros(len(active), dtype=bool)
+        converged[better] = decrease <= tol*cost[improved]
+        cost[improved] = trial_cost[better]
+        converged |= lam[active] > 1.0e12
+        active = active[~converged]
+    return params, cost
+
+def valid_voxels(measured, mask=None):
+    """Return the voxels of measured permittivity (nvoxel)x(nfreq) that can
+    be fitted: finite and non-zero at every frequency, and inside the
+    optional flat mask.  NormalDielectric writes zeros below its field floor
+    and outside its mask.
+    """
+    valid = np.all(np.isfinite(measured) & (measured != 0.0), axis=-1)
+    if mask is not None:
+        valid &= np.ravel(mask).astype(bool)
+    return valid
+
+def classify_tissues(freqs, eps_r, sigma, table=None, chunk=DEFAULT_CHUNK, mask=None):
+    """Classify voxels by the tissue with the nearest dispersion curve.
+    Args:
+        freqs: frequencies (Hz) (nfreq)
+        eps_r: relative permittivity maps (...)x(nfreq), e.g. stacked
+               NormalDielectric.epsilon_r_weighted at several frequencies
+        sigma: effective conductivity maps (S/m) (...)x(nfreq)
+        table: ColeColeTable of the candidate tissues, default all bundled
+               tissues
+        chunk: voxels classified together
+        mask:  optional voxels to classify, the shape of eps_r without the
+               frequency axis
+
+    Returns:
+        index into table of the nearest tissue, the shape of eps_r without the
+        frequency axis; the distance is the relative squared error of the
+        complex permittivity summed over frequency.  Voxels outside mask or
+        with zero or non-finite values (see valid_voxels) are -1.
+    """
+    if table is None:
+        table = tissue_table()
+    omega = 2.0*pi*np.asarray(freqs, dtype=np.float64)
+    measured = measured_epsilon(freqs, eps_r, sigma)
+    shape = np.shape(measured)[:-1]
+    measured = np.reshape(measured, (-1, len(omega)))
+    valid = valid_voxels(measured, mask)
+    measured = measured[valid]
+    table_eps = table.epsilon(freqs)
+    classified = np.empty(len(measured), dtype=np.intp)
+    for i0 in range(0, len(measured), chunk):
+        classified[i0:i0 + chunk] = _classify_chunk(omega, measured[i0:i0 + chunk],
+                                                    table_eps)
+    index = np.full(len(valid), -1, dtype=np.intp)
+    index[valid] = classified
+    return np.reshape(index, shape)
+
+def fit_colecole(freqs, eps_r, sigma, table=None, free=('ef', 'sigma', 'deltas'),
+                 poles=None, max_iter=50, tol=1.0e-12, chunk=DEFAULT_CHUNK, workers=1,
+                 mask=None):
+    """Fit Cole-Cole parameters to every voxel of permittivity and
+    conductivity maps measured at several frequencies.
+    Every voxel starts from the parameters of its nearest tissue (see
+    classify_tissues); the free parameters are then refined by batched
+    Levenberg-Marquardt iterations and the others keep the tissue values.
+    Args:
+        freqs:    frequencies (Hz) (nfreq)
+        eps_r:    relative permittivity maps (...)x(nfreq)
+        sigma:    effective conductivity maps (S/m) (...)x(nfreq)
+        table:    ColeColeTable of the starting tissues, default all bundled
+                  tissues
+        free:     fitted parameters, from 'ef', 'sigma', 'deltas', 'taus',
+                  'alphas'; with few frequencies, fit few parameters
+        poles:    poles whose deltas/taus/alphas are fitted, default all
+        max_iter: maximum number of iterations
+        tol:      relative cost decrease below which a voxel has converged
+        chunk:    voxels fitted together
+        workers:  processes fitting chunks, None for the CPU count
+        mask:     optional voxels to fit, the shape of eps_r without the
+                  frequency axis
+
+    Returns:
+        dict of fitted 'ef', 'sigma' (...), 'deltas', 'taus', 'alphas'
+        (...)x(npole), the starting 'tissue' index and the final 'cost', the
+        relative squared residual summed over frequency.  Voxels that are not
+        fitted (see classify_tissues) have tissue -1 and NaN parameters and
+        cost.
+    """
+    for name in free:
+        if name not in PARAMETERS:
+            raise ValueError("Unknown Cole-Cole parameter: " + str(name) +
+                             ", expected one of " + str(PARAMETERS))
+    if table is None:
+        table = tissue_table()
+    npole = np.shape(table.deltas)[1]
+    if poles is None:
+        poles = range(npole)
+    offsets = {'deltas': 2, 'taus': 2 + npole, 'alphas': 2 + 2*npole}
+    free_index = [PARAMETERS.index(name) for name in free if name in ('ef', 'sigma')]
+    for name in free:
+        if name in offsets:
+            free_index += [offsets[name] + pole for pole in poles]
+    free_index = np.array(sorted(free_index), dtype=np.intp)
+
+    omega = 2.0*pi*np.asarray(freqs, dtype=np.float64)
+    tissue = classify_tissues(freqs, eps_r, sigma, table, chunk, mask)
+    shape = np.shape(tissue)
+    valid = np.ravel(tissue) >= 0
+    measured = np.reshape(measured_epsilon(freqs, eps_r, sigma), (-1, len(omega)))[valid]
+    initial = _pack(table)[np.ravel(tissue)[valid]]
+
+    bounds = [(i0, min(i0 + chunk, len(measured))) for i0 in range(0, len(measured), chunk)]
+    tasks = [(omega, measured[i0:i1], initial[i0:i1], npole, free_index, max_iter, tol)
+             for i0, i1 in bounds]
+    if workers is None:
+        workers = os.cpu_count()
+    if workers == 1:
+        results = [_fit_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_fit_chunk, *zip(*tasks)))
+    params = np.full((len(valid), np.shape(initial)[1]), np.nan)
+    cost = np.full(len(valid), np.nan)
+    if results:
+        params[valid] = np.concatenate([result[0] for result in results])
+        cost[valid] = np.concatenate([result[1] for result in results])
+
+    ef, sig, deltas, taus, alphas = _unpack(params, npole)
+    return {'ef': np.reshape(ef, shape), 'sigma': np.reshape(sig, shape),
+            'deltas': np.reshape(deltas, shape + (npole,)),
+            'taus': np.reshape(taus, shape + (npole,)),
+            'alphas': np.reshape(alphas, shape + (npole,)),
+            'tissue': tissue, 'cost': np.reshape(cost, shape)}
+
+def fitted_table(fit):
+    """Return the ColeColeTable of the voxels of a fit_colecole result.
+    """
+    return ColeColeTable(np.ravel(fit['ef']), np.ravel(fit['sigma']),
+                         np.reshape(fit['deltas'], (np.size(fit['ef']), -1)),
+                         np.reshape(fit['taus'], (np.size(fit['ef']), -1)),
+                         np.reshape(fit['alphas'], (np.size(fit['ef']), -1)))
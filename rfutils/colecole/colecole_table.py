@@ -0,0 +1,148 @@
+"""
+Cole-Cole permittivity of many tissues at many frequencies.
+Parameters are held as arrays, one row per tissue, and the permittivity of
+all tissues at all frequencies is evaluated in a single broadcast kernel.
+"""
+
+import numpy as np
+from math import pi
+from scipy.constants import epsilon_0
+from ..precision import precision_dtypes
+
+# frequencies evaluated at once; bounds the (ntissue, nfreq, npole) temporaries
+DEFAULT_FREQ_CHUNK = 4096
+
+class ColeColeTable(object):
+    """Cole-Cole parameters of many tissues in structure-of-arrays layout.
+    Tissues with fewer poles are padded with zero deltas.
+
+    Parameters
+    ----------
+    ef : array_like
+        Infinite frequency relative permittivity (ntissue).
+    sigma : array_like
+        Static ionic conductivity (ntissue).
+    deltas : array_like
+        Relative permittivity steps (ntissue, npole).
+    taus : array_like
+        Relaxation times (ntissue, npole).
+    alphas : array_like
+        Pole broadness (ntissue, npole).
+    names : list of str, optional
+        Tissue names.
+    """
+    def __init__(self, ef, sigma, deltas, taus, alphas, names=None):
+        self._ef = np.atleast_1d(np.asarray(ef, dtype=np.float64))
+        self._sigma = np.atleast_1d(np.asarray(sigma, dtype=np.float64))
+        ntissue = len(self._ef)
+        self._deltas, self._taus, self._alphas = [
+            np.asarray(param, dtype=np.float64).reshape(
+                ntissue, np.size(param) // max(ntissue, 1))
+            for param in (deltas, taus, alphas)]
+        if not (np.shape(self._sigma) == (ntissue,) and
+                np.shape(self._deltas) == np.shape(self._taus) == np.shape(self._alphas)):
+            raise ValueError("Inconsistent Cole-Cole parameter shapes.")
+        self._names = list(names) if names is not None else \
+            [str(i) for i in range(ntissue)]
+        if len(self._names) != ntissue:
+            raise ValueError("Expected " + str(ntissue) + " names, found " +
+                             str(len(self._names)))
+        self._name_index = {name: i for i, name in enumerate(self._names)}
+
+    @classmethod
+    def from_colecole(cls, models, names=None):
+        """Build a table from ColeCole objects (or any objects with ef, sigma,
+        deltas, taus and alphas).
+        """
+        npole = max([len(model.deltas) for model in models] + [0])
+        params = np.zeros((3, len(models), npole))
+        for i, model in enumerate(models):
+            for param, values in zip(params, (model.deltas, model.taus, model.alphas)):
+                param[i, :len(values)] = values
+        return cls([model.ef for model in models],
+                   [model.sigma for model in models],
+                   params[0], params[1], params[2], names)
+
+    def __len__(self):
+        return len(self._ef)
+
+    def select(self, tissues):
+        """Return the table of tissues, a list of names or indices.
+        """
+        index = [self._name_index[t] if isinstance(t, str) else t for t in tissues]
+        return ColeColeTable(self._ef[index], self._sigma[index], self._deltas[index],
+                             self._taus[index], self._alphas[index],
+                             [self._names[i] for i in index])
+
+    def epsilon(self, freq, precision='double', freq_chunk=DEFAULT_FREQ_CHUNK):
+        """Return the complex relative permittivity (ntissue, nfreq).
+        Args:
+            freq:       frequencies (Hz), scalar or (nfreq)
+            precision:  'double' or 'single' (complex64) output
+            freq_chunk: frequencies evaluated at once
+
+        (j w tau)^(1-alpha) is evaluated as (w tau)^(1-alpha) rotated by the
+        per-pole phase (1-alpha) pi/2, so the kernel needs a single real power.
+        """
+        cdtype, _ = precision_dtypes(precision)
+        omega = 2.0*pi*np.atleast_1d(np.asarray(freq, dtype=np.float64))
+        exponent = 1.0 - self._alphas[:, np.newaxis, :]
+        rotation = np.exp(0.5j*pi*exponent)
+        eps = np.empty((len(self), len(omega)), dtype=cdtype)
+        for f0 in range(0, len(omega), freq_chunk):
+            w = omega[f0:f0 + freq_chunk]
+            # tissues x frequencies x poles
+            wtau = w[np.newaxis, :, np.newaxis]*self._taus[:, np.newaxis, :]
+            poles = self._deltas[:, np.newaxis, :]/(1.0 + rotation*wtau**exponent)
+            eps[:, f0:f0 + freq_chunk] = (
+                self._ef[:, np.newaxis] - 1j*self._sigma[:, np.newaxis]/(w*epsilon_0) +
+                np.sum(poles, axis=-1))
+        return eps
+
+    def epsilon_r(self, freq, precision='double', freq_chunk=DEFAULT_FREQ_CHUNK):
+        """Return the relative permittivity (ntissue, nfreq).
+        """
+        return np.real(self.epsilon(freq, precision, freq_chunk))
+
+    def sigma_eff(self, freq, precision='double', freq_chunk=DEFAULT_FREQ_CHUNK):
+        """Return the effective conductivity (S/m) (ntissue, nfreq).
+        """
+        _, rdtype = precision_dtypes(precision)
+        omega = 2.0*pi*np.atleast_1d(np.asarray(freq, dtype=np.float64))
+        return (-np.imag(self.epsilon(freq, 'double', freq_chunk))*omega*epsilon_0
+                ).astype(rdtype, copy=False)
+
+    @property
+    def names(self):
+        """Return the tissue names."""
+        return list(self._names)
+
+    @property
+    def name_index(self):
+        """Return the tissue name -> row index."""
+        return dict(self._name_index)
+
+    @property
+    def ef(self):
+        """Return the infinite frequency relative permittivities."""
+        return self._ef
+
+    @property
+    def sigma(self):
+        """Return the static conductivities."""
+        return self._sigma
+
+    @property
+    def deltas(self):
+        """Return the relative permittivity steps (ntissue, npole)."""
+        return self._deltas
+
+    @property
+    def taus(self):
+        """Return the relaxation times (ntissue, npole)."""
+        return self._taus
+
+    @property
+    def alphas(self):
+        """Return the pole broadness values (ntissue, npole)."""
+        return self._alphas
@@ -3,6 +3,7 @@ Unit tests for colecole.py
 """
 import unittest
 import numpy as np
+from scipy.constants import epsilon_0
 import colecole
 
 class TestColeCole(unittest.TestCase):
@@ -113,6 +114,48 @@ class TestColeCole(unittest.TestCase):
         self.assertTrue(np.isclose(48.3209414503-32.17775682845j,
                                    cc4.epsilon))
         
+    def test_epsilon_sweep(self):
+        """
+        Test the permittivity over an array of frequencies.
+        """
+        freqs = np.linspace(10e6, 1e9, 25)
+        params = (4.0, 0.25, [40.0, 50.0, 1.0e5, 1.0e7],
+                  [8.843e-12, 3.183e-9, 159.155e-6, 1.592e-3],
+                  [0.1, 0.1, 0.2, 0.0])
+        sweep = colecole.ColeCole(*params, freq=freqs)
+        self.assertEqual((25,), np.shape(sweep.epsilon))
+        for i, freq in enumerate(freqs):
+            self.assertTrue(np.isclose(colecole.ColeCole(*params, freq).epsilon,
+                                       sweep.epsilon[i], rtol=1e-14))
+        self.assertTrue(np.allclose(sweep.epsilon_r, sweep.epsilon.real))
+        self.assertTrue(np.allclose(
+            sweep.sigma_eff, -sweep.epsilon.imag*2.0*np.pi*freqs*epsilon_0))
+        sweep.frequency = 300e6
+        self.assertTrue(np.isclose(48.3209414503-32.17775682845j, sweep.epsilon))
+
+    def test_epsilon_cache(self):
+        """
+        Test that parameter edits are never missed by the cached permittivity.
+        """
+        cc1 = colecole.ColeCole(4, 0.25, 40, 8.842e-12, 0.1, 300e6)
+        eps1 = cc1.epsilon
+        self.assertIs(eps1, cc1.epsilon)
+        cc1.sigma = 0.5
+        self.assertTrue(np.isclose(colecole.ColeCole(4, 0.5, 40, 8.842e-12, 0.1,
+                                                     300e6).epsilon, cc1.epsilon))
+        cc1.deltas.append(50.0)
+        cc1.taus.append(3.183e-9)
+        cc1.alphas.append(0.1)
+        self.assertTrue(np.isclose(colecole.ColeCole(4, 0.5, [40.0, 50.0],
+                                                     [8.842e-12, 3.183e-9],
+                                                     [0.1, 0.1]).epsilon,
+                                   cc1.epsilon))
+        cc1.ef = 5
+        self.assertTrue(np.isclose(colecole.ColeCole(5, 0.5, [40.0, 50.0],
+                                                     [8.842e-12, 3.183e-9],
+                                                     [0.1, 0.1]).epsilon,
+                                   cc1.epsilon))
+
     def test_colecole_main(self):
         """
         Test the main routine (for command line).
@@ -0,0 +1,52 @@
+"""
+Unit tests for colecole_coeffs.py
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+from rfutils.colecole import colecole_coeffs
+
+class TestColeColeCoeffs(unittest.TestCase):
+    """Tests for the bundled tissue parameters"""
+    def test_tissue_names(self):
+        """
+        Test the name index of the bundled tissues.
+        """
+        names = colecole_coeffs.tissue_names()
+        self.assertEqual(39, len(names))
+        self.assertIn('Muscle', names)
+        self.assertEqual(names.index('Blood'),
+                         colecole_coeffs.tissue_index()['Blood'])
+        with self.assertRaises(KeyError):
+            colecole_coeffs.tissue_colecole('Unobtainium')
+
+    def test_tissue_properties(self):
+        """
+        Test tissue properties against the IFAC tabulated values.
+        """
+        freqs = np.array([64e6, 128e6, 300e6])
+        table = colecole_coeffs.tissue_table(['Muscle', 'Cerebro Spinal Fluid',
+                                              'Fat (Not Infiltrated)'])
+        self.assertTrue(np.allclose([[72.2, 63.5, 58.2], [97.3, 84.0, 72.7],
+                                     [6.51, 5.92, 5.63]],
+                                    table.epsilon_r(freqs), rtol=2e-3))
+        self.assertTrue(np.allclose([[0.688, 0.719, 0.771], [2.07, 2.14, 2.22],
+                                     [0.0353, 0.0368, 0.0396]],
+                                    table.sigma_eff(freqs), rtol=1e-2))
+        muscle = colecole_coeffs.tissue_colecole('Muscle', freqs)
+        self.assertTrue(np.allclose(table.epsilon(freqs)[0], muscle.epsilon,
+                                    rtol=1e-12, atol=0))
+
+    def test_compiled_data(self):
+        """
+        Test that the bundled binary table is compiled from the CSV source.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_file = os.path.join(tmp_dir, 'tissues.npy')
+            compiled = colecole_coeffs.compile_tissue_data(data_file=data_file)
+            self.assertTrue(np.array_equal(compiled, np.load(data_file)))
+        self.assertTrue(np.array_equal(compiled, colecole_coeffs.tissues()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Unit tests for colecole_fit.py
+"""
+import unittest
+import numpy as np
+from rfutils.colecole import colecole_fit
+from rfutils.colecole.colecole_coeffs import tissue_table
+from rfutils.colecole.colecole_table import ColeColeTable
+
+class TestColeColeFit(unittest.TestCase):
+    """Tests for the batched Cole-Cole fitter"""
+    def setUp(self):
+        self.table = tissue_table(['Muscle', 'Fat (Not Infiltrated)',
+                                   'Brain (Grey Matter)', 'Blood'])
+        self.npole = 4
+        self.freqs = np.geomspace(1e7, 1e10, 16)
+        rng = np.random.default_rng(0)
+        self.rows = np.tile(np.arange(len(self.table)), 25)
+        self.params = colecole_fit._pack(self.table)[self.rows]
+        self.params[:, 0] *= 1.0 + 0.05*rng.standard_normal(len(self.rows))
+        self.params[:, 1] *= 1.0 + 0.05*rng.standard_normal(len(self.rows))
+        # second pole: delta, tau and alpha
+        self.params[:, 3] *= 1.0 + 0.1*rng.standard_normal(len(self.rows))
+        self.params[:, 7] += np.log(1.1)
+        self.params[:, 11] += 0.02
+        self.truth = ColeColeTable(*colecole_fit._unpack(self.params, self.npole))
+
+    def test_jacobian(self):
+        """
+        Test the analytic Jacobian against central differences.
+        """
+        omega = 2.0*np.pi*self.freqs
+        params = self.params[:4]
+        _, jac = colecole_fit.colecole_model(omega, params, self.npole, jacobian=True)
+        for k in range(params.shape[1]):
+            step = 1e-6*max(abs(params[0, k]), 1e-3)
+            upper, lower = params.copy(), params.copy()
+            upper[:, k] += step
+            lower[:, k] -= step
+            diff = (colecole_fit.colecole_model(omega, upper, self.npole) -
+                    colecole_fit.colecole_model(omega, lower, self.npole))/(2.0*step)
+            self.assertTrue(np.allclose(diff, jac[..., k], rtol=1e-5,
+                                        atol=1e-6*np.max(np.abs(jac[..., k]))))
+
+    def test_classify_tissues(self):
+        """
+        Test nearest tissue classification of dispersion curves.
+        """
+        eps_r = self.table.epsilon_r(self.freqs)[self.rows]
+        sigma = self.table.sigma_eff(self.freqs)[self.rows]
+        tissue = colecole_fit.classify_tissues(self.freqs, eps_r.reshape(4, 25, -1),
+                                               sigma.reshape(4, 25, -1), self.table, chunk=7)
+        self.assertEqual((4, 25), tissue.shape)
+        self.assertTrue(np.array_equal(self.rows, tissue.ravel()))
+
+    def test_fit_colecole(self):
+        """
+        Test that fitting recovers the permittivity of perturbed tissues.
+        """
+        eps_r = self.truth.epsilon_r(self.freqs)
+        sigma = self.truth.sigma_eff(self.freqs)
+        fit = colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table,
+                                        free=('ef', 'sigma', 'deltas', 'taus', 'alphas'),
+                                        poles=[1], max_iter=100, chunk=32)
+        self.assertTrue(np.array_equal(self.rows, fit['tissue']))
+        self.assertEqual((len(self.rows), self.npole), fit['taus'].shape)
+        self.assertLess(np.median(fit['cost']), 1e-20)
+        self.assertTrue(np.allclose(fit['ef'], self.truth.ef, rtol=1e-3))
+        self.assertTrue(np.allclose(fit['sigma'], self.truth.sigma, rtol=1e-3))
+        fitted = colecole_fit.fitted_table(fit).epsilon(self.freqs)
+        self.assertTrue(np.allclose(fitted, self.truth.epsilon(self.freqs), rtol=1e-4))
+
+    def test_invalid_voxels(self):
+        """
+        Test that zero, non-finite and masked voxels are left out of the fit.
+        """
+        eps_r = np.vstack([self.truth.epsilon_r(self.freqs)[:2],
+                           np.zeros((2, len(self.freqs)))])
+        sigma = np.vstack([self.truth.sigma_eff(self.freqs)[:2],
+                           np.zeros((2, len(self.freqs)))])
+        eps_r[3, 0] = np.nan
+        sigma[3] = 0.5
+        with np.errstate(all='raise'):
+            fit = colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table)
+        np.testing.assert_array_equal(fit['tissue'], [self.rows[0], self.rows[1], -1, -1])
+        self.assertTrue(np.all(np.isfinite(fit['cost'][:2])))
+        self.assertTrue(np.all(np.isnan(fit['cost'][2:])))
+        self.assertTrue(np.all(np.isnan(fit['deltas'][2:])))
+        masked = colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table,
+                                           mask=[False, True, True, True])
+        np.testing.assert_array_equal(masked['tissue'], [-1, self.rows[1], -1, -1])
+        np.testing.assert_array_equal(masked['ef'][1], fit['ef'][1])
+
+    def test_fit_workers(self):
+        """
+        Test that process parallel fitting matches serial fitting.
+        """
+        eps_r = self.truth.epsilon_r(self.freqs)
+        sigma = self.truth.sigma_eff(self.freqs)
+        serial = colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table, chunk=16)
+        parallel = colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table,
+                                             chunk=16, workers=2)
+        for key in serial:
+            self.assertTrue(np.array_equal(serial[key], parallel[key]))
+        with self.assertRaises(ValueError):
+            colecole_fit.fit_colecole(self.freqs, eps_r, sigma, self.table, free=('kappa',))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Unit tests for colecole_table.py
+"""
+import unittest
+import numpy as np
+from rfutils.colecole import colecole, colecole_table
+
+class TestColeColeTable(unittest.TestCase):
+    """Tests for ColeColeTable class"""
+    def setUp(self):
+        self.models = [colecole.ColeCole(4.0, 0.25, 40.0, 8.842e-12, 0.1),
+                       colecole.ColeCole(4.0, 0.25,
+                                         [40.0, 50.0, 1.0e5, 1.0e7],
+                                         [8.843e-12, 3.183e-9, 159.155e-6, 1.592e-3],
+                                         [0.1, 0.1, 0.2, 0.0]),
+                       colecole.ColeCole(2.5, 0.01,
+                                         [9.0, 35.0, 3.3e4, 1.0e7],
+                                         [7.958e-12, 15.915e-9, 159.155e-6, 7.958e-3],
+                                         [0.2, 0.1, 0.05, 0.01])]
+        self.table = colecole_table.ColeColeTable.from_colecole(
+            self.models, ['Aorta_1', 'Aorta', 'Fat'])
+        self.freqs = np.geomspace(1e6, 1e10, 50)
+
+    def test_table_layout(self):
+        """
+        Test the structure-of-arrays layout and name index.
+        """
+        self.assertEqual(3, len(self.table))
+        self.assertEqual((3, 4), np.shape(self.table.deltas))
+        self.assertEqual([40.0, 0.0, 0.0, 0.0], list(self.table.deltas[0]))
+        self.assertEqual(2, self.table.name_index['Fat'])
+        fat = self.table.select(['Fat'])
+        self.assertEqual(['Fat'], fat.names)
+        self.assertEqual(list(self.table.taus[2]), list(fat.taus[0]))
+        with self.assertRaises(ValueError):
+            colecole_table.ColeColeTable([1.0, 2.0], [0.1], [[1.0]], [[1.0]], [[0.1]])
+
+    def test_epsilon_matches_colecole(self):
+        """
+        Test the table against per-tissue ColeCole evaluation.
+        """
+        eps = self.table.epsilon(self.freqs)
+        self.assertEqual((3, 50), np.shape(eps))
+        for i, model in enumerate(self.models):
+            model.frequency = self.freqs
+            self.assertTrue(np.allclose(model.epsilon, eps[i], rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(model.sigma_eff,
+                                        self.table.sigma_eff(self.freqs)[i],
+                                        rtol=1e-12, atol=0))
+        self.assertTrue(np.array_equal(eps.real, self.table.epsilon_r(self.freqs)))
+        self.assertTrue(np.isclose(48.3209414503-32.17775682845j,
+                                   self.table.epsilon(300e6)[1, 0]))
+
+    def test_precision_and_chunks(self):
+        """
+        Test single precision output and chunking over frequency.
+        """
+        eps = self.table.epsilon(self.freqs)
+        self.assertTrue(np.array_equal(eps, self.table.epsilon(self.freqs,
+                                                               freq_chunk=7)))
+        eps32 = self.table.epsilon(self.freqs, precision='single')
+        self.assertEqual(np.complex64, eps32.dtype)
+        self.assertTrue(np.allclose(eps, eps32, rtol=1e-6, atol=0))
+        self.assertEqual(np.float32, self.table.sigma_eff(self.freqs, 'single').dtype)
+        with self.assertRaises(ValueError):
+            self.table.epsilon(self.freqs, precision='half')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,2 +1,5 @@
 from .material import Material
 from .material_mapper import MaterialMapper
+from .materials_db import MaterialsDB, MaterialsDBVirtualFamily
+from .material_volume import MaterialVolume
+from .dispersive_volume import map_dispersive, map_dispersive_h5
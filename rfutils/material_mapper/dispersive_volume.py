@@ -0,0 +1,110 @@
+"""Dispersive property volumes: permittivity and conductivity of a tissue
+index volume over a frequency sweep.
+The (ntissue, nfreq) property table is evaluated once from the Cole-Cole
+models of the tissues, and every voxel gathers all frequencies from it, so a
+sweep reads the index volume once instead of remapping it per frequency.
+"""
+
+import time
+import numpy as np
+import h5py
+from ..colecole.colecole import ColeCole
+from ..colecole.colecole_table import ColeColeTable
+from ..colecole.colecole_coeffs import tissue_table
+from .material_mapper import DEFAULT_CHUNK_VOXELS
+
+def dispersive_table(tissues, freqs):
+    """Return the relative permittivity and conductivity (S/m) of tissues at
+    freqs, as (nfreq, ntissue) arrays.
+    Args:
+        tissues: ColeColeTable, list of ColeCole models or list of bundled
+                 tissue names
+        freqs:   frequencies (Hz) (nfreq)
+    """
+    table = _colecole_table(tissues)
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+    return table.epsilon_r(freqs).T.copy(), table.sigma_eff(freqs).T.copy()
+
+def _colecole_table(tissues):
+    """Return the ColeColeTable of tissues.
+    """
+    if isinstance(tissues, ColeColeTable):
+        return tissues
+    tissues = list(tissues)
+    if all(isinstance(tissue, str) for tissue in tissues):
+        return tissue_table(tissues)
+    if all(isinstance(tissue, ColeCole) for tissue in tissues):
+        return ColeColeTable.from_colecole(tissues)
+    raise ValueError("Expected a ColeColeTable, ColeCole models or tissue names.")
+
+def _gather(table, index):
+    """Return table (nfreq, ntissue) gathered at index, (nfreq,) + index shape.
+    """
+    index = np.asarray(index)
+    if index.size > 0 and (np.min(index) < 0 or np.max(index) >= table.shape[1]):
+        raise ValueError("Tissue index out of range [0, " + str(table.shape[1]) +
+                         "): [" + str(np.min(index)) + ", " + str(np.max(index)) + "]")
+    return np.take(table, index, axis=1)
+
+def map_dispersive(index, tissues, freqs):
+    """Return the relative permittivity and conductivity (S/m) volumes of a
+    tissue index volume at freqs, each (nfreq,) + index shape.
+    Args:
+        index:   tissue index volume, rows of tissues
+        tissues: ColeColeTable, list of ColeCole models or list of bundled
+                 tissue names
+        freqs:   frequencies (Hz) (nfreq)
+    """
+    epsr, sigma = dispersive_table(tissues, freqs)
+    index = np.asarray(index)
+    return _gather(epsr, index), _gather(sigma, index)
+
+def map_dispersive_h5(index, tissues, freqs, output_file,
+                      chunk_voxels=DEFAULT_CHUNK_VOXELS, progress=None,
+                      compression='gzip', compression_opts=4, dtype=np.float64):
+    """Write the relative permittivity and conductivity volumes of a tissue
+    index volume at freqs to an HDF5 file.
+    Args:
+        index:        tissue index volume, an h5py dataset or any array-like
+                      that can be sliced along the first axis
+        tissues:      ColeColeTable, list of ColeCole models or list of bundled
+                      tissue names
+        freqs:        frequencies (Hz) (nfreq)
+        output_file:  HDF5 file for the results
+        chunk_voxels: approximate voxels of the index volume per chunk
+        progress:     optional callable progress(voxels_done, voxels_total,
+                      seconds), called after every chunk
+        compression:  HDF5 compression filter of the output datasets
+        compression_opts: HDF5 compression settings, the gzip level
+        dtype:        dtype of the output volumes
+
+    'eps' and 'sigma' are (nfreq,) + index shape, chunked by frequency and
+    plane of the first index axis, so a single frequency reads contiguously.
+    'frequencies' and 'tissues' (names) are written alongside.
+    """
+    table = _colecole_table(tissues)
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+    epsr, sigma = dispersive_table(table, freqs)
+    columns = {'eps': epsr.astype(dtype), 'sigma': sigma.astype(dtype)}
+
+    shape = tuple(np.shape(index))
+    nvoxels = int(np.prod(shape))
+    plane = nvoxels // shape[0] if shape[0] > 0 else 0
+    nplanes = max(1, chunk_voxels // max(plane, 1))
+    chunks = (1, 1) + shape[1:] if len(shape) > 1 else True
+    start = time.perf_counter()
+    with h5py.File(output_file, 'w') as out:
+        out['frequencies'] = freqs
+        out['tissues'] = np.array(table.names, dtype=bytes)
+        for key in columns:
+            out.create_dataset(key, shape=(len(freqs),) + shape, dtype=dtype,
+                               chunks=chunks, compression=compression,
+                               compression_opts=compression_opts
+                               if compression == 'gzip' else None)
+        for i0 in range(0, shape[0], nplanes):
+            i1 = min(i0 + nplanes, shape[0])
+            slab = np.asarray(index[i0:i1])
+            for key, column in columns.items():
+                out[key][:, i0:i1] = _gather(column, slab)
+            if progress is not None:
+                progress(i1 * plane, nvoxels, time.perf_counter() - start)
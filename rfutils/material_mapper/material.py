@@ -68,3 +68,15 @@ class Material(object):
         """Update the material relative permittivity.
         """
         self._epsr = epsr
+
+    @property
+    def density(self):
+        """Return the material density.
+        """
+        return self._density
+
+    @density.setter
+    def density(self, density):
+        """Update the material density.
+        """
+        self._density = density
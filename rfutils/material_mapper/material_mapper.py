@@ -2,32 +2,225 @@
 """
 import os
 import re
+import time
+import zlib
+import zipfile
+import hashlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 import numpy as np
+import h5py
 import hdf5storage
 import numpy as np
 from numpy import linalg 
+from scipy.spatial import cKDTree
+from .material_volume import MaterialVolume, index_dtype
+
+# points per bulk KD-tree query; bounds the temporary feature matrix
+QUERY_CHUNK = 2**20
+
+# .vmat columns in file order; the second column is kept verbatim
+VMAT_COLUMNS = ['Material', 'Id', 'Eps', 'Mu', 'Kappa', 'Rho', 'K', 'HeatCap',
+                'BloodFlow', 'Metabolic']
+VMAT_SIDECAR = '.npz'
+
+# voxels per chunk of map_materials_h5
+DEFAULT_CHUNK_VOXELS = 2**22
+
+def _vmat_dtype(name_length=1, id_length=1):
+    """Return the structured dtype of a material table.
+    """
+    return np.dtype([('Material', 'U' + str(name_length)),
+                     ('Id', 'U' + str(id_length))] +
+                    [(col, np.float64) for col in VMAT_COLUMNS[2:]])
+
+def _file_digest(filename):
+    """Return the SHA-1 hex digest of a file.
+    """
+    with open(filename, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+def parse_vmat(filename):
+    """Parse a .vmat material file into a structured array with one typed
+    column per VMAT_COLUMNS entry.  Comment lines (# or //) and blank lines
+    are skipped; missing trailing values are NaN.
+    """
+    rows = []
+    with open(filename) as fh:
+        for line in fh.readlines():
+            if not (re.match('^(?:#.*|//.*)', line)) and line.strip():
+                rows.append(line.split())
+    nvalues = len(VMAT_COLUMNS) - 2
+    records = [tuple(row[:2]) + tuple(float(value) for value in row[2:2 + nvalues]) +
+               (np.nan,) * (nvalues - len(row[2:2 + nvalues])) for row in rows]
+    name_length = max([len(row[0]) for row in rows] + [1])
+    id_length = max([len(row[1]) for row in rows if len(row) > 1] + [1])
+    return np.array(records, dtype=_vmat_dtype(name_length, id_length))
+
+def _write_sidecar(sidecar, materials, stat, digest):
+    """Write the material cache of a file with stat and digest, into a
+    temporary file moved over sidecar so an interrupted write leaves no
+    partial cache.
+    """
+    tmp = sidecar + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, materials=materials, mtime_ns=stat.st_mtime_ns,
+                     size=stat.st_size, sha1=digest)
+        os.replace(tmp, sidecar)
+    except OSError as err:
+        print('Unable to write material cache ', sidecar, ': ', err)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def read_vmat(filename, cache=True):
+    """Read a .vmat material file.
+    With cache, the parsed table is kept in a filename + '.npz' sidecar next
+    to the file, keyed on the file's modification time and size, then on its
+    SHA-1 digest, so later reads skip the parsing.  A cached load is one
+    uncompressed read of the sidecar (npz members cannot be memory mapped).
+    An unreadable sidecar is ignored and rewritten.
+    Args:
+        filename: material file
+        cache:    use and update the sidecar
+
+    Returns:
+        structured array with the VMAT_COLUMNS fields, one row per material
+    """
+    if not cache:
+        return parse_vmat(filename)
+    sidecar = filename + VMAT_SIDECAR
+    stat = os.stat(filename)
+    digest = None
+    materials = None
+    if os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as data:
+                if (int(data['mtime_ns']) == stat.st_mtime_ns and
+                        int(data['size']) == stat.st_size):
+                    return data['materials']
+                digest = _file_digest(filename)
+                if str(data['sha1']) == digest:
+                    # same content, new mtime: refresh the key below
+                    materials = data['materials']
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as err:
+            print('Ignoring material cache ', sidecar, ': ', err)
+    if materials is None:
+        materials = parse_vmat(filename)
+    if digest is None:
+        digest = _file_digest(filename)
+    _write_sidecar(sidecar, materials, stat, digest)
+    return materials
+
+def nearest_index(table, values):
+    """Return the index of the table entry nearest to each of values.
+    Gives the result of np.argmin(np.sqrt(np.square(table - value))) for every
+    value, including the lowest index among equally near entries, from a
+    binary search of the sorted table: O(N log M) instead of O(N M).
+    Args:
+        table:  material property table (M)
+        values: property values, any shape
+
+    Returns:
+        integer index array, the shape of values
+    """
+    table = np.asarray(table, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    nan_entries = np.flatnonzero(np.isnan(table))
+    if nan_entries.size > 0:
+        # argmin stops at the first NaN distance
+        return np.full(np.shape(values), nan_entries[0], dtype=np.intp)
+    order = np.argsort(table, kind='stable')
+    sorted_table = table[order]
+    # equal entries form runs; argmin picks the lowest index of a run
+    run_start = np.flatnonzero(np.r_[True, sorted_table[1:] != sorted_table[:-1]])
+    run_values = sorted_table[run_start]
+    run_index = order[run_start]
+    last_run = len(run_values) - 1
+
+    # nearest entries below and at or above each value
+    pos = np.searchsorted(run_values, values)
+    below = np.clip(pos - 1, 0, last_run)
+    above = np.minimum(pos, last_run)
+    dist_below = np.sqrt(np.square(run_values[below] - values))
+    dist_above = np.sqrt(np.square(run_values[above] - values))
+    index = np.where(dist_above < dist_below, run_index[above], run_index[below])
+    tie = dist_above == dist_below
+    index[tie] = np.minimum(run_index[below], run_index[above])[tie]
+    # NaN or overflowing distances are equal for every entry
+    index[~np.isfinite(np.minimum(dist_below, dist_above))] = 0
+    return index
+
+def _map_chunk(table, values, dtype, columns=None, level=4):
+    """Map a chunk of values onto table in a worker process.
+    Without columns, return nearest_index(table, values) as dtype, keeping the
+    result sent back small.  With columns, a dict of key -> property table
+    (None for the index itself), return for every key the deflate-compressed
+    planes of the mapped chunk, ready to be written as HDF5 chunks.
+    """
+    map_ind = nearest_index(table, values).astype(dtype)
+    if columns is None:
+        return map_ind
+    return {key: [zlib.compress(plane.tobytes(), level)
+                  for plane in (map_ind if column is None else column[map_ind])]
+            for key, column in columns.items()}
+
+def _h5_table(materials):
+    """Return materials with the string columns as bytes for HDF5.
+    """
+    return materials.astype([(name, 'S' + str(materials.dtype[name].itemsize // 4))
+                             if materials.dtype[name].kind == 'U'
+                             else (name, materials.dtype[name])
+                             for name in materials.dtype.names])
 
 class MaterialMapper(object):
     """Material Mapper 
     material_dict = 2-dimensional materials
+    mat = structured material table, one typed field per value_index column;
+          mat[i][value_index[name]] and mat[name] both work
+    name_index = material name -> row of mat (first row of repeated names)
     """
     value_index = {'Material':0, 'Eps':2, 'Mu':3, 'Kappa':4, 'Rho':5, 'K':6, 
                     'HeatCap':7, 'BloodFlow':8, 'Metabolic':9}
-    def __init__(self, materials_file=None):
-        self.mat = []
-        self.kappa = []
+    def __init__(self, materials_file=None, cache=True):
+        self._set_materials(np.empty(0, dtype=_vmat_dtype()))
         if materials_file is not None:
-            self._read_materials(materials_file)
+            self._read_materials(materials_file, cache)
 
-    def _read_materials(self, material_file):
+    def _set_materials(self, materials):
+        """Use the structured material table materials.
+        """
+        self.mat = materials
+        self.kappa = materials['Kappa']
+        self.eps = materials['Eps']
+        self.rho = materials['Rho']
+        self.name_index = {}
+        for i, name in enumerate(materials['Material']):
+            self.name_index.setdefault(str(name), i)
+        self._trees = {}
+
+    def _read_materials(self, material_file, cache=True):
         """_read_materialsn
         Read materials and assembly dictionary.
         """
-        with open(material_file) as fh:
-            for line in fh.readlines():
-                if not (re.match('^(?:#.*|//.*)', line)):
-                    self.mat.append(line.split())
-        self.kappa = np.array([sublist[self.value_index['Kappa']] for sublist in self.mat], dtype=np.float64)
+        self._set_materials(read_vmat(material_file, cache))
+
+    def _property_tree(self, properties, scale=None):
+        """Return the KD-tree of the materials in the space of properties,
+        each divided by its scale, and the scale.  The scale defaults to the
+        standard deviation of each property over the materials.  Trees are
+        built once per property set and scale.
+        """
+        table = np.column_stack([self.mat[prop] for prop in properties])
+        if scale is None:
+            scale = np.std(table, axis=0)
+            scale[scale == 0.0] = 1.0
+        scale = np.broadcast_to(np.asarray(scale, dtype=np.float64),
+                                (len(properties),))
+        key = (tuple(properties), tuple(scale))
+        if key not in self._trees:
+            self._trees[key] = cKDTree(table / scale)
+        return self._trees[key], scale
             
     def print_materials(self):
         """Print the materials in database.
@@ -40,32 +233,181 @@ class MaterialMapper(object):
                   self.mat[i][self.value_index['Rho']])
         
 
-    def map_materials(self, exp_Kappa):
+    def map_materials(self, exp_Kappa, compact=False):
         """map_materials
-        Do the mapping between derived materials and material map.
+        Do the mapping between derived materials and material map: every
+        voxel of exp_Kappa takes the kappa, eps and rho of the material with
+        the nearest conductivity.  With compact, a MaterialVolume of material
+        indices is returned instead of the three property volumes.
         """
-        exp_kappa_shape = np.shape(exp_Kappa)
-        nkappa = np.size(exp_Kappa)
-        flat_kappa = np.reshape(exp_Kappa, nkappa)
-        mapped_eps = np.empty((nkappa), dtype=np.float64)
-        mapped_kappa = np.empty((nkappa), dtype=np.float64)
-        mapped_rho = np.empty((nkappa), dtype=np.float64)
-        print('flat_kappa: ', flat_kappa)
-        print(np.shape(flat_kappa))
-        for i,k in enumerate(flat_kappa):
-            if i%1000 == 0:
-                    print(i,'/',nkappa)
-            map_ind = np.argmin(np.sqrt(np.square(self.kappa - k)))
-            mapped_kappa[i] = self.mat[map_ind][self.value_index['Kappa']]
-            mapped_eps[i] = self.mat[map_ind][self.value_index['Eps']]
-            mapped_rho[i] = self.mat[map_ind][self.value_index['Rho']]
-
-        mapped_kappa = np.reshape(mapped_kappa, exp_kappa_shape)
-        mapped_eps = np.reshape(mapped_eps, exp_kappa_shape)
-        mapped_rho = np.reshape(mapped_rho, exp_kappa_shape)
-        
+        if compact:
+            flat_kappa = np.ravel(exp_Kappa)
+            map_ind = np.empty(np.size(flat_kappa), dtype=index_dtype(len(self.mat)))
+            for i0 in range(0, len(map_ind), QUERY_CHUNK):
+                i1 = min(i0 + QUERY_CHUNK, len(map_ind))
+                map_ind[i0:i1] = nearest_index(self.kappa, flat_kappa[i0:i1])
+            return MaterialVolume(np.reshape(map_ind, np.shape(exp_Kappa)), self.mat)
+        map_ind = nearest_index(self.kappa, exp_Kappa)
+        mapped_kappa = self.kappa[map_ind]
+        mapped_eps = self.eps[map_ind]
+        mapped_rho = self.rho[map_ind]
+
         return mapped_kappa, mapped_eps, mapped_rho
 
+    def map_materials_h5(self, exp_Kappa, output_file, compact=False, workers=1,
+                         chunk_voxels=DEFAULT_CHUNK_VOXELS, progress=None,
+                         compression='gzip', compression_opts=4):
+        """map_materials_h5
+        Map a conductivity volume chunk by chunk, as in map_materials, and
+        write the result to an HDF5 file.
+        Args:
+            exp_Kappa:    conductivity volume, an h5py dataset or any array-like
+                          that can be sliced along the first axis
+            output_file:  HDF5 file for the results
+            compact:      write the material index volume 'material_index'
+                          instead of 'kappa', 'eps' and 'rho'
+            workers:      processes mapping chunks; chunks are read and
+                          written by the calling process
+            chunk_voxels: approximate voxels per chunk
+            progress:     optional callable progress(voxels_done, voxels_total,
+                          seconds), called after every chunk
+            compression:  HDF5 compression filter of the output datasets
+            compression_opts: HDF5 compression settings, the gzip level
+
+        The material table is written to 'materials' in both cases.  Output
+        datasets are chunked by plane of the first axis; with workers and
+        gzip, the workers also compress the chunks, which the calling process
+        writes unchanged.
+        """
+        shape = tuple(np.shape(exp_Kappa))
+        nvoxels = int(np.prod(shape))
+        plane = nvoxels // shape[0] if shape[0] > 0 else 0
+        nplanes = max(1, chunk_voxels // max(plane, 1))
+        bounds = [(i0, min(i0 + nplanes, shape[0]))
+                  for i0 in range(0, shape[0], nplanes)]
+        chunks = (1,) + shape[1:] if len(shape) > 1 else True
+        index_type = index_dtype(len(self.mat))
+        if compact:
+            keys = {'material_index': None}
+            dtype = index_type
+        else:
+            keys = {'kappa': self.kappa, 'eps': self.eps, 'rho': self.rho}
+            dtype = np.float64
+
+        if workers is None:
+            workers = os.cpu_count()
+        executor = ProcessPoolExecutor(workers) if workers != 1 else _InlineExecutor()
+        # compressed chunks are built by the workers
+        direct = workers != 1 and compression == 'gzip' and len(shape) > 1
+        if compression == 'gzip' and compression_opts is None:
+            # h5py's default gzip level
+            compression_opts = 4
+        chunk_args = (keys, compression_opts) if direct else ()
+        start = time.perf_counter()
+        with h5py.File(output_file, 'w') as out, executor:
+            out['materials'] = _h5_table(self.mat)
+            for key in keys:
+                out.create_dataset(key, shape=shape, dtype=dtype, chunks=chunks,
+                                   compression=compression,
+                                   compression_opts=compression_opts
+                                   if compression == 'gzip' else None)
+            done = 0
+            pending = deque()
+            for n, (i0, i1) in enumerate(bounds):
+                pending.append((i0, i1, executor.submit(
+                    _map_chunk, self.kappa, exp_Kappa[i0:i1], index_type,
+                    *chunk_args)))
+                # keep a bounded number of chunks in flight
+                while pending and (len(pending) > 2 * workers or
+                                   n == len(bounds) - 1):
+                    j0, j1, future = pending.popleft()
+                    result = future.result()
+                    for key, column in keys.items():
+                        if direct:
+                            for k, chunk in enumerate(result[key]):
+                                out[key].id.write_direct_chunk(
+                                    (j0 + k,) + (0,) * (len(shape) - 1), chunk)
+                        else:
+                            out[key][j0:j1] = result if column is None else column[result]
+                    done += (j1 - j0) * plane
+                    if progress is not None:
+                        progress(done, nvoxels, time.perf_counter() - start)
+
+    def nearest_materials(self, volumes, scale=None, workers=1, dtype=np.intp):
+        """nearest_materials
+        Find the nearest material of every voxel over several properties.
+        Args:
+            volumes: dict of property volumes keyed by value_index name,
+                     e.g. {'Eps': eps_r, 'Kappa': sigma}, all the same shape
+            scale:   divisor of each property before distances are taken,
+                     defaults to the standard deviation over the materials
+            workers: processes for the KD-tree query, -1 for all CPUs
+            dtype:   integer type of the index volume
+
+        Returns:
+            material index volume, the shape of the property volumes; voxels
+            with a NaN or infinite property map to the first material
+        """
+        properties = list(volumes.keys())
+        shape = np.shape(volumes[properties[0]])
+        for prop in properties:
+            if np.shape(volumes[prop]) != shape:
+                raise ValueError("Volume " + prop + " has shape " +
+                                 str(np.shape(volumes[prop])) + ", expected " +
+                                 str(shape))
+        tree, scale = self._property_tree(properties, scale)
+        flat = [np.ravel(volumes[prop]) for prop in properties]
+        nvoxels = int(np.prod(shape))
+        map_ind = np.empty(nvoxels, dtype=dtype)
+        for i0 in range(0, nvoxels, QUERY_CHUNK):
+            i1 = min(i0 + QUERY_CHUNK, nvoxels)
+            points = np.column_stack([f[i0:i1] for f in flat]) / scale
+            finite = np.all(np.isfinite(points), axis=1)
+            block = map_ind[i0:i1]
+            # non-finite voxels are equally far from every material; as in
+            # nearest_index they take the first
+            block[~finite] = 0
+            _, block[finite] = tree.query(points[finite], workers=workers)
+        return np.reshape(map_ind, shape)
+
+    def map_properties(self, volumes, scale=None, workers=1, compact=False):
+        """map_properties
+        Map derived materials onto the material map by the nearest material
+        over several properties (see nearest_materials), e.g. permittivity and
+        conductivity to tell apart tissues of similar conductivity.  With
+        compact, a MaterialVolume is returned as in map_materials.
+        """
+        if compact:
+            return MaterialVolume(self.nearest_materials(
+                volumes, scale, workers, index_dtype(len(self.mat))), self.mat)
+        map_ind = self.nearest_materials(volumes, scale, workers)
+        return self.kappa[map_ind], self.eps[map_ind], self.rho[map_ind]
+
+    def map_dielectric(self, dielectric, scale=None, workers=1, compact=False):
+        """map_dielectric
+        Map the |E|^2-weighted permittivity and conductivity extracted by an
+        xmat.NormalDielectric onto the material map.
+        """
+        return self.map_properties({'Eps': dielectric.epsilon_r_weighted,
+                                    'Kappa': dielectric.sigma_eff_weighted},
+                                   scale, workers, compact)
+
+class _InlineExecutor(object):
+    """Executor running every call in the calling process.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        """Run fn(*args) now and return its finished future.
+        """
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
 if __name__ == "__main__":
     materials_file = os.path.join(r'D:', os.path.sep, r'Temp_CST',r'KU_Ten_32_FDA_21Jul2021_4_6',r'Duke_34y_V5_2mm_0_Duke_34y_V5_2mm.vmat')
     print(materials_file, '? ', os.path.exists(materials_file))
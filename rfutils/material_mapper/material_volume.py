@@ -0,0 +1,127 @@
+"""MaterialVolume: material index volume with a material property table.
+"""
+
+import numpy as np
+
+def index_dtype(nmaterials):
+    """Return the smallest unsigned integer dtype that indexes nmaterials.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if nmaterials <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    raise ValueError("Too many materials: " + str(nmaterials))
+
+class PropertyView(object):
+    """Property of a MaterialVolume, gathered from the material table on access.
+    Indexing gathers only the selected voxels; np.asarray gathers the volume.
+
+    Parameters
+    ----------
+    volume : MaterialVolume
+        Volume the property is read from.
+    name : str
+        Column of the material table.
+    """
+    def __init__(self, volume, name):
+        self._volume = volume
+        self._name = name
+
+    def __getitem__(self, key):
+        return self._volume.materials[self._name][self._volume.index[key]]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[...]
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __len__(self):
+        return len(self._volume.index)
+
+    @property
+    def name(self):
+        """Return the name of the property.
+        """
+        return self._name
+
+    @property
+    def shape(self):
+        """Return the shape of the property volume.
+        """
+        return self._volume.shape
+
+    @property
+    def ndim(self):
+        """Return the number of dimensions of the property volume.
+        """
+        return len(self._volume.shape)
+
+    @property
+    def dtype(self):
+        """Return the dtype of the property.
+        """
+        return self._volume.materials.dtype[self._name]
+
+class MaterialVolume(object):
+    """Material index volume: the material of every voxel as a row of a
+    material table, stored in the smallest unsigned integer type, 1 byte per
+    voxel up to 256 materials, instead of one float64 volume per property.
+
+    Parameters
+    ----------
+    index : ndarray
+        Row of materials for every voxel.
+    materials : ndarray
+        Structured material table, e.g. MaterialMapper.mat.
+    """
+    def __init__(self, index, materials):
+        self._materials = materials
+        self._index = np.asarray(index).astype(index_dtype(len(materials)),
+                                               copy=False)
+
+    def property_view(self, name):
+        """Return the lazy view of property name, a column of materials.
+        """
+        if name not in self._materials.dtype.names:
+            raise KeyError("Unknown material property: " + str(name))
+        return PropertyView(self, name)
+
+    @property
+    def index(self):
+        """Return the material index volume.
+        """
+        return self._index
+
+    @property
+    def materials(self):
+        """Return the material table.
+        """
+        return self._materials
+
+    @property
+    def shape(self):
+        """Return the shape of the volume.
+        """
+        return np.shape(self._index)
+
+    @property
+    def nbytes(self):
+        """Return the memory held by the index volume and the table.
+        """
+        return self._index.nbytes + self._materials.nbytes
+
+    @property
+    def kappa(self):
+        """Return the lazy conductivity volume.
+        """
+        return self.property_view('Kappa')
+
+    @property
+    def eps(self):
+        """Return the lazy permittivity volume.
+        """
+        return self.property_view('Eps')
+
+    @property
+    def rho(self):
+        """Return the lazy density volume.
+        """
+        return self.property_view('Rho')
@@ -7,15 +7,197 @@ import sys
 
 import csv
 import re
+from collections import OrderedDict
+import numpy as np
+from scipy.constants import epsilon_0
+from ..colecole.colecole_table import ColeColeTable
+from .material import Material
+from .material_mapper import read_vmat
 
 class MaterialsDB(object):
     """Construct a materials data base from materials.
+    Materials are held in columns (relative permittivity, conductivity,
+    density) with a name -> id index.  Dispersive materials carry a ColeCole
+    model that replaces their fixed permittivity and conductivity; the
+    properties of all materials at a frequency are evaluated in one call
+    through a ColeColeTable and the most recent frequencies are cached.
+    Models are read when the first properties after add_material are
+    requested.
+
+    Parameters
+    ----------
+    cache_size : int
+        Number of frequencies whose properties are kept.
     """
-    def __init__(self):
-        self._material_dict = []
+    def __init__(self, cache_size=32):
+        self._material_dict = {}
         self._material_count = 0
+        self._names = []
+        self._epsr = []
+        self._sigma = []
+        self._density = []
+        self._colecole = {}
+        self._columns = None
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self):
+        self._check_loaded()
+        return self._material_count
+
+    def __contains__(self, name):
+        self._check_loaded()
+        return name in self._material_dict
+
+    def _check_loaded(self):
+        """Load materials that are read on first use.
+        """
+        pass
+
+    def add_material(self, material, colecole=None):
+        """Add a material to the database and return its id.
+        Args:
+            material: Material; its epsr and sigma are used unless colecole
+                      is given
+            colecole: optional ColeCole model of a dispersive material
+        """
+        if material.name in self._material_dict:
+            raise KeyError("Material already in database: " + material.name)
+        material_id = self._material_count
+        self._material_dict[material.name] = material_id
+        self._names.append(material.name)
+        self._epsr.append(material.epsr)
+        self._sigma.append(material.sigma)
+        self._density.append(material.density)
+        if colecole is not None:
+            self._colecole[material_id] = colecole
+        self._material_count += 1
+        self._columns = None
+        self._cache.clear()
+        return material_id
+
+    def material_id(self, name):
+        """Return the id of material name.
+        """
+        self._check_loaded()
+        return self._material_dict[name]
+
+    def material(self, name, frequency=300.0e6):
+        """Return material name at frequency (Hz) as a Material.
+        """
+        self._check_loaded()
+        material_id = self._material_dict[name]
+        epsr, sigma = self.properties(frequency)
+        return Material(frequency, name, epsr[material_id], sigma[material_id],
+                        self.density[material_id])
+
+    def _update_columns(self):
+        """Build the property arrays from the materials added so far.
+        """
+        self._columns = {'epsr': np.array(self._epsr, dtype=np.float64),
+                         'sigma': np.array(self._sigma, dtype=np.float64),
+                         'density': np.array(self._density, dtype=np.float64)}
+        for column in self._columns.values():
+            column.flags.writeable = False
+        # parameters of the dispersive materials, read when columns are built
+        self._dispersive = np.array(sorted(self._colecole), dtype=np.intp)
+        self._table = ColeColeTable.from_colecole(
+            [self._colecole[i] for i in self._dispersive])
+
+    def _evaluate(self, frequency):
+        """Return the relative permittivity and conductivity of all materials
+        at frequency (Hz).
+        """
+        epsr = self._columns['epsr'].copy()
+        sigma = self._columns['sigma'].copy()
+        omega = 2.0 * np.pi * frequency
+        if len(self._dispersive) > 0:
+            epsilon = self._table.epsilon(frequency)[:, 0]
+            # epsilon = epsr - j sigma/(omega eps0)
+            epsr[self._dispersive] = np.real(epsilon)
+            sigma[self._dispersive] = -np.imag(epsilon) * omega * epsilon_0
+        epsr.flags.writeable = False
+        sigma.flags.writeable = False
+        return epsr, sigma
+
+    def properties(self, frequency):
+        """Return the relative permittivity and conductivity (S/m) of all
+        materials at frequency (Hz), as read-only arrays indexed by id.
+        """
+        self._check_loaded()
+        if self._columns is None:
+            self._update_columns()
+        key = float(frequency)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        result = self._evaluate(key)
+        self._cache[key] = result
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    @property
+    def names(self):
+        """Return the material names in id order.
+        """
+        self._check_loaded()
+        return list(self._names)
+
+    @property
+    def density(self):
+        """Return the density of all materials.
+        """
+        self._check_loaded()
+        if self._columns is None:
+            self._update_columns()
+        return self._columns['density']
+
+    @property
+    def cache_size(self):
+        """Return the number of cached frequencies.
+        """
+        return self._cache_size
+
+    @cache_size.setter
+    def cache_size(self, cache_size):
+        """Update the number of cached frequencies.
+        """
+        self._cache_size = cache_size
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+class MaterialsDBVirtualFamily(MaterialsDB):
+    """Materials data base of a CST virtual family material file (.vmat).
+    The file is read on first use, or by _load_materials.
+
+    Parameters
+    ----------
+    vmat_filename : str
+        Material file.
+    cache_size : int
+        Number of frequencies whose properties are kept.
+    """
+    def __init__(self, vmat_filename, cache_size=32):
+        super().__init__(cache_size)
+        self._vmat_filename = vmat_filename
+        self._loaded = False
+
+    def _load_materials(self):
+        """Add the materials of the material file: Eps, Kappa and Rho.
+        Repeated names keep their first row, as MaterialMapper.name_index.
+        """
+        if self._loaded:
+            return
+        for row in read_vmat(self._vmat_filename):
+            if str(row['Material']) in self._material_dict:
+                continue
+            self.add_material(Material(name=str(row['Material']), epsr=row['Eps'],
+                                       sigma=row['Kappa'], density=row['Rho']))
+        self._loaded = True
 
-    def add_material(self, material):
-        """Add a material to the database.
+    def _check_loaded(self):
+        """Read the material file on first use.
         """
-        
\ No newline at end of file
+        if not self._loaded:
+            self._load_materials()
@@ -0,0 +1,17 @@
+"""precision: dtypes of the floating point precisions shared by the field and
+tissue model packages.
+"""
+
+import numpy as np
+
+# (complex, real) dtypes of the supported precisions
+PRECISIONS = {'double': (np.complex128, np.float64),
+              'single': (np.complex64, np.float32)}
+
+def precision_dtypes(precision):
+    """Return the (complex, real) dtypes of precision, 'double' or 'single'.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision: " + str(precision) +
+                         ", expected one of " + str(list(PRECISIONS)))
+    return PRECISIONS[precision]
@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import hdf5storage
 from tkinter import Tk
 from tkinter.filedialog import askdirectory
+from rfutils.vopgen.vopgen_field import VopgenField
 
 
 def plot_rotating_field(rotating_fields, zval, sarmask=None):
@@ -97,33 +98,33 @@ if __name__ == '__main__':
     #
     print("Reading data...")
     b1map_array_file = os.path.join(vopgen_dir, 'bfMapArrayN.mat')
-    bfMapArrayN = hdf5storage.loadmat(b1map_array_file)
-    bf_shape = np.shape(bfMapArrayN['bfMapArrayN'])
-    nchannels = bf_shape[-1]
+    # slices are read from the file as they are plotted
+    with VopgenField(b1map_array_file) as bfMapArrayN:
+        nchannels = bfMapArrayN.nchannels
 
-    #
-    # load the sarmask
-    #
-    sarmask_file = os.path.join(vopgen_dir, 'sarmask_aligned.mat')
-    sarmask_new = hdf5storage.loadmat(sarmask_file)['sarmask_new']
+        #
+        # load the sarmask
+        #
+        sarmask_file = os.path.join(vopgen_dir, 'sarmask_aligned.mat')
+        sarmask_new = hdf5storage.loadmat(sarmask_file)['sarmask_new']
 
-    print("Plotting results...")
-    fig1, fig1_axs = plt.subplots(1, round(nchannels/2), constrained_layout=True)
-    fig2, fig2_axs = plt.subplots(1, round(nchannels/2), constrained_layout=True)
-    channels_top = list(range(1, nchannels, 2))
-    channels_bottom = list(range(2, nchannels + 1, 2))
-    for i, ch in enumerate(channels_top):
-        im1 = plot_fields_subset(fig1_axs[i], bfMapArrayN, ch, zval=0.188,
-                           sarmask=sarmask_new, vmax=1e-6)
-    fig1.subplots_adjust(right=0.8)
-    cbar_ax = fig1.add_axes([0.85, 0.15, 0.02, 0.7])
-    fig1.colorbar(im1, cax=cbar_ax)
+        print("Plotting results...")
+        fig1, fig1_axs = plt.subplots(1, round(nchannels/2), constrained_layout=True)
+        fig2, fig2_axs = plt.subplots(1, round(nchannels/2), constrained_layout=True)
+        channels_top = list(range(1, nchannels, 2))
+        channels_bottom = list(range(2, nchannels + 1, 2))
+        for i, ch in enumerate(channels_top):
+            im1 = plot_fields_subset(fig1_axs[i], bfMapArrayN, ch, zval=0.188,
+                               sarmask=sarmask_new, vmax=1e-6)
+        fig1.subplots_adjust(right=0.8)
+        cbar_ax = fig1.add_axes([0.85, 0.15, 0.02, 0.7])
+        fig1.colorbar(im1, cax=cbar_ax)
 
-    for i, ch in enumerate(channels_bottom):
-        im2 = plot_fields_subset(fig2_axs[i], bfMapArrayN, ch, zval=0.298,
-                           sarmask=sarmask_new, vmax=1e-6)
-    fig2.subplots_adjust(right=0.8)
-    cbar_ax = fig2.add_axes([0.85, 0.15, 0.02, 0.7])
-    fig2.colorbar(im2, cax=cbar_ax)
+        for i, ch in enumerate(channels_bottom):
+            im2 = plot_fields_subset(fig2_axs[i], bfMapArrayN, ch, zval=0.298,
+                               sarmask=sarmask_new, vmax=1e-6)
+        fig2.subplots_adjust(right=0.8)
+        cbar_ax = fig2.add_axes([0.85, 0.15, 0.02, 0.7])
+        fig2.colorbar(im2, cax=cbar_ax)
 
     plt.show()
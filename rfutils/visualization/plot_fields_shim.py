@@ -19,12 +19,14 @@ except:
     print("This module requires HDF5 support.  Ensure h5py and hdf5storage are installed.")
 from tkinter import Tk
 from tkinter.filedialog import askdirectory
+from rfutils.vopgen.vopgen_field import VopgenField
 
 def apply_shim(field, magnitudes, phases, rot_dir=0):
     """apply_shim 
     Apply the magnitude & phase shim to the vopgen-formatted field array
     Args:
-        field: ndarray of field values
+        field: ndarray of field values or VopgenField, read one channel
+               component at a time
         magnitudes: (1,Nchannels) shim magnitudes 
         phases: (1,Nchannels) shim phases (radians)
     Returns:
@@ -34,11 +36,9 @@ def apply_shim(field, magnitudes, phases, rot_dir=0):
     if len(magnitudes) != field_shape[-1] or len(phases) != field_shape[-1]:
         sys.exit("Number of channels in fields does not equal number of magnitudes/phases: "
             + str(len(magnitudes)) + "/" + str(len(phases)) + ", expected: " + str(field_shape[-1]))
-    fields_component = field[:,:,:,rot_dir,:]
-
-    fields_shimmed = np.zeros(np.shape(fields_component)[0:3], dtype=complex)
+    fields_shimmed = np.zeros(field_shape[0:3], dtype=complex)
     for ch in range(field_shape[-1]):
-        fields_shimmed += np.multiply(magnitudes[ch], np.multiply(fields_component[:,:,:,ch], np.exp(1.0j*phases[ch]), dtype=np.complex128))
+        fields_shimmed += np.multiply(magnitudes[ch], np.multiply(field[:,:,:,rot_dir,ch], np.exp(1.0j*phases[ch]), dtype=np.complex128))
     
     return fields_shimmed
 
@@ -203,9 +203,9 @@ if __name__ == "__main__":
     print('mags: ', mags)
     print('phases: ', phases*180/np.pi)
 
-    field_dict = hdf5storage.loadmat(os.path.join(field_export_dir, field_name))
-    
-    shimmed_fields = apply_shim(field_dict['bfMapArrayN'], mags, phases)
+    with VopgenField(os.path.join(field_export_dir, field_name)) as field_dict:
+        shimmed_fields = apply_shim(field_dict['bfMapArrayN'], mags, phases)
+        xdim, ydim, zdim = field_dict['XDim'], field_dict['YDim'], field_dict['ZDim']
 
     #zpos = 0.0
     #zpos = 0.188       # center top ring
@@ -213,13 +213,12 @@ if __name__ == "__main__":
     zpos = 0.259       # center of flat
     #zpos = 0.298       # center of lower ring
     figtitle = 'phase_' + str(phase_offset).replace(".","_")
-    fig, axs = plot_fields_shimmed(np.abs(shimmed_fields), field_dict['XDim'],
-                            field_dict['YDim'], field_dict['ZDim'], 
+    fig, axs = plot_fields_shimmed(np.abs(shimmed_fields), xdim, ydim, zdim,
                             (0.0, 0.0, zpos), mask=mask_dict['sarmask_new'],
                             field_max=3e-6, figtitle=figtitle)
 
-    zind = np.argmin(np.abs(field_dict['ZDim']-zpos))
-    #ax = plot_bmag_axis(field_dict['XDim'], field_dict['YDim'], 
+    zind = np.argmin(np.abs(zdim-zpos))
+    #ax = plot_bmag_axis(xdim, ydim, 
     #                    np.abs(shimmed_fields[:,:,zind]), pos=0, axis='y')
     fig_save_path = os.path.join(field_export_dir, 'images')
     if not (os.path.exists(fig_save_path)):
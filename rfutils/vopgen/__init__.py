@@ -1 +1,5 @@
 from .scale_fields import scale_fields
+from .scale_fields import scale_fields_h5
+from .reorder_vopgen_channels import reorder_vopgen_channels
+from .vopgen_field import VopgenField
+from .vopgen_pipeline import VopgenPipeline
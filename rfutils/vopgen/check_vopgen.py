@@ -3,8 +3,8 @@
 import os
 import math
 import numpy as np
-import hdf5storage
 import matplotlib.pyplot as plt
+from rfutils.vopgen.vopgen_field import VopgenField
 
 def plot_sar_mask(sar_mask_file):
     """
@@ -17,25 +17,25 @@ def plot_bffields(bfield_file):
     if not os.path.exists(bfield_file):
         print("Could not find bfield file: ", bfield_file)
         raise FileNotFoundError
-    bfp  = hdf5storage.loadmat(bfield_file)
-    bfMapArrayN = bfp['bfMapArrayN']
-    if type(bfMapArrayN[0,0,0,0,0]) != type(np.array([1.0j])[0]):
-        print("Wrong type.  Found type: ", type(bfMapArrayN[0,0,0,0,0]))
-        raise TypeError
-    
-    xdim = bfp['XDim']
-    ydim = bfp['YDim']
-    zdim = bfp['ZDim']
-    xx, yy = np.meshgrid(xdim, ydim)
+    with VopgenField(bfield_file) as bfp:
+        if not np.issubdtype(bfp.dtype, np.complexfloating):
+            print("Wrong type.  Found type: ", bfp.dtype)
+            raise TypeError
+
+        xdim = bfp.XDim
+        ydim = bfp.YDim
+        zdim = bfp.ZDim
+        xx, yy = np.meshgrid(xdim, ydim)
 
-    nchannels = np.shape(bfMapArrayN)[4]
+        nchannels = bfp.nchannels
 
-    #uniform distribution
-    phases_b1p_cp = np.array([2.0*i*np.pi/nchannels for i in range(nchannels)])
-    b1p_cp = np.zeros((len(xdim), len(ydim), len(zdim)), dtype=np.complex)
+        #uniform distribution
+        phases_b1p_cp = np.array([2.0*i*np.pi/nchannels for i in range(nchannels)])
+        b1p_cp = np.zeros((len(xdim), len(ydim), len(zdim)), dtype=complex)
 
-    for channel in range(nchannels):
-        b1p_cp = b1p_cp + np.exp(1.0j*phases_b1p_cp[channel]) * bfMapArrayN[:,:,:,1,channel]
+        # read one channel component at a time
+        for channel in range(nchannels):
+            b1p_cp = b1p_cp + np.exp(1.0j*phases_b1p_cp[channel]) * bfp[:,:,:,1,channel]
 
     # make a plot of the results
     nxp, nyp = 3, 3
@@ -18,49 +18,79 @@ ex:
 import os
 import sys
 import csv
-import hdf5storage
+import h5py
 import numpy as np
+from rfutils.vopgen.vopgen_h5 import (DEFAULT_BLOCK_BYTES, find_field_key, block_slices,
+                                      copy_userblock, create_like, create_dataset_like)
 
-def reorder_vopgen_channels(remap_file, field_file_old, field_file_new):
-    """Reorder the field channels according to provided mapping file.
+def read_channel_map(remap_file, nchannels=None):
+    """Read and validate a channel map file.
+    Args:
+        remap_file: channel map file, 1-based 'original remapped' pairs
+        nchannels:  expected number of channels, default the number of pairs
+
+    Returns:
+        (nchannels, 2) array of 0-based (original, remapped) channels.
+    The map must be a bijection of the channels: every channel appears once as
+    original and once as remapped.
     """
-    print('Reordering channels...')
-    # read remap file and ignore comments
     with open(remap_file, 'r') as csv_file:
-        rdr = csv.reader(filter(lambda row: row[0]!='#', csv_file), delimiter=' ', quotechar='|')
-        coil_map = list(rdr)
-
-    # read the original field 
-    print("Reading field maps...")
-    fields_old_dict = hdf5storage.loadmat(field_file_old)
-    
-    field_keys = fields_old_dict.keys()
-    if 'efMapArrayN' in field_keys:
-        field_key = 'efMapArrayN'
-        print('Found efMapArrayN.  Converting E-fields...')
-    else:
-        field_key = 'bfMapArrayN'
-        print('Found bfMapArrayN.  Converting B-fields...')
+        rows = [row for row in csv.reader(filter(lambda line: line.strip() and
+                                                 line.lstrip()[0] != '#', csv_file),
+                                          delimiter=' ', quotechar='|',
+                                          skipinitialspace=True)]
+    try:
+        coil_map = np.array([[int(col) for col in row if col] for row in rows],
+                            dtype=np.intp).reshape(len(rows), 2) - 1
+    except ValueError:
+        raise ValueError("Expected pairs of channel numbers in " + str(remap_file))
+    if nchannels is None:
+        nchannels = len(coil_map)
+    if len(coil_map) != nchannels:
+        raise ValueError("Expected " + str(nchannels) + " channel pairs, found " +
+                         str(len(coil_map)))
+    for column, name in zip(coil_map.T, ['original', 'remapped']):
+        if np.any(column < 0) or np.any(column >= nchannels):
+            raise ValueError("Channel out of range [1, " + str(nchannels) + "] in " +
+                             name + " channels: " + str(column + 1))
+        if len(np.unique(column)) != nchannels:
+            raise ValueError("Repeated " + name + " channels: " + str(column + 1))
+    return coil_map
 
-    fmap_arrayn_old = fields_old_dict[field_key]
-    nchannels =  np.shape(fmap_arrayn_old)[4]
-    
-    # create new remap fields
-    print("Remapping and saving fields...")
-    fmap_arrayn_new = np.zeros(np.shape(fmap_arrayn_old), dtype=np.complex)
-    for channel in range(nchannels):
-        print(coil_map[channel][0], ' -> ', coil_map[channel][1])
-        fmap_arrayn_new[:,:,:,:,int(coil_map[channel][1])-1] = fmap_arrayn_old[:,:,:,:,int(coil_map[channel][0])-1 ]
+def reorder_vopgen_channels(remap_file, field_file_old, field_file_new,
+                            block_bytes=DEFAULT_BLOCK_BYTES):
+    """Reorder the field channels according to provided mapping file.
+    The channel map is validated before any data is read; then every channel
+    is copied from the old file to its remapped channel in the new file, in
+    blocks of at most block_bytes, so memory stays below a single channel.
+    """
+    print('Reordering channels...')
+    if os.path.abspath(field_file_old) == os.path.abspath(field_file_new):
+        raise ValueError("Reordered fields must be written to a new file: " +
+                         str(field_file_new))
+    with h5py.File(field_file_old, 'r') as fields_old:
+        field_key = find_field_key(fields_old.keys())
+        if field_key == 'efMapArrayN':
+            print('Found efMapArrayN.  Converting E-fields...')
+        else:
+            print('Found bfMapArrayN.  Converting B-fields...')
+        fmap_arrayn_old = fields_old[field_key]
+        # h5py sees MATLAB's (X, Y, Z, 3, N) as (N, 3, Z, Y, X)
+        nchannels = fmap_arrayn_old.shape[0]
+        coil_map = read_channel_map(remap_file, nchannels)
+        userblock_size = fields_old.userblock_size
 
-    fields_new_dict = dict()
-    fields_new_dict['XDim'] = fields_old_dict['XDim']
-    fields_new_dict['YDim'] = fields_old_dict['YDim']
-    fields_new_dict['ZDim'] = fields_old_dict['ZDim']
-    fields_new_dict[field_key] = fmap_arrayn_new
-    
-    # write remapped fields
-    print("Writing remapped_fields")
-    hdf5storage.savemat(field_file_new, fields_new_dict, oned_as='column')
+        print("Remapping and saving fields...")
+        with h5py.File(field_file_new, 'w', userblock_size=userblock_size) as fields_new:
+            create_like(fields_new, fields_old, skip=[field_key])
+            fmap_arrayn_new = create_dataset_like(fields_new, field_key, fmap_arrayn_old)
+            channel_shape = fmap_arrayn_old.shape[1:]
+            for original, remapped in coil_map:
+                print(original + 1, ' -> ', remapped + 1)
+                for block in block_slices(channel_shape, fmap_arrayn_old.dtype.itemsize,
+                                          block_bytes):
+                    fmap_arrayn_new[(remapped,) + block] = fmap_arrayn_old[(original,) + block]
+    copy_userblock(field_file_old, field_file_new, userblock_size)
 
 if "__main__" == __name__:
     if 'win32' == sys.platform:
@@ -1,49 +1,108 @@
 #!/usr/bin/env python
 """
 Scale the vopgen format fields by a constant.
+scale_fields scales fields held in memory; scale_fields_h5 streams a MATLAB
+v7.3 field file block by block, in place or into a new file, so memory use is
+bounded by one block whatever the size of the file.
 """
 import os
+import time
 import numpy as np
+import h5py
 import hdf5storage
+from rfutils.vopgen.vopgen_h5 import (FIELD_KEYS, DEFAULT_BLOCK_BYTES, find_field_key,
+                                      as_complex, block_slices, copy_userblock,
+                                      create_like, create_dataset_like)
 
 
-def scale_fields(scale: np.ndarray, vopfield3d: np.ndarray) -> dict:
+def _channel_scale(scale, nchannels):
+    """Return the per-channel scales as a complex array of nchannels.
+    """
+    scale = np.ravel(np.asarray(scale, dtype=np.complex128))
+    if np.size(scale) != nchannels:
+        raise ValueError("Expected " + str(nchannels) + " channel scales, found " +
+                         str(np.size(scale)))
+    return scale
+
+
+def scale_fields(scale: np.ndarray, vopfield3d: dict) -> dict:
     """
     Args:
     scale:      ndarray     1XN array of scales per channel
-    vopfield3d: dict        Dict of Vopgen 3D format field data
+    vopfield3d: dict        Dict of Vopgen 3D format field data, fields
+                            (X, Y, Z, 3, N) as read by hdf5storage.loadmat
 
     Returns:
-    dict                    Result dict of scaled fields.
+    dict                    Result dict of scaled fields; other entries, e.g.
+                            XDim, YDim and ZDim, are passed through.
     """
     print("Scaling vopgen fields...")
-    nchannels = np.shape(vopfield3d)[-1]
-    new_vopfield3d = np.zeros(np.size(vopfield3d))
-    
-    for ch in range(nchannels):
-        new_vopfield3d[...,ch] = vopfield3d[...,ch]*scale(ch)
-
     sf = {}
-    # pass through dimensions
-    sf["XDim"] = vopfield3d["XDim"]
-    sf["YDim"] = vopfield3d["YDim"]
-    sf["ZDim"] = vopfield3d["ZDim"]
-
-    if "efMapArrayN" in vopfield3d.keys():
-        field_key = "efMapArrayN"
-    elif "bfMapArrayN" in vopfield3d.keys():
-        field_key = "bfMapArrayN"
-    else:
-        raise KeyError("Valid key not found.")
-    sf[field_key] = new_vopfield3d
-    
-    return sf 
+    for key, value in vopfield3d.items():
+        if key in FIELD_KEYS:
+            field = np.asarray(value)
+            sf[key] = field * _channel_scale(scale, np.shape(field)[-1])
+        else:
+            sf[key] = value
+    return sf
+
+
+def scale_fields_h5(scale: np.ndarray, field_file: str, output_file: str = None,
+                    block_bytes: int = DEFAULT_BLOCK_BYTES, progress=None) -> None:
+    """
+    Scale the channels of a vopgen field file block by block.
+    Args:
+    scale:       ndarray    1XN array of complex scales per channel
+    field_file:  str        MATLAB v7.3 file with efMapArrayN or bfMapArrayN
+    output_file: str        File for the scaled fields, a copy of field_file
+                            with the field scaled; None scales in place
+    block_bytes: int        Bytes of field data read at once
+    progress:    callable   Optional progress(values_done, values_total,
+                            seconds), called after every block
+    """
+    in_place = output_file is None or \
+        os.path.abspath(output_file) == os.path.abspath(field_file)
+    with h5py.File(field_file, 'r+' if in_place else 'r') as src:
+        userblock_size = src.userblock_size
+        field_key = find_field_key(src.keys())
+        field = src[field_key]
+        # h5py sees MATLAB's (X, Y, Z, 3, N) as (N, 3, Z, Y, X)
+        channel_scale = _channel_scale(scale, field.shape[0])
+        if in_place:
+            _scale_blocks(field, field, channel_scale, block_bytes, progress)
+        else:
+            with h5py.File(output_file, 'w', userblock_size=userblock_size) as dst:
+                create_like(dst, src, skip=[field_key])
+                scaled = create_dataset_like(dst, field_key, field)
+                _scale_blocks(field, scaled, channel_scale, block_bytes, progress)
+    if not in_place:
+        copy_userblock(field_file, output_file, userblock_size)
+
+
+def _scale_blocks(source, target, channel_scale, block_bytes, progress=None):
+    """Write source scaled along its first (channel) axis to target.
+    """
+    total = int(np.prod(source.shape))
+    done = 0
+    start = time.perf_counter()
+    expand = (slice(None),) + (np.newaxis,) * (len(source.shape) - 1)
+    for block in block_slices(source.shape, source.dtype.itemsize, block_bytes):
+        values = source[block]
+        # a block is a single channel or a range of whole channels
+        if isinstance(block[0], slice):
+            as_complex(values)[...] *= channel_scale[block[0]][expand]
+        else:
+            as_complex(values)[...] *= channel_scale[block[0]]
+        target[block] = values
+        done += values.size
+        if progress is not None:
+            progress(done, total, time.perf_counter() - start)
 
 
 def save_fields(vopfile_name: str, vopfield_dict: dict) -> None:
     """ Save fields to matlab file.
     Args:
-    vopfile_name: str 
+    vopfile_name: str
 
     """
     hdf5storage.savemat(vopfile_name, vopfield_dict, oned_as='column')
@@ -54,7 +113,7 @@ if __name__  == "__main__":
                               "Self_Decoupled_16tx_64Rx_Duke_Fields_CST2020_3_1",
                               "Export")
     ef_dir = os.path.join(export_dir, "efMapArrayN_no_scale.mat")
-    ef_dict = hdf5storage.loadmat(ef_dir)
-    scale = (1.0/np.sqrt(50.))*np.ones(np.shape(ef_dict["efMapArrayN"][-1]))
-    scaled_field_dict = scale_fields(scale, ef_dict)
-    save_fields("efMapArrayN.mat", scaled_field_dict)
\ No newline at end of file
+    with h5py.File(ef_dir, 'r') as ef_file:
+        nchannels = ef_file[find_field_key(ef_file.keys())].shape[0]
+    scale = (1.0/np.sqrt(50.))*np.ones(nchannels)
+    scale_fields_h5(scale, ef_dir, "efMapArrayN.mat")
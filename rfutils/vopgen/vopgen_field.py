@@ -0,0 +1,213 @@
+"""VopgenField: lazy container for vopgen format field files.
+"""
+import numpy as np
+import h5py
+from .vopgen_h5 import DIM_KEYS, find_field_key, complex_dtype, as_complex
+
+class VopgenField(object):
+    """Vopgen field file (efMapArrayN.mat or bfMapArrayN.mat) opened once with
+    h5py.  Dimensions, field kind, channel count and dtype are available
+    without reading the field, and indexing reads only the selected
+    hyperslab.
+    Indexing follows the MATLAB/hdf5storage.loadmat axis order
+    (X, Y, Z, component, channel).  h5py stores the axes reversed, so the
+    selection is reversed, read, and returned as a transposed view of the
+    hyperslab (Fortran ordered) instead of a transposed copy.  String keys
+    behave like the loadmat dict: field['XDim'] returns the x positions and
+    field['bfMapArrayN'] the field itself.
+
+    Parameters
+    ----------
+    field_file : str
+        MATLAB v7.3 field file.
+    mode : str
+        h5py file mode, 'r' or 'r+'.
+    """
+    def __init__(self, field_file, mode='r'):
+        self._field_file = field_file
+        self._file = h5py.File(field_file, mode)
+        self._kind = find_field_key(self._file.keys())
+        self._dataset = self._file[self._kind]
+        self._dims = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Close the field file.
+        """
+        self._file.close()
+
+    def keys(self):
+        """Return the dimension keys and the field key.
+        """
+        return [key for key in DIM_KEYS if key in self._file] + [self._kind]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key == self._kind:
+                return self
+            if key in DIM_KEYS:
+                return self.dim(key)
+            raise KeyError("Unknown key: " + key + ", expected one of " + str(self.keys()))
+        return self._read(key)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[...]
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def _normalize(self, key):
+        """Return the h5py selection (h5py axis order) and the remaining numpy
+        index (MATLAB axis order) of a key.
+        """
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = [k is Ellipsis for k in key].index(True)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError("Too many indices: " + str(len(key)) + ", field has " +
+                             str(self.ndim) + " dimensions")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        selection, local = [], []
+        for k, n in zip(key, self.shape):
+            if isinstance(k, (int, np.integer)):
+                if not -n <= k < n:
+                    raise IndexError("Index " + str(k) + " out of range for axis of " +
+                                     "length " + str(n))
+                selection.append(int(k) % n)
+            elif isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                if step > 0:
+                    selection.append(slice(start, max(start, stop), step))
+                    local.append(slice(None))
+                else:
+                    # read the covering range forwards, reverse in memory
+                    index = np.arange(start, stop, step)
+                    first = int(index.min()) if len(index) else 0
+                    last = int(index.max()) + 1 if len(index) else 0
+                    selection.append(slice(first, last))
+                    local.append(index - first)
+            else:
+                index = np.asarray(k)
+                if index.dtype == bool:
+                    index = np.flatnonzero(index)
+                index = np.where(index < 0, index + n, index)
+                if np.any(index < 0) or np.any(index >= n):
+                    raise IndexError("Index out of range for axis of length " + str(n))
+                first = int(index.min()) if index.size else 0
+                last = int(index.max()) + 1 if index.size else 0
+                selection.append(slice(first, last))
+                local.append(index - first)
+        return tuple(reversed(selection)), tuple(local)
+
+    def _read(self, key):
+        """Read the hyperslab of key, in MATLAB axis order.
+        List indices select along each axis independently, as in h5py.
+        """
+        selection, local = self._normalize(key)
+        values = as_complex(np.asarray(self._dataset[selection])).transpose()
+        # apply list and reversed selections one axis at a time
+        for axis, index in enumerate(local):
+            if not isinstance(index, slice):
+                values = np.take(values, index, axis=axis)
+        return values[()] if values.ndim == 0 else values
+
+    def dim(self, key):
+        """Return the positions along dimension key, 'XDim', 'YDim' or 'ZDim'.
+        """
+        if key not in self._dims:
+            self._dims[key] = np.ravel(self._file[key][()])
+        return self._dims[key]
+
+    def channel(self, channel):
+        """Return the (X, Y, Z, component) field of a 0-based channel.
+        """
+        return self[..., channel]
+
+    def component(self, component, channels=slice(None)):
+        """Return the (X, Y, Z, channel) field component of channels.
+        """
+        return self[:, :, :, component, channels]
+
+    def z_index(self, z):
+        """Return the index of the z-slice nearest to position z.
+        """
+        return int(np.argmin(np.abs(self.ZDim - z)))
+
+    def z_slice(self, zind, component=slice(None), channels=slice(None)):
+        """Return the (X, Y, component, channel) field of z-slice zind.
+        """
+        return self[:, :, zind, component, channels]
+
+    @property
+    def field_file(self):
+        """Return the name of the field file.
+        """
+        return self._field_file
+
+    @property
+    def kind(self):
+        """Return the field key, 'efMapArrayN' or 'bfMapArrayN'.
+        """
+        return self._kind
+
+    @property
+    def dataset(self):
+        """Return the h5py dataset of the field (axes reversed).
+        """
+        return self._dataset
+
+    @property
+    def XDim(self):
+        """Return the x positions.
+        """
+        return self.dim('XDim')
+
+    @property
+    def YDim(self):
+        """Return the y positions.
+        """
+        return self.dim('YDim')
+
+    @property
+    def ZDim(self):
+        """Return the z positions.
+        """
+        return self.dim('ZDim')
+
+    @property
+    def shape(self):
+        """Return the field shape (X, Y, Z, component, channel).
+        """
+        return tuple(reversed(self._dataset.shape))
+
+    @property
+    def ndim(self):
+        """Return the number of field dimensions.
+        """
+        return len(self._dataset.shape)
+
+    @property
+    def nchannels(self):
+        """Return the number of channels.
+        """
+        return self.shape[-1]
+
+    @property
+    def ncomponents(self):
+        """Return the number of field components.
+        """
+        return self.shape[-2]
+
+    @property
+    def dtype(self):
+        """Return the field dtype, complex for compound (real, imag) data.
+        """
+        return complex_dtype(self._dataset.dtype)
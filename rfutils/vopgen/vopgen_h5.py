@@ -0,0 +1,96 @@
+"""
+Helpers for streaming vopgen MATLAB v7.3 field files with h5py.
+MATLAB writes arrays column-major, so h5py sees the axes reversed: a
+(X, Y, Z, 3, nchannels) efMapArrayN/bfMapArrayN is read as
+(nchannels, 3, Z, Y, X), and complex values are compound (real, imag) pairs.
+"""
+import numpy as np
+
+FIELD_KEYS = ['efMapArrayN', 'bfMapArrayN']
+DIM_KEYS = ['XDim', 'YDim', 'ZDim']
+
+# bytes of field data held in memory at once
+DEFAULT_BLOCK_BYTES = 2**26
+
+def find_field_key(keys):
+    """Return the field key, efMapArrayN or bfMapArrayN, among keys.
+    """
+    for key in FIELD_KEYS:
+        if key in keys:
+            return key
+    raise KeyError("Valid key not found, expected one of " + str(FIELD_KEYS))
+
+def complex_dtype(dtype):
+    """Return the complex dtype of a compound (real, imag) dtype; other dtypes
+    are returned unchanged.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.names is not None and len(dtype.names) == 2 and \
+       dtype.fields[dtype.names[0]][0] == dtype.fields[dtype.names[1]][0] and \
+       dtype.fields[dtype.names[1]][1] == dtype.fields[dtype.names[0]][0].itemsize:
+        return np.result_type(dtype.fields[dtype.names[0]][0], np.complex64)
+    return dtype
+
+def as_complex(block):
+    """Return a complex view of a block read from a field dataset.
+    """
+    dtype = complex_dtype(block.dtype)
+    return block if dtype == block.dtype else block.view(dtype)
+
+def block_slices(shape, itemsize, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Yield index tuples covering an array of shape in C order, each
+    selecting a contiguous block of at most block_bytes, or of one element
+    when an element is larger.
+    Args:
+        shape:       array shape
+        itemsize:    bytes per element
+        block_bytes: bytes per block
+    """
+    shape = tuple(shape)
+    if len(shape) == 0:
+        yield ()
+        return
+    # split the last axis whose trailing sub-array does not fit in a block
+    split = 0
+    for axis in range(len(shape) - 1, -1, -1):
+        if itemsize * int(np.prod(shape[axis:])) > block_bytes:
+            split = axis
+            break
+    inner = itemsize * int(np.prod(shape[split + 1:]))
+    step = max(1, block_bytes // inner)
+    for outer in np.ndindex(*shape[:split]):
+        for i0 in range(0, shape[split], step):
+            yield outer + (slice(i0, min(i0 + step, shape[split])),)
+
+def copy_userblock(source_file, target_file, size):
+    """Copy the userblock (the MATLAB file header) of source_file to
+    target_file, created with the same userblock size.
+    """
+    if size == 0:
+        return
+    with open(source_file, 'rb') as src:
+        header = src.read(size)
+    with open(target_file, 'r+b') as dst:
+        dst.write(header)
+
+def create_like(h5file, source, skip=()):
+    """Copy the root attributes and top-level objects of source into h5file,
+    except the names in skip.
+    """
+    for name, value in source.attrs.items():
+        h5file.attrs[name] = value
+    for name in source:
+        if name not in skip:
+            source.copy(source[name], h5file, name)
+
+def create_dataset_like(h5file, name, dataset):
+    """Create an empty dataset name in h5file with the shape, dtype, layout
+    and attributes of dataset.
+    """
+    created = h5file.create_dataset(name, shape=dataset.shape, dtype=dataset.dtype,
+                                    chunks=dataset.chunks,
+                                    compression=dataset.compression,
+                                    compression_opts=dataset.compression_opts)
+    for key, value in dataset.attrs.items():
+        created.attrs[key] = value
+    return created
@@ -0,0 +1,249 @@
+"""VopgenPipeline: lazily evaluated transformations of a vopgen field file.
+Steps are recorded, not applied: channel scales, permutations and other
+linear channel maps compose into one channel matrix, crops into one region
+and masks into one mask.  save then runs the fused steps in a single chunked
+pass, one read of the source and one write of the result however many steps
+were recorded.
+"""
+import time
+import numpy as np
+import h5py
+from .vopgen_h5 import (DIM_KEYS, DEFAULT_BLOCK_BYTES, find_field_key, complex_dtype,
+                        as_complex, block_slices, copy_userblock, create_like)
+from .reorder_vopgen_channels import read_channel_map
+
+# spatial axes in MATLAB order
+AXES = ['x', 'y', 'z']
+
+class VopgenPipeline(object):
+    """Lazy transformation chain of a vopgen field file.
+    Channels and positions follow the MATLAB axis order
+    (X, Y, Z, component, channel); every step applies to the result of the
+    previous steps and returns the pipeline, so steps can be chained:
+    VopgenPipeline(f).scale(s).reorder(remap_file).crop(z=(10, 50)).save(out)
+
+    Parameters
+    ----------
+    field_file : str
+        Source MATLAB v7.3 field file (efMapArrayN or bfMapArrayN).
+    """
+    def __init__(self, field_file):
+        self._field_file = field_file
+        with h5py.File(field_file, 'r') as src:
+            self._kind = find_field_key(src.keys())
+            # h5py sees MATLAB's (X, Y, Z, 3, N) as (N, 3, Z, Y, X)
+            shape = src[self._kind].shape
+        self._nchannels = shape[0]
+        self._ncomponents = shape[1]
+        self._spatial_shape = tuple(reversed(shape[2:]))
+        self._channel_map = np.eye(self._nchannels, dtype=np.complex128)
+        self._region = [(0, n) for n in self._spatial_shape]
+        self._masks = []
+        self._steps = []
+
+    def linear(self, matrix):
+        """Record a linear channel map: output channel i is
+        sum_j matrix[i, j] * channel j.
+        """
+        matrix = np.asarray(matrix, dtype=np.complex128)
+        if matrix.ndim != 2 or matrix.shape[1] != self.nchannels:
+            raise ValueError("Expected a channel matrix with " + str(self.nchannels) +
+                             " columns, found shape " + str(np.shape(matrix)))
+        self._channel_map = matrix @ self._channel_map
+        self._steps.append(('linear', matrix.shape))
+        return self
+
+    def scale(self, scales):
+        """Record complex per-channel scales.
+        """
+        scales = np.ravel(np.asarray(scales, dtype=np.complex128))
+        if len(scales) != self.nchannels:
+            raise ValueError("Expected " + str(self.nchannels) + " channel scales, found " +
+                             str(len(scales)))
+        self._channel_map = scales[:, np.newaxis] * self._channel_map
+        self._steps.append(('scale', len(scales)))
+        return self
+
+    def reorder(self, remap):
+        """Record a channel permutation, a channel map file or 0-based
+        (original, remapped) pairs as returned by read_channel_map.
+        """
+        if isinstance(remap, str):
+            coil_map = read_channel_map(remap, self.nchannels)
+        else:
+            coil_map = np.asarray(remap, dtype=np.intp)
+            if np.shape(coil_map) != (self.nchannels, 2) or \
+               sorted(coil_map[:, 0]) != list(range(self.nchannels)) or \
+               sorted(coil_map[:, 1]) != list(range(self.nchannels)):
+                raise ValueError("Expected a permutation of " + str(self.nchannels) +
+                                 " channels: " + str(coil_map))
+        # channel remapped takes the former channel original
+        permuted = np.empty_like(self._channel_map)
+        permuted[coil_map[:, 1]] = self._channel_map[coil_map[:, 0]]
+        self._channel_map = permuted
+        self._steps.append(('reorder', self.nchannels))
+        return self
+
+    def crop(self, x=None, y=None, z=None):
+        """Record a spatial crop; x, y and z are (start, stop) index ranges of
+        the current region, None keeps an axis.
+        """
+        region = list(self._region)
+        for axis, bounds in enumerate([x, y, z]):
+            if bounds is None:
+                continue
+            first, last = region[axis]
+            start, stop, step = slice(*bounds).indices(last - first)
+            if step != 1 or stop <= start:
+                raise ValueError("Expected a non-empty (start, stop) range along " +
+                                 AXES[axis] + ", found " + str(bounds))
+            region[axis] = (first + start, first + stop)
+        self._region = region
+        self._steps.append(('crop', tuple(region)))
+        return self
+
+    def mask(self, mask):
+        """Record a spatial mask (X, Y, Z) of the current region, multiplied
+        into every component of every channel.
+        """
+        mask = np.asarray(mask)
+        if mask.shape != self.shape[:3]:
+            raise ValueError("Expected a mask of shape " + str(self.shape[:3]) +
+                             ", found " + str(mask.shape))
+        self._masks.append((tuple(self._region), mask))
+        self._steps.append(('mask', mask.shape))
+        return self
+
+    def _fused_mask(self):
+        """Return the product of the masks over the final region in h5py axis
+        order (Z, Y, X), or None without masks.
+        """
+        if not self._masks:
+            return None
+        fused = np.ones(self.shape[:3])
+        for region, mask in self._masks:
+            # crops recorded after a mask shrink its region
+            fused = fused * mask[tuple(slice(first - mask_first, last - mask_first)
+                                       for (first, last), (mask_first, _)
+                                       in zip(self._region, region))]
+        return np.ascontiguousarray(fused.transpose())
+
+    def save(self, output_file, block_bytes=DEFAULT_BLOCK_BYTES, progress=None):
+        """Run the recorded steps in one pass and write the result.
+        Args:
+            output_file: MATLAB v7.3 file for the transformed field, with the
+                         header, attributes and cropped XDim/YDim/ZDim of the
+                         source
+            block_bytes: bytes of source and result field data held at once
+            progress:    optional callable progress(values_done, values_total,
+                         seconds), called after every block
+        Only the source channels used by the channel map are read.
+        """
+        channel_map = self._channel_map
+        needed = np.flatnonzero(np.any(channel_map != 0.0, axis=0))
+        channel_map = channel_map[:, needed]
+        mask = self._fused_mask()
+        nout = len(channel_map)
+        # h5py axis order: component, z, y, x
+        offsets = (0,) + tuple(first for first, _ in reversed(self._region))
+        block_shape = (self._ncomponents,) + tuple(reversed(self.shape[:3]))
+        with h5py.File(self._field_file, 'r') as src:
+            userblock_size = src.userblock_size
+            field = src[self._kind]
+            cdtype = complex_dtype(field.dtype)
+            total = nout * int(np.prod(block_shape))
+            with h5py.File(output_file, 'w', userblock_size=userblock_size) as dst:
+                create_like(dst, src, skip=[self._kind] + DIM_KEYS)
+                for axis, key in enumerate(DIM_KEYS):
+                    if key in src:
+                        self._write_dim(dst, src[key], self._region[axis])
+                out = dst.create_dataset(self._kind, shape=(nout,) + block_shape,
+                                         dtype=field.dtype, chunks=True if field.chunks else None,
+                                         compression=field.compression,
+                                         compression_opts=field.compression_opts)
+                for key, value in field.attrs.items():
+                    out.attrs[key] = value
+                if 'Python.Shape' in out.attrs:
+                    out.attrs['Python.Shape'] = np.array(out.shape[::-1], dtype=np.uint64)
+
+                done = 0
+                start = time.perf_counter()
+                itemsize = field.dtype.itemsize * (len(needed) + nout)
+                for block in block_slices(block_shape, itemsize, block_bytes):
+                    block = block + (slice(None),) * (len(block_shape) - len(block))
+                    source = tuple(_shift(index, offset, n) for index, offset, n in
+                                   zip(block, offsets, block_shape))
+                    values = as_complex(field[(list(needed),) + source])
+                    result = np.tensordot(channel_map, values, axes=1)
+                    if mask is not None:
+                        result *= mask[block[1:]]
+                    result = np.ascontiguousarray(result, dtype=cdtype)
+                    out[(slice(None),) + block] = result.view(field.dtype) \
+                        if field.dtype != cdtype else result
+                    done += result.size
+                    if progress is not None:
+                        progress(done, total, time.perf_counter() - start)
+        copy_userblock(self._field_file, output_file, userblock_size)
+
+    @staticmethod
+    def _write_dim(dst, dim, bounds):
+        """Write dimension vector dim cropped to bounds, keeping its layout
+        and attributes.
+        """
+        values = dim[()]
+        shape = np.shape(values)
+        values = np.reshape(np.ravel(values)[bounds[0]:bounds[1]],
+                            tuple(n if n == 1 else bounds[1] - bounds[0] for n in shape))
+        cropped = dst.create_dataset(dim.name.split('/')[-1], data=values)
+        for key, value in dim.attrs.items():
+            cropped.attrs[key] = value
+        if 'Python.Shape' in cropped.attrs:
+            cropped.attrs['Python.Shape'] = np.array(
+                [n if n == 1 else bounds[1] - bounds[0] for n in cropped.attrs['Python.Shape']],
+                dtype=np.uint64)
+
+    @property
+    def field_file(self):
+        """Return the source field file.
+        """
+        return self._field_file
+
+    @property
+    def kind(self):
+        """Return the field key, 'efMapArrayN' or 'bfMapArrayN'.
+        """
+        return self._kind
+
+    @property
+    def nchannels(self):
+        """Return the number of channels after the recorded steps.
+        """
+        return len(self._channel_map)
+
+    @property
+    def shape(self):
+        """Return the field shape (X, Y, Z, component, channel) after the
+        recorded steps.
+        """
+        return tuple(last - first for first, last in self._region) + \
+            (self._ncomponents, self.nchannels)
+
+    @property
+    def channel_map(self):
+        """Return the fused (output channel, source channel) matrix.
+        """
+        return self._channel_map
+
+    @property
+    def steps(self):
+        """Return the recorded steps as (name, argument shape) pairs.
+        """
+        return list(self._steps)
+
+def _shift(index, offset, n):
+    """Return a block index of a cropped axis in source coordinates.
+    """
+    if isinstance(index, slice):
+        start, stop, _ = index.indices(n)
+        return slice(start + offset, stop + offset)
+    return index + offset
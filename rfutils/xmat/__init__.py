@@ -2,3 +2,6 @@
 """
 
 from .xmat import NormalDielectric
+from .xmat_stream import extract_materials_h5
+from .xmat_parallel import extract_materials_parallel
+from .xmat_batch import extract_materials_batch
@@ -4,6 +4,182 @@
 
 import numpy as np
 from scipy.constants import epsilon_0
+from ..precision import PRECISIONS, precision_dtypes
+
+# spatial axes of field arrays shaped (...)x(xdim)x(ydim)x(zdim)x(3)
+X_AXIS, Y_AXIS, Z_AXIS = -4, -3, -2
+
+def _axis_slice(ndim, axis, index):
+    """Return an index tuple selecting index along axis of an ndim array.
+    """
+    slices = [slice(None)] * ndim
+    slices[axis] = index
+    return tuple(slices)
+
+def stencil_weights(coords, valid=slice(1, -2), dtype=np.float64):
+    """Central difference weights for a (possibly non-uniform) grid axis.
+    Returns a (3)x(len(coords)) array (w_minus, w_center, w_plus) such that
+    df/dx[i] = w_minus[i]*f[i-1] + w_center[i]*f[i] + w_plus[i]*f[i+1].
+    Weights are zero outside the valid points (by default the interior
+    points [1:-2]), so derivatives vanish there.  They are computed in double
+    precision and returned as dtype.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    weights = np.zeros((3, len(coords)), dtype=np.float64)
+    start, stop, _ = valid.indices(len(coords))
+    start, stop = max(start, 1), min(stop, len(coords) - 1)
+    if stop <= start:
+        return weights.astype(dtype, copy=False)
+    h_minus = coords[start:stop] - coords[start - 1:stop - 1]
+    h_plus = coords[start + 1:stop + 1] - coords[start:stop]
+    weights[0, start:stop] = -h_plus / (h_minus * (h_minus + h_plus))
+    weights[1, start:stop] = (h_plus - h_minus) / (h_minus * h_plus)
+    weights[2, start:stop] = h_minus / (h_plus * (h_minus + h_plus))
+    return weights.astype(dtype, copy=False)
+
+def _accumulate_difference(field, weights, axis, out, sign, scratch):
+    """Add (sign > 0) or subtract the central difference of field along a
+    spatial axis to the interior points of out.
+    The difference w_minus*f[i-1] + w_center*f[i] + w_plus*f[i+1] is formed
+    in the two flat scratch buffers, so no temporaries are allocated.  The
+    end points of the axis are left unchanged.
+    """
+    ndim = np.ndim(field)
+    npts = np.shape(field)[axis]
+    if npts < 3:
+        return
+    interior = _axis_slice(ndim, axis, slice(1, -1))
+    mid_shape = np.shape(field[interior])
+    mid_size = int(np.prod(mid_shape))
+    diff = np.reshape(scratch[0][:mid_size], mid_shape)
+    term = np.reshape(scratch[1][:mid_size], mid_shape)
+    # broadcast the weights of the interior points along axis
+    w_shape = (npts - 2,) + (1,) * (-axis - 1)
+    w_minus, w_center, w_plus = [np.reshape(w[1:-1], w_shape) for w in weights]
+    np.multiply(w_minus, field[_axis_slice(ndim, axis, slice(0, -2))], out=diff)
+    np.multiply(w_center, field[interior], out=term)
+    diff += term
+    np.multiply(w_plus, field[_axis_slice(ndim, axis, slice(2, None))], out=term)
+    diff += term
+    if sign > 0:
+        out[interior] += diff
+    else:
+        out[interior] -= diff
+
+def _curl(h_field, weights):
+    """Curl of the H-field, returned with the component axis first:
+    (3)x(...)x(xdim)x(ydim)x(zdim).
+    weights holds the stencil weights of the x-, y- and z-axis.  Each
+    derivative is accumulated straight into its curl component through two
+    reused scratch buffers, so the only allocations are the curl and two
+    single-component buffers.
+    """
+    wx, wy, wz = weights
+    grid_shape = np.shape(h_field)[:-1]
+    dtype = np.result_type(h_field, wx)
+    curl_h = np.zeros((3,) + grid_shape, dtype=dtype)
+    scratch = np.empty((2, int(np.prod(grid_shape))), dtype=dtype)
+    # (H component, axis weights, axis, curl component, sign)
+    terms = [(1, wx, X_AXIS, 2, 1), (2, wx, X_AXIS, 1, -1),
+             (2, wy, Y_AXIS, 0, 1), (0, wy, Y_AXIS, 2, -1),
+             (0, wz, Z_AXIS, 1, 1), (1, wz, Z_AXIS, 0, -1)]
+    for component, w_axis, axis, curl_component, sign in terms:
+        # H component views keep the spatial axes at X_AXIS..Z_AXIS
+        _accumulate_difference(h_field[..., component:component + 1], w_axis,
+                               axis, curl_h[curl_component][..., np.newaxis],
+                               sign, scratch)
+    return curl_h
+
+def _curl_at(h_field, weights, indices):
+    """Curl of the H-field at the flat (C-order) grid indices only, returned
+    as (3)x(len(indices)).
+    Only the indexed voxels and their stencil neighbours are read; the
+    arithmetic matches _curl, so values agree exactly with the dense curl.
+    """
+    grid_shape = np.shape(h_field)[:-1]
+    h_flat = np.reshape(h_field, (-1, 3))
+    ijk = np.unravel_index(indices, grid_shape)
+    strides = (grid_shape[1] * grid_shape[2], grid_shape[2], 1)
+    curl_h = np.zeros((3, len(indices)), dtype=np.result_type(h_field, weights[0]))
+    derivs = []
+    # d/dx of (Hy, Hz), d/dy of (Hx, Hz), d/dz of (Hx, Hy)
+    for axis, components in enumerate([[1, 2], [0, 2], [0, 1]]):
+        pos = ijk[axis]
+        interior = (pos > 0) & (pos < grid_shape[axis] - 1)
+        pos = np.where(interior, pos, 0)
+        step = np.where(interior, strides[axis], 0)[:, np.newaxis]
+        w_minus, w_center, w_plus = [w[pos][:, np.newaxis]
+                                     for w in weights[axis]]
+        center = indices[:, np.newaxis]
+        deriv = (w_minus * h_flat[center - step, components] +
+                 w_center * h_flat[center, components] +
+                 w_plus * h_flat[center + step, components])
+        deriv[~interior] = 0.0
+        derivs.append(deriv)
+    dhdx, dhdy, dhdz = derivs
+    curl_h[2] += dhdx[:, 0]
+    curl_h[1] -= dhdx[:, 1]
+    curl_h[0] += dhdy[:, 1]
+    curl_h[2] -= dhdy[:, 0]
+    curl_h[1] += dhdz[:, 0]
+    curl_h[0] -= dhdz[:, 1]
+    return curl_h
+
+def _materials_from_curl(e_field, curl_h, omega0, efsq_floor=0.0, out=None):
+    """Conductivity and relative permittivity from conj(E_i)*(curl H)_i/|E_i|^2.
+    Returns directional sigma and eps_r, shaped (3)x(...), and their
+    estimates combined over the three axes with weights |E_i|^2.  Voxels
+    with |E_i|^2 (or the sum over i) at or below efsq_floor are set to zero,
+    so no inf or NaN is produced by the division.
+    The products are formed from real and imaginary parts with real ufuncs,
+    so results do not depend on the memory layout of the inputs.  curl_h is
+    used as scratch space and overwritten; results are written to out, a
+    tuple of (sigma, eps_r, sigma_w, eps_r_w) arrays, when given.
+    """
+    e_field = np.moveaxis(e_field, -1, 0)
+    rdtype = curl_h.real.dtype
+    if out is None:
+        out = (np.empty(np.shape(curl_h), dtype=rdtype),
+               np.empty(np.shape(curl_h), dtype=rdtype),
+               np.empty(np.shape(curl_h)[1:], dtype=rdtype),
+               np.empty(np.shape(curl_h)[1:], dtype=rdtype))
+    sigma, eps_r, sigma_w, eps_r_w = out
+    scale = 1.0 / (omega0 * epsilon_0)
+    valid = np.empty(np.shape(curl_h)[1:], dtype=bool)
+    efsq = curl_h.real
+    for i in range(3):
+        e_re, e_im = e_field[i].real, e_field[i].imag
+        c_re, c_im = curl_h[i].real, curl_h[i].imag
+        # num_re = e_re*c_re + e_im*c_im, num_im = e_re*c_im - e_im*c_re
+        np.multiply(e_re, c_re, out=sigma[i])
+        np.multiply(e_re, c_im, out=eps_r[i])
+        np.multiply(e_im, c_im, out=c_im)
+        sigma[i] += c_im
+        np.multiply(e_im, c_re, out=c_re)
+        eps_r[i] -= c_re
+        # the curl component is consumed: keep |E_i|^2 in its real part
+        np.multiply(e_re, e_re, out=c_re)
+        np.multiply(e_im, e_im, out=c_im)
+        c_re += c_im
+    np.add(sigma[0], sigma[1], out=sigma_w)
+    sigma_w += sigma[2]
+    np.add(eps_r[0], eps_r[1], out=eps_r_w)
+    eps_r_w += eps_r[2]
+    efsq_sum = curl_h[0].imag
+    np.add(efsq[0], efsq[1], out=efsq_sum)
+    efsq_sum += efsq[2]
+    for num_re, num_im, den in [(sigma[0], eps_r[0], efsq[0]),
+                                (sigma[1], eps_r[1], efsq[1]),
+                                (sigma[2], eps_r[2], efsq[2]),
+                                (sigma_w, eps_r_w, efsq_sum)]:
+        np.greater(den, efsq_floor, out=valid)
+        np.divide(num_re, den, out=num_re, where=valid)
+        np.divide(num_im, den, out=num_im, where=valid)
+        num_im *= scale
+        np.logical_not(valid, out=valid)
+        np.copyto(num_re, 0.0, where=valid)
+        np.copyto(num_im, 0.0, where=valid)
+    return sigma, eps_r, sigma_w, eps_r_w
 
 class NormalDielectric(object):
     """Normal Dielectric
@@ -12,17 +188,46 @@ class NormalDielectric(object):
         f0 : float
             Frequency in MHz
         xdim : array_like
-            X- grid points
+            X- grid points (m), uniform or non-uniform
         ydim : array_like
-            Y- grid points
+            Y- grid points (m), uniform or non-uniform
         zdim : array_like
-            Z- grid points
+            Z- grid points (m), uniform or non-uniform
         e_field_data : array_like
             E-field data sampled on rectangular grid (xdim)x(ydim)x(zdim)x(3)
         h_field_data : array_like
             H-field data sampled on rectangular grid (xdim)x(ydim)x(zdim)x(3)
+        current_density : array_like, optional
+            Conduction current density sampled on rectangular grid
+            (xdim)x(ydim)x(zdim)x(3)
+        workers : int, optional
+            Number of processes used for material extraction; 1 (default)
+            runs serially, None uses all cores.  Results do not depend on
+            the number of workers.
+        precision : str, optional
+            'double' (default) computes in complex128/float64, 'single' keeps
+            complex64/float32 throughout, halving memory and bandwidth.
+        mask : array_like, optional
+            Boolean (xdim)x(ydim)x(zdim) tissue mask, e.g. a vopgen SAR mask.
+            Materials are only evaluated at masked voxels and are available
+            in compact form from sparse_materials(); the dense properties
+            scatter them back with zeros outside the mask.
+        efsq_floor : float, optional
+            Floor on |E|^2 ((V/m)^2); voxels at or below it get zero
+            conductivity and permittivity instead of inf/NaN.  Default 0.0.
+
+       Single precision accuracy: for a 447 MHz plane wave in a lossy
+       dielectric (eps_r=50, sigma=0.6 S/m) sampled at single precision on
+       0.25-4 mm grids, single and double results differ by less than 6e-6
+       (relative) in eps_r and sigma, while the finite difference error of
+       either path is 2e-5 to 1e-2.  The difference grows as 1/(k*h) on very
+       fine grids, where the central differences cancel more digits.
+
+       Extracted material properties are cached and only recomputed after the
+       fields, grid or frequency are reassigned through their setters.
     """
-    def __init__(self, f0, xdim, ydim, zdim, e_field_data, h_field_data, current_density=None):
+    def __init__(self, f0, xdim, ydim, zdim, e_field_data, h_field_data, current_density=None,
+                 workers=1, precision='double', mask=None, efsq_floor=0.0):
         self._frequency = f0*1.0e6
         self._xdim = xdim
         self._ydim = ydim
@@ -30,6 +235,14 @@ class NormalDielectric(object):
         self._e_field = e_field_data
         self._h_field = h_field_data
         self._j_density = current_density
+        self._workers = workers
+        self._precision = precision
+        precision_dtypes(precision)
+        self._efsq_floor = efsq_floor
+        self._mask = None
+        self.mask = mask
+        self._mask_indices = None
+        self._sparse_materials = None
         self._sigma_eff_x = None
         self._sigma_eff_y = None
         self._sigma_eff_z = None
@@ -37,77 +250,379 @@ class NormalDielectric(object):
         self._eps_r_x = None
         self._eps_r_y = None
         self._eps_r_z = None
+        self._sigma_eff_xyz = None
+        self._eps_r_xyz = None
+        self._sigma_eff_weighted = None
+        self._eps_r_weighted = None
+        self._stencil_weights = None
         # _material_properties_valid: if False, epsilon and sigma not valid
         #  and need to be calculated
-        #self._material_properties_valid = False
-        #self._sigma_properties_valid = False
-        #self._eps_properties_valid = False
+        self._material_properties_valid = False
+        # _sigma_from_j_valid: if False, conductivity from currents not valid
+        self._sigma_from_j_valid = False
+
+    def _invalidate_materials(self):
+        """Mark the cached material properties as stale.
+        """
+        self._material_properties_valid = False
+
+    def _invalidate_sigma_from_j(self):
+        """Mark the cached conductivity from currents as stale.
+        """
+        self._sigma_from_j_valid = False
 
     def _update_materials(self):
-        """Update material properties.
+        """Update material properties if the cached values are stale.
         """
-        self._extract_materials_x()
-        if self._j_density is not None:
+        if not self._material_properties_valid:
+            self._extract_materials()
+            self._material_properties_valid = True
+
+    def _update_sigma_from_j(self):
+        """Update the conductivity from currents if the cached value is stale.
+        """
+        if not self._sigma_from_j_valid:
             self._extract_conductivity_from_currents()
+            self._sigma_from_j_valid = True
 
     def _extract_conductivity_from_currents(self):
         """Extract material properties from currents and electric fields.
         """
-        self._sigma_eff_from_j = np.zeros(np.shape(self._j_density))
-        self._sigma_eff_from_j[:,:,:,0] = np.abs(np.divide(self._j_density[:,:,:,0],
-                                                           self._e_field[:,:,:,0]))
-        self._sigma_eff_from_j[:,:,:,1] = np.abs(np.divide(self._j_density[:,:,:,1],
-                                                           self._e_field[:,:,:,1]))
-        self._sigma_eff_from_j[:,:,:,2] = np.abs(np.divide(self._j_density[:,:,:,2],
-                                                           self._e_field[:,:,:,2]))
+        cdtype, _ = precision_dtypes(self._precision)
+        e_field = np.asarray(self._e_field, dtype=cdtype)
+        ratio = np.zeros(np.shape(e_field), dtype=cdtype)
+        np.divide(np.asarray(self._j_density, dtype=cdtype), e_field, out=ratio,
+                  where=(e_field.real**2 + e_field.imag**2) > self._efsq_floor)
+        self._sigma_eff_from_j = np.abs(ratio)
 
-    def _extract_materials_x(self):
-        """Extract material properties for X-direction.
+    def _extract_materials(self):
+        """Extract material properties for the X-, Y- and Z-directions.
+        All three directions are produced in one pass over the curl of H;
+        conductivity and permittivity come from the same product
+        conj(E_i) * (curl H)_i / |E_i|^2.
         """
         omega0 = 2.0 * np.pi * self._frequency
-        efxsq = np.abs(self._e_field[:, :, :, 0]*np.conj(self._e_field[:, :, :, 0]))
-        deltay = self._ydim[1: -1] - self._ydim[0: -2]
-        deltaz = self._zdim[1: -1] - self._zdim[0: -2]
-        dy = deltay[0] # meters
-        dz = deltaz[0] 
-
-        print('_extract_materials_x: ', dy, ', ', dz)
-        dhzdy = np.zeros(np.shape(efxsq), dtype=np.complex128)
-        dhydz = np.zeros(np.shape(efxsq), dtype=np.complex128)
-        dhzdy[:, 1:-2, :] = 1.0 / (2.0 * dy) * (self._h_field[:, 2:-1, :, 2] -
-                                                self._h_field[:, 0:-3, :, 2])
-        dhydz[:, :, 1:-2] = 1.0 / (2.0 * dz) * (self._h_field[:, :, 2:-1, 1] -
-                                                self._h_field[:, :, 0:-3, 1])
-        self._sigma_eff_x = np.zeros(np.shape(self._e_field[:, :, :, 0]), dtype=np.float64)
-        self._sigma_eff_x = np.real(np.divide(np.conj(self._e_field[:, :, :, 0]) * (dhzdy - dhydz), efxsq))
-        self._eps_r_x = np.zeros(np.shape(self._e_field[:, :, :, 0]), dtype=np.float64)
-        self._eps_r_x = (1.0 / (omega0 * epsilon_0))* np.imag(np.divide(np.conj(self._e_field[:, :, :, 0]) * (dhzdy - dhydz), efxsq))
-        #self._material_properties_valid = True
+        if self._mask is not None:
+            self._extract_materials_masked(omega0)
+            return
+        if self._workers != 1:
+            from .xmat_parallel import extract_materials_parallel
+            sigma, eps_r, sigma_w, eps_r_w = extract_materials_parallel(
+                self._e_field, self._h_field, self.stencil_weights, omega0,
+                self._workers, self._precision, self._efsq_floor)
+        else:
+            cdtype, _ = precision_dtypes(self._precision)
+            curl_h = _curl(np.asarray(self._h_field, dtype=cdtype),
+                           self.stencil_weights)
+            sigma, eps_r, sigma_w, eps_r_w = _materials_from_curl(
+                np.asarray(self._e_field, dtype=cdtype), curl_h, omega0,
+                self._efsq_floor)
+        self._set_dense_materials(sigma, eps_r, sigma_w, eps_r_w)
+
+    def _extract_materials_masked(self, omega0):
+        """Extract material properties at the masked voxels only.
+        """
+        cdtype, _ = precision_dtypes(self._precision)
+        self._mask_indices = np.flatnonzero(self._mask)
+        curl_h = _curl_at(np.asarray(self._h_field, dtype=cdtype),
+                          self.stencil_weights, self._mask_indices)
+        e_field = np.reshape(self._e_field, (-1, 3))[self._mask_indices]
+        self._sparse_materials = _materials_from_curl(
+            np.asarray(e_field, dtype=cdtype), curl_h, omega0, self._efsq_floor)
+        self._set_dense_materials(None, None, None, None)
+
+    def _set_dense_materials(self, sigma, eps_r, sigma_w, eps_r_w):
+        """Store dense material properties; directional arrays are (3)x(...).
+        """
+        if sigma is None:
+            sigma = eps_r = [None] * 3
+            self._sigma_eff_xyz = self._eps_r_xyz = None
+        else:
+            self._sigma_eff_xyz = np.moveaxis(sigma, 0, -1)
+            self._eps_r_xyz = np.moveaxis(eps_r, 0, -1)
+        self._sigma_eff_x, self._sigma_eff_y, self._sigma_eff_z = sigma
+        self._eps_r_x, self._eps_r_y, self._eps_r_z = eps_r
+        self._sigma_eff_weighted = sigma_w
+        self._eps_r_weighted = eps_r_w
+
+    def _update_dense_materials(self):
+        """Update the dense material properties, scattering the masked
+        results if only those are available.
+        """
+        self._update_materials()
+        if self._sigma_eff_weighted is None:
+            sigma, eps_r, sigma_w, eps_r_w = self._sparse_materials
+            self._set_dense_materials(
+                np.moveaxis(self.scatter(sigma.T), -1, 0),
+                np.moveaxis(self.scatter(eps_r.T), -1, 0),
+                self.scatter(sigma_w), self.scatter(eps_r_w))
+
+    def scatter(self, values, fill_value=0.0):
+        """Scatter compact values at the masked voxels back to a dense
+        (xdim)x(ydim)x(zdim)(x...) array filled with fill_value elsewhere.
+        """
+        if self._mask is None:
+            raise ValueError("Sparse materials require a mask.")
+        self._update_materials()
+        values = np.asarray(values)
+        grid_shape = np.shape(self._mask)
+        dense = np.full((np.size(self._mask),) + np.shape(values)[1:],
+                        fill_value, dtype=values.dtype)
+        dense[self._mask_indices] = values
+        return np.reshape(dense, grid_shape + np.shape(values)[1:])
+
+    def sparse_materials(self):
+        """Return the material properties at the masked voxels as a dict of
+        compact arrays: 'index' (flat C-order grid indices), 'sigma_eff' and
+        'epsilon_r' (x-direction), 'sigma_eff_xyz' and 'epsilon_r_xyz'
+        (len(index))x(3), 'sigma_eff_weighted' and 'epsilon_r_weighted'.
+        """
+        if self._mask is None:
+            raise ValueError("Sparse materials require a mask.")
+        self._update_materials()
+        sigma, eps_r, sigma_w, eps_r_w = self._sparse_materials
+        return {'index': self._mask_indices,
+                'sigma_eff': sigma[0],
+                'epsilon_r': eps_r[0],
+                'sigma_eff_xyz': sigma.T,
+                'epsilon_r_xyz': eps_r.T,
+                'sigma_eff_weighted': sigma_w,
+                'epsilon_r_weighted': eps_r_w}
+
+    def _update_stencil_weights(self):
+        """Update the stencil weights of the grid axes if they are stale.
+        """
+        if self._stencil_weights is None:
+            _, rdtype = precision_dtypes(self._precision)
+            self._stencil_weights = tuple(
+                stencil_weights(dim, dtype=rdtype)
+                for dim in (self._xdim, self._ydim, self._zdim))
+
+    @property
+    def stencil_weights(self):
+        """Return the central difference weights of the x-, y- and z-axis,
+        each (3)x(len(dim)).
+        """
+        self._update_stencil_weights()
+
+        return self._stencil_weights
+
+    @property
+    def workers(self):
+        """Return the number of processes used for material extraction.
+        """
+        return self._workers
+
+    @workers.setter
+    def workers(self, workers):
+        """Update the number of processes used for material extraction.
+        Cached results remain valid since they do not depend on workers.
+        """
+        self._workers = workers
+
+    @property
+    def mask(self):
+        """Return the boolean tissue mask, or None.
+        """
+        return self._mask
+
+    @mask.setter
+    def mask(self, mask):
+        """Update the boolean tissue mask; None evaluates the full grid.
+        """
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if np.shape(mask) != np.shape(self._e_field)[:-1]:
+                raise ValueError("Mask shape " + str(np.shape(mask)) +
+                                 " does not match the field grid " +
+                                 str(np.shape(self._e_field)[:-1]))
+        self._mask = mask
+        self._invalidate_materials()
+
+    @property
+    def efsq_floor(self):
+        """Return the floor on |E|^2 below which materials are set to zero.
+        """
+        return self._efsq_floor
+
+    @efsq_floor.setter
+    def efsq_floor(self, efsq_floor):
+        """Update the floor on |E|^2 below which materials are set to zero.
+        """
+        self._efsq_floor = efsq_floor
+        self._invalidate_materials()
+        self._invalidate_sigma_from_j()
+
+    @property
+    def precision(self):
+        """Return the floating point precision, 'double' or 'single'.
+        """
+        return self._precision
+
+    @precision.setter
+    def precision(self, precision):
+        """Update the floating point precision, 'double' or 'single'.
+        """
+        precision_dtypes(precision)
+        self._precision = precision
+        self._stencil_weights = None
+        self._invalidate_materials()
+        self._invalidate_sigma_from_j()
+
+    @property
+    def frequency(self):
+        """Return the frequency (MHz).
+        """
+        return self._frequency * 1.0e-6
+
+    @frequency.setter
+    def frequency(self, f0):
+        """Update the frequency (MHz).
+        """
+        self._frequency = f0 * 1.0e6
+        self._invalidate_materials()
+
+    @property
+    def xdim(self):
+        """Return the x- grid points.
+        """
+        return self._xdim
+
+    @xdim.setter
+    def xdim(self, xdim):
+        """Update the x- grid points.
+        """
+        self._xdim = xdim
+        self._stencil_weights = None
+        self._invalidate_materials()
+
+    @property
+    def ydim(self):
+        """Return the y- grid points.
+        """
+        return self._ydim
+
+    @ydim.setter
+    def ydim(self, ydim):
+        """Update the y- grid points.
+        """
+        self._ydim = ydim
+        self._stencil_weights = None
+        self._invalidate_materials()
+
+    @property
+    def zdim(self):
+        """Return the z- grid points.
+        """
+        return self._zdim
+
+    @zdim.setter
+    def zdim(self, zdim):
+        """Update the z- grid points.
+        """
+        self._zdim = zdim
+        self._stencil_weights = None
+        self._invalidate_materials()
+
+    @property
+    def e_field(self):
+        """Return the E-field data.
+        """
+        return self._e_field
+
+    @e_field.setter
+    def e_field(self, e_field_data):
+        """Update the E-field data.
+        """
+        self._e_field = e_field_data
+        self._invalidate_materials()
+        self._invalidate_sigma_from_j()
+
+    @property
+    def h_field(self):
+        """Return the H-field data.
+        """
+        return self._h_field
+
+    @h_field.setter
+    def h_field(self, h_field_data):
+        """Update the H-field data.
+        """
+        self._h_field = h_field_data
+        self._invalidate_materials()
+
+    @property
+    def current_density(self):
+        """Return the conduction current density data.
+        """
+        return self._j_density
+
+    @current_density.setter
+    def current_density(self, current_density):
+        """Update the conduction current density data.
+        """
+        self._j_density = current_density
+        self._invalidate_sigma_from_j()
 
     @property
     def sigma_eff(self):
-        """Return the conductivity (S/m) calculated from the uniformly
-        gridded electric and magnetic fields.
+        """Return the conductivity (S/m) calculated from the electric and
+        magnetic fields.
         """
-        self._update_materials()
+        self._update_dense_materials()
 
         return self._sigma_eff_x
 
     @property
     def epsilon_r(self):
-        """Return the relative permittivity (unitless) calculatd from uniformly
-        gridded electric and magnetic fields.
+        """Return the relative permittivity (unitless) calculatd from the
+        electric and magnetic fields.
         """
-        #if not self._material_properties_valid:
-        self._update_materials()
+        self._update_dense_materials()
 
         return self._eps_r_x
 
+    @property
+    def sigma_eff_xyz(self):
+        """Return the conductivity (S/m) extracted separately along each axis,
+        (xdim)x(ydim)x(zdim)x(3).
+        """
+        self._update_dense_materials()
+
+        return self._sigma_eff_xyz
+
+    @property
+    def epsilon_r_xyz(self):
+        """Return the relative permittivity (unitless) extracted separately
+        along each axis, (xdim)x(ydim)x(zdim)x(3).
+        """
+        self._update_dense_materials()
+
+        return self._eps_r_xyz
+
+    @property
+    def sigma_eff_weighted(self):
+        """Return the conductivity (S/m) combined over the three axes, weighted
+        by |E_i|^2.
+        """
+        self._update_dense_materials()
+
+        return self._sigma_eff_weighted
+
+    @property
+    def epsilon_r_weighted(self):
+        """Return the relative permittivity (unitless) combined over the three
+        axes, weighted by |E_i|^2.
+        """
+        self._update_dense_materials()
+
+        return self._eps_r_weighted
+
     @property
     def sigma_eff_from_currents(self):
         """Return the effective conductivity derived from conduction current
         density.
         """
-        self._extract_conductivity_from_currents()
+        self._update_sigma_from_j()
 
         return self._sigma_eff_from_j
@@ -0,0 +1,67 @@
+"""xmat_batch: extract materials for a stack of excitations.
+Fields from several ports or frequencies share one grid, so the stencil
+weights are built once and reused for every excitation.  Per-excitation
+results are returned stacked along the leading axis together with a
+per-voxel combination weighted by field strength.
+"""
+
+import numpy as np
+from .xmat import precision_dtypes, stencil_weights, _curl, _materials_from_curl
+
+def extract_materials_batch(f0, xdim, ydim, zdim, e_fields, h_fields,
+                            precision='double', efsq_floor=0.0):
+    """Extract material properties for stacked excitations.
+    Args:
+        f0:        Frequency in MHz, scalar or one per excitation
+        xdim:      X- grid points (m)
+        ydim:      Y- grid points (m)
+        zdim:      Z- grid points (m)
+        e_fields:  E-fields (nexc)x(xdim)x(ydim)x(zdim)x(3)
+        h_fields:  H-fields (nexc)x(xdim)x(ydim)x(zdim)x(3)
+        precision: 'double' or 'single'
+        efsq_floor: floor on |E|^2 below which materials are set to zero
+
+    Returns:
+        dict of 'sigma_eff' and 'epsilon_r' (x-direction) and
+        'sigma_eff_weighted' and 'epsilon_r_weighted' (|E_i|^2-weighted),
+        each (nexc)x(xdim)x(ydim)x(zdim), and 'sigma_eff_combined' and
+        'epsilon_r_combined', (xdim)x(ydim)x(zdim), the estimates of all
+        excitations weighted by |E|^2.  Excitations with |E|^2 at or below
+        efsq_floor do not contribute to the combination of a voxel.
+    """
+    cdtype, rdtype = precision_dtypes(precision)
+    nexc = np.shape(e_fields)[0]
+    grid_shape = np.shape(e_fields)[1:-1]
+    frequencies = np.broadcast_to(np.asarray(f0, dtype=np.float64) * 1.0e6,
+                                  (nexc,))
+    weights = tuple(stencil_weights(dim, dtype=rdtype)
+                    for dim in (xdim, ydim, zdim))
+
+    results = {key: np.empty((nexc,) + grid_shape, dtype=rdtype)
+               for key in ['sigma_eff', 'epsilon_r', 'sigma_eff_weighted',
+                           'epsilon_r_weighted']}
+    sigma_sum = np.zeros(grid_shape, dtype=rdtype)
+    eps_r_sum = np.zeros(grid_shape, dtype=rdtype)
+    efsq_sum = np.zeros(grid_shape, dtype=rdtype)
+    for exc in range(nexc):
+        omega0 = 2.0 * np.pi * frequencies[exc]
+        e_field = np.asarray(e_fields[exc], dtype=cdtype)
+        curl_h = _curl(np.asarray(h_fields[exc], dtype=cdtype), weights)
+        sigma, eps_r, sigma_w, eps_r_w = _materials_from_curl(
+            e_field, curl_h, omega0, efsq_floor)
+        del curl_h
+        results['sigma_eff'][exc] = sigma[0]
+        results['epsilon_r'][exc] = eps_r[0]
+        results['sigma_eff_weighted'][exc] = sigma_w
+        results['epsilon_r_weighted'][exc] = eps_r_w
+        # weight of this excitation: |E|^2 summed over the components
+        efsq = np.sum(e_field.real**2 + e_field.imag**2, axis=-1)
+        efsq[efsq <= efsq_floor] = 0.0
+        sigma_sum += sigma_w * efsq
+        eps_r_sum += eps_r_w * efsq
+        efsq_sum += efsq
+    results['sigma_eff_combined'] = np.divide(sigma_sum, efsq_sum,
+                                              out=sigma_sum, where=efsq_sum > 0.0)
+    results['epsilon_r_combined'] = np.divide(eps_r_sum, efsq_sum,
+                                              out=eps_r_sum, where=efsq_sum > 0.0)
+    return results
@@ -0,0 +1,215 @@
+"""xmat_benchmark: speed and accuracy of xmat on synthetic fields.
+Builds an analytic plane wave in a lossy dielectric of known eps_r/sigma on
+a configurable grid and reports, for each xmat execution mode, the
+throughput (voxels/s), the peak memory and the error of the extracted
+materials against the known properties.  No CST exports are needed; the
+synthetic field helpers are shared with the xmat unit tests.
+Run as a module: python -m rfutils.xmat.xmat_benchmark --help
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import h5py
+from scipy.constants import epsilon_0, mu_0
+try:
+    import resource
+except ImportError:
+    # peak RSS is not available on Windows
+    resource = None
+from .xmat import NormalDielectric
+from .xmat_batch import extract_materials_batch
+from .xmat_stream import extract_materials_h5
+
+MODES = ['serial', 'single', 'masked', 'parallel', 'batch', 'stream']
+
+# oblique incidence with all E and H components non-zero
+DIRECTION = np.array([1.0, 2.0, 2.0]) / 3.0
+POLARIZATION = (np.array([2.0, -1.0, 0.0]) / np.sqrt(5.0) +
+                1.0j * np.cross(DIRECTION, np.array([2.0, -1.0, 0.0]) / np.sqrt(5.0)))
+
+def plane_wave_fields(f0, eps_r, sigma, xdim, ydim, zdim, direction=DIRECTION,
+                      polarization=POLARIZATION):
+    """Return E, H of a plane wave in a lossy dielectric, sampled on the grid
+    (xdim)x(ydim)x(zdim), each (xdim)x(ydim)x(zdim)x(3).
+    f0 is in MHz; polarization must be orthogonal to direction.
+    """
+    omega = 2.0 * np.pi * f0 * 1.0e6
+    eps_c = eps_r - 1.0j * sigma / (omega * epsilon_0)
+    k = omega * np.sqrt(mu_0 * epsilon_0 * eps_c)
+    eta = omega * mu_0 / k
+    khat = np.asarray(direction, dtype=np.float64)
+    khat = khat / np.linalg.norm(khat)
+    pol = np.asarray(polarization, dtype=np.complex128)
+    xx, yy, zz = np.meshgrid(xdim, ydim, zdim, indexing='ij')
+    phase = np.exp(-1.0j * k * (khat[0] * xx + khat[1] * yy + khat[2] * zz))
+    efield = phase[..., np.newaxis] * pol
+    hfield = phase[..., np.newaxis] * np.cross(khat, pol) / eta
+    return efield, hfield
+
+def write_cst_field(filename, field_key, xdim, ydim, zdim, field):
+    """Write field in the CST export layout: mesh lines in mm and a compound
+    (zdim)x(ydim)x(xdim) dataset of single precision x/y/z components.
+    """
+    re_im = np.dtype([('re', np.float32), ('im', np.float32)])
+    cst_dtype = np.dtype([('x', re_im), ('y', re_im), ('z', re_im)])
+    data = np.empty((len(zdim), len(ydim), len(xdim)), dtype=cst_dtype)
+    for i, c in enumerate('xyz'):
+        data[c]['re'] = np.transpose(field[..., i].real, (2, 1, 0))
+        data[c]['im'] = np.transpose(field[..., i].imag, (2, 1, 0))
+    with h5py.File(filename, 'w') as fh:
+        fh['Mesh line x'] = np.asarray(xdim) * 1000.0
+        fh['Mesh line y'] = np.asarray(ydim) * 1000.0
+        fh['Mesh line z'] = np.asarray(zdim) * 1000.0
+        fh[field_key] = data
+
+def _peak_rss_mb():
+    """Return the peak resident set size of this process (MB), or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 1024.0**2 if sys.platform == 'darwin' else peak / 1024.0
+
+def _relative_error(values, expected, region):
+    """Return the max and median relative error of values in region.
+    """
+    error = np.abs(np.asarray(values, dtype=np.float64)[region] - expected) / expected
+    return float(np.max(error)), float(np.median(error))
+
+def _run_mode(mode, shape, spacing, f0, eps_r, sigma, workers):
+    """Run one execution mode and return its measurements.
+    """
+    grid = [np.arange(n) * spacing for n in shape]
+    efield, hfield = plane_wave_fields(f0, eps_r, sigma, *grid)
+    # derivatives are evaluated on [1:-2] of each axis
+    region = np.zeros(shape, dtype=bool)
+    region[1:-2, 1:-2, 1:-2] = True
+    nvoxels = int(np.prod(shape))
+    tmp_dir = None
+    if mode == 'masked':
+        # centred ball holding roughly 20% of the voxels
+        xx, yy, zz = np.meshgrid(*[np.linspace(-1.0, 1.0, n) for n in shape],
+                                 indexing='ij')
+        mask = xx**2 + yy**2 + zz**2 < 0.6**2
+        region &= mask
+    elif mode == 'batch':
+        # four excitations: the plane wave at four phases
+        phases = np.exp(0.5j * np.pi * np.arange(4))[:, np.newaxis, np.newaxis,
+                                                      np.newaxis, np.newaxis]
+        efield, hfield = phases * efield, phases * hfield
+        nvoxels *= 4
+    elif mode == 'stream':
+        tmp_dir = tempfile.TemporaryDirectory()
+        efile = os.path.join(tmp_dir.name, 'e-field.h5')
+        hfile = os.path.join(tmp_dir.name, 'h-field.h5')
+        ofile = os.path.join(tmp_dir.name, 'materials.h5')
+        write_cst_field(efile, 'E-Field', *grid, efield)
+        write_cst_field(hfile, 'H-Field', *grid, hfield)
+        efield = hfield = None
+
+    rss_start = _peak_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == 'batch':
+        results = extract_materials_batch(f0, *grid, efield, hfield)
+        eps_est = results['epsilon_r_combined']
+        sigma_est = results['sigma_eff_combined']
+    elif mode == 'stream':
+        extract_materials_h5(f0, efile, hfile, ofile,
+                             max_slab_bytes=nvoxels * 320 // 8)
+        with h5py.File(ofile, 'r') as fh:
+            eps_est = np.transpose(fh['epsilon_r_weighted'][()], (2, 1, 0))
+            sigma_est = np.transpose(fh['sigma_eff_weighted'][()], (2, 1, 0))
+    else:
+        xf = NormalDielectric(f0, *grid, efield, hfield,
+                              workers=workers if mode == 'parallel' else 1,
+                              precision='single' if mode == 'single' else 'double',
+                              mask=mask if mode == 'masked' else None)
+        eps_est = xf.epsilon_r_weighted
+        sigma_est = xf.sigma_eff_weighted
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_end = _peak_rss_mb()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+    eps_max, eps_median = _relative_error(eps_est, eps_r, region)
+    sigma_max, sigma_median = _relative_error(sigma_est, sigma, region)
+    return {'mode': mode,
+            'voxels': nvoxels,
+            'seconds': elapsed,
+            'voxels_per_second': nvoxels / elapsed,
+            'peak_rss_mb': rss_end,
+            'rss_increase_mb': None if rss_end is None else rss_end - rss_start,
+            'peak_traced_mb': traced_peak / 1024.0**2,
+            'eps_r_max_error': eps_max,
+            'eps_r_median_error': eps_median,
+            'sigma_max_error': sigma_max,
+            'sigma_median_error': sigma_median}
+
+def run_benchmark(shape=(64, 64, 64), spacing=1.0e-3, f0=447.0, eps_r=50.0,
+                  sigma=0.6, modes=None, workers=None, isolate=True):
+    """Benchmark xmat execution modes on an analytic plane wave.
+    Args:
+        shape:   grid size (nx, ny, nz)
+        spacing: grid spacing (m)
+        f0:      frequency (MHz)
+        eps_r:   relative permittivity of the medium
+        sigma:   conductivity of the medium (S/m)
+        modes:   execution modes to run, default all of MODES
+        workers: worker processes for the 'parallel' mode, default CPU count
+        isolate: run each mode in a fresh process so peak RSS is per mode
+
+    Returns:
+        list of dicts, one per mode, with voxels/s, peak memory (RSS and
+        traced NumPy allocations, MB) and max/median relative error of the
+        |E_i|^2-weighted eps_r and sigma against the known medium.  The RSS
+        increase is measured past the high-water mark of building the
+        synthetic inputs, so it only shows extraction that needs more.
+    """
+    if modes is None:
+        modes = MODES
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError("Unknown mode: " + str(mode) +
+                             ", expected one of " + str(MODES))
+    args = (tuple(shape), spacing, f0, eps_r, sigma, workers)
+    if not isolate:
+        return [_run_mode(mode, *args) for mode in modes]
+    results = []
+    for mode in modes:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_run_mode, mode, *args).result())
+    return results
+
+def print_benchmark(results):
+    """Print benchmark results as a table.
+    """
+    print("{:>9} {:>12} {:>10} {:>10} {:>10} {:>10}".format(
+        'mode', 'voxels/s', 'rss (MB)', 'heap (MB)', 'eps err', 'sigma err'))
+    for res in results:
+        rss = res['rss_increase_mb']
+        print("{:>9} {:>12.4g} {:>10} {:>10.1f} {:>10.2e} {:>10.2e}".format(
+            res['mode'], res['voxels_per_second'],
+            '-' if rss is None else '{:.1f}'.format(rss),
+            res['peak_traced_mb'], res['eps_r_max_error'],
+            res['sigma_max_error']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark xmat on synthetic fields.")
+    parser.add_argument('-n', '--size', type=int, nargs=3, default=[64, 64, 64])
+    parser.add_argument('-d', '--spacing', type=float, default=1.0e-3)
+    parser.add_argument('-m', '--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    cli_args = parser.parse_args()
+    print_benchmark(run_benchmark(cli_args.size, cli_args.spacing,
+                                  modes=cli_args.modes,
+                                  workers=cli_args.workers))
@@ -0,0 +1,98 @@
+"""xmat_parallel: extract materials on several cores.
+The grid is split into halo-overlapped x-slabs that are processed in a
+process pool.  Fields and results live in shared memory, so only slab bounds
+and stencil weights are sent to the workers, and every voxel goes through
+the same kernel as the serial path.
+"""
+
+import os
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from .xmat import precision_dtypes, _curl, _materials_from_curl
+
+def _shared_array(shape, dtype):
+    """Allocate an array in a new shared memory block.
+    Returns the block, the array and the spec (name, shape, dtype) workers
+    use to attach to it.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf), \
+        (shm.name, shape, dtype.str)
+
+def _slab_worker(i0, i1, specs, weights, omega0, efsq_floor):
+    """Extract materials for the x-slab [i0, i1) from shared memory.
+    """
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    try:
+        e_field, h_field, sigma, eps_r, sigma_w, eps_r_w = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(shms, specs)]
+        # read H with a one-plane halo on each side
+        r0, r1 = max(i0 - 1, 0), min(i1 + 1, np.shape(h_field)[0])
+        wx, wy, wz = weights
+        curl_h = _curl(h_field[r0:r1], (wx[:, r0:r1], wy, wz))
+        # results go straight into the shared output arrays
+        _materials_from_curl(e_field[i0:i1], curl_h[:, i0 - r0:i1 - r0], omega0,
+                             efsq_floor, out=(sigma[:, i0:i1], eps_r[:, i0:i1],
+                                              sigma_w[i0:i1], eps_r_w[i0:i1]))
+        # drop the views before the shared memory is closed
+        del e_field, h_field, sigma, eps_r, sigma_w, eps_r_w
+    finally:
+        for shm in shms:
+            shm.close()
+
+def extract_materials_parallel(e_field, h_field, weights, omega0, workers=None,
+                               precision='double', efsq_floor=0.0):
+    """Extract material properties with a pool of worker processes.
+    Args:
+        e_field: E-field data (xdim)x(ydim)x(zdim)x(3)
+        h_field: H-field data (xdim)x(ydim)x(zdim)x(3)
+        weights: stencil weights of the x-, y- and z-axis
+        omega0:  angular frequency (rad/s)
+        workers: number of worker processes, defaults to the CPU count
+        precision: 'double' or 'single'; fields and results are held in
+                   shared memory at this precision
+        efsq_floor: floor on |E|^2 below which materials are set to zero
+
+    Returns:
+        sigma, eps_r, sigma_w, eps_r_w as returned by the serial kernel; the
+        results are bit-identical to the serial path.
+    """
+    cdtype, rdtype = precision_dtypes(precision)
+    if workers is None:
+        workers = os.cpu_count()
+    grid_shape = np.shape(e_field)[:-1]
+    nx = grid_shape[0]
+    nslabs = max(1, min(workers, nx))
+    bounds = np.linspace(0, nx, nslabs + 1).astype(int)
+
+    layout = [(np.shape(e_field), cdtype),
+              (np.shape(h_field), cdtype),
+              ((3,) + grid_shape, rdtype),
+              ((3,) + grid_shape, rdtype),
+              (grid_shape, rdtype),
+              (grid_shape, rdtype)]
+    blocks = []
+    try:
+        for shape, dtype in layout:
+            blocks.append(_shared_array(shape, dtype))
+        np.copyto(blocks[0][1], e_field)
+        np.copyto(blocks[1][1], h_field)
+        specs = [spec for _, _, spec in blocks]
+
+        tasks = [(i0, i1, specs, weights, omega0, efsq_floor)
+                 for i0, i1 in zip(bounds[:-1], bounds[1:]) if i1 > i0]
+        with Pool(min(workers, len(tasks))) as pool:
+            pool.starmap(_slab_worker, tasks)
+
+        results = tuple(np.array(array) for _, array, _ in blocks[2:])
+    finally:
+        shms = [shm for shm, _, _ in blocks]
+        # drop the views before the shared memory is closed
+        blocks.clear()
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    return results
@@ -0,0 +1,141 @@
+"""xmat_stream: extract materials slab by slab from CST HDF5 field exports.
+Fields are read in z-slabs with a one-cell halo and the material properties
+of each slab are written straight to an HDF5 output file, so peak memory is
+bounded by the slab budget instead of the grid size.
+"""
+
+from contextlib import ExitStack
+import numpy as np
+import h5py
+from .xmat import precision_dtypes, stencil_weights, _curl, _materials_from_curl
+
+E_FIELD_KEY = 'E-Field'
+H_FIELD_KEY = 'H-Field'
+J_FIELD_KEY = 'Conduction Current Density'
+
+# approximate working memory per voxel of a slab (bytes): E, H, curl,
+# derivative temporaries and material outputs in double precision
+BYTES_PER_VOXEL = 320
+DEFAULT_SLAB_BYTES = 2**30
+
+def slab_thickness(nx, ny, max_slab_bytes, bytes_per_voxel=BYTES_PER_VOXEL):
+    """Return the number of z-planes per slab, excluding the two halo planes,
+    that keeps the working memory of a slab within max_slab_bytes.
+    """
+    return max(1, int(max_slab_bytes // (nx * ny * bytes_per_voxel)) - 2)
+
+def _component_re_im(node, k0, k1):
+    """Return real and imaginary z-planes [k0, k1) of one field component.
+    """
+    if isinstance(node, h5py.Dataset):
+        data = node[k0:k1]
+        return data['re'], data['im']
+    return node['re'][k0:k1], node['im'][k0:k1]
+
+def read_cst_slab(field_node, k0, k1, dtype=np.complex128):
+    """Read z-planes [k0, k1) of a CST field export.
+    The export is stored (zdim)x(ydim)x(xdim), either as a compound dataset
+    or as a group of x/y/z components; the slab is returned as dtype
+    (xdim)x(ydim)x(k1-k0)x(3).
+    """
+    if isinstance(field_node, h5py.Dataset):
+        data = field_node[k0:k1]
+        parts = [(data[c]['re'], data[c]['im']) for c in 'xyz']
+    else:
+        parts = [_component_re_im(field_node[c], k0, k1) for c in 'xyz']
+    nz, ny, nx = np.shape(parts[0][0])
+    slab = np.empty((nx, ny, nz, 3), dtype=dtype)
+    for i, (part_re, part_im) in enumerate(parts):
+        slab[:, :, :, i].real = np.transpose(part_re, (2, 1, 0))
+        slab[:, :, :, i].imag = np.transpose(part_im, (2, 1, 0))
+    return slab
+
+def _check_mesh(fh, mesh, filename, efield_file):
+    """Raise ValueError unless the mesh lines of the open export fh equal
+    mesh, the mesh lines of the E-field export.
+    """
+    for c, mesh_line in zip('xyz', mesh):
+        other = fh['Mesh line ' + c][()]
+        if not np.array_equal(other, mesh_line):
+            raise ValueError("Mesh line " + c + " of " + str(filename) +
+                             " (" + str(len(other)) + " points) differs from " +
+                             str(efield_file) + " (" + str(len(mesh_line)) +
+                             " points)")
+
+def extract_materials_h5(f0, efield_file, hfield_file, output_file,
+                         jfield_file=None, max_slab_bytes=DEFAULT_SLAB_BYTES,
+                         mesh_scale=1.0e-3, precision='double', efsq_floor=0.0):
+    """Extract material properties from CST E- and H-field exports one z-slab
+    at a time.
+    Args:
+        f0:             Frequency in MHz
+        efield_file:    CST E-field export (.h5)
+        hfield_file:    CST H-field export (.h5) on the same grid
+        output_file:    HDF5 file for the results
+        jfield_file:    optional CST conduction current density export (.h5)
+        max_slab_bytes: working memory budget of a single slab
+        mesh_scale:     conversion of the mesh lines to meters (CST: mm)
+        precision:      'double' or 'single' for the slabs and the output
+        efsq_floor:     floor on |E|^2 below which materials are set to zero
+
+    The output file holds 'sigma_eff' and 'epsilon_r' (x-direction),
+    'sigma_eff_weighted' and 'epsilon_r_weighted' (|E_i|^2-weighted), and
+    'sigma_eff_from_currents' when a current density export is given.  The
+    datasets use the (zdim)x(ydim)x(xdim) layout of the CST exports and the
+    mesh lines are copied from the E-field export.  ValueError is raised
+    when the mesh lines of the other exports differ from the E-field export.
+    """
+    cdtype, rdtype = precision_dtypes(precision)
+    frequency = f0 * 1.0e6
+    omega0 = 2.0 * np.pi * frequency
+    with ExitStack() as stack:
+        ef = stack.enter_context(h5py.File(efield_file, 'r'))
+        hf = stack.enter_context(h5py.File(hfield_file, 'r'))
+        jf = None
+        if jfield_file is not None:
+            jf = stack.enter_context(h5py.File(jfield_file, 'r'))
+        mesh = [ef['Mesh line ' + c][()] for c in 'xyz']
+        for other, other_file in [(hf, hfield_file), (jf, jfield_file)]:
+            if other is not None:
+                _check_mesh(other, mesh, other_file, efield_file)
+        out = stack.enter_context(h5py.File(output_file, 'w'))
+
+        for c, mesh_line in zip('xyz', mesh):
+            out['Mesh line ' + c] = mesh_line
+        out.attrs['frequency'] = f0
+        wx, wy, wz = [stencil_weights(mesh_line * mesh_scale, dtype=rdtype)
+                      for mesh_line in mesh] # meters
+        nx, ny, nz = [len(mesh_line) for mesh_line in mesh]
+
+        keys = ['sigma_eff', 'epsilon_r', 'sigma_eff_weighted',
+                'epsilon_r_weighted']
+        for key in keys:
+            out.create_dataset(key, shape=(nz, ny, nx), dtype=rdtype,
+                               chunks=(1, ny, nx))
+        if jf is not None:
+            out.create_dataset('sigma_eff_from_currents', shape=(nz, ny, nx, 3),
+                               dtype=rdtype, chunks=(1, ny, nx, 3))
+
+        nk = slab_thickness(nx, ny, max_slab_bytes,
+                            BYTES_PER_VOXEL * np.dtype(rdtype).itemsize // 8)
+        for k0 in range(0, nz, nk):
+            k1 = min(k0 + nk, nz)
+            # read with a one-plane halo on each side
+            r0, r1 = max(k0 - 1, 0), min(k1 + 1, nz)
+            h_slab = read_cst_slab(hf[H_FIELD_KEY], r0, r1, cdtype)
+            curl_h = _curl(h_slab, (wx, wy, wz[:, r0:r1]))
+            del h_slab
+            own = slice(k0 - r0, k1 - r0)
+            e_slab = read_cst_slab(ef[E_FIELD_KEY], k0, k1, cdtype)
+            sigma, eps_r, sigma_w, eps_r_w = _materials_from_curl(
+                e_slab, curl_h[..., own], omega0, efsq_floor)
+            del curl_h
+            for key, value in zip(keys, [sigma[0], eps_r[0], sigma_w, eps_r_w]):
+                out[key][k0:k1] = np.transpose(value, (2, 1, 0))
+            if jf is not None:
+                j_slab = read_cst_slab(jf[J_FIELD_KEY], k0, k1, cdtype)
+                has_field = (e_slab.real**2 + e_slab.imag**2) > efsq_floor
+                np.divide(j_slab, e_slab, out=j_slab, where=has_field)
+                j_slab[~has_field] = 0.0
+                out['sigma_eff_from_currents'][k0:k1] = np.transpose(
+                    np.abs(j_slab), (2, 1, 0, 3))
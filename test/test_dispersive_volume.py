@@ -0,0 +1,79 @@
+"""
+Unit tests for rfutils.material_mapper dispersive property volumes.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import h5py
+from rfutils.colecole.colecole_coeffs import tissue_colecole
+from rfutils.material_mapper.dispersive_volume import (dispersive_table,
+                                                       map_dispersive,
+                                                       map_dispersive_h5)
+
+TISSUES = ['Fat (Not Infiltrated)', 'Muscle', 'Blood']
+
+class TestDispersiveVolume(unittest.TestCase):
+    """Tests for frequency sweeps of tissue index volumes"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.freqs = np.array([64e6, 128e6, 297e6, 447e6])
+        rng = np.random.default_rng(3)
+        self.index = rng.integers(0, len(TISSUES), (9, 8, 7)).astype(np.uint8)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_dispersive_table(self):
+        """
+        Test the property table against ColeCole models at every frequency.
+        """
+        tissues = [tissue_colecole(name) for name in TISSUES]
+        epsr, sigma = dispersive_table(tissues, self.freqs)
+        self.assertEqual((4, 3), epsr.shape)
+        for i, name in enumerate(TISSUES):
+            for j, freq in enumerate(self.freqs):
+                model = tissue_colecole(name, freq)
+                self.assertAlmostEqual(epsr[j, i], model.epsilon_r)
+                self.assertAlmostEqual(sigma[j, i], model.sigma_eff)
+        names_epsr, _ = dispersive_table(TISSUES, self.freqs)
+        self.assertTrue(np.allclose(names_epsr, epsr, rtol=1e-12, atol=0))
+        with self.assertRaises(ValueError):
+            dispersive_table([1.0, 2.0], self.freqs)
+
+    def test_map_dispersive(self):
+        """
+        Test that every voxel gathers its tissue at every frequency.
+        """
+        epsr, sigma = dispersive_table(TISSUES, self.freqs)
+        eps_volume, sigma_volume = map_dispersive(self.index, TISSUES, self.freqs)
+        self.assertEqual((4, 9, 8, 7), eps_volume.shape)
+        for j in range(len(self.freqs)):
+            np.testing.assert_array_equal(eps_volume[j], epsr[j][self.index])
+            np.testing.assert_array_equal(sigma_volume[j], sigma[j][self.index])
+        with self.assertRaises(ValueError):
+            map_dispersive(self.index + 1, TISSUES, self.freqs)
+
+    def test_map_dispersive_h5(self):
+        """
+        Test streaming an HDF5 index volume to HDF5 with a frequency axis.
+        """
+        index_file = os.path.join(self.tmp_dir.name, 'index.h5')
+        output_file = os.path.join(self.tmp_dir.name, 'sweep.h5')
+        with h5py.File(index_file, 'w') as fh:
+            fh['index'] = self.index
+        calls = []
+        with h5py.File(index_file, 'r') as fh:
+            map_dispersive_h5(fh['index'], TISSUES, self.freqs, output_file,
+                              chunk_voxels=120, progress=lambda *args: calls.append(args))
+        expected = map_dispersive(self.index, TISSUES, self.freqs)
+        with h5py.File(output_file, 'r') as fh:
+            np.testing.assert_array_equal(fh['frequencies'][()], self.freqs)
+            self.assertEqual(fh['tissues'][2], b'Blood')
+            for key, volume in zip(['eps', 'sigma'], expected):
+                np.testing.assert_array_equal(fh[key][()], volume)
+                self.assertEqual((1, 1, 8, 7), fh[key].chunks)
+        self.assertEqual([done for done, _, _ in calls], [112, 224, 336, 448, 504])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,19 @@ Unit tests for rfutils.MaterialMapper, the mapping utility to estimated
 material from properties.
 """
 import os
+import tempfile
 import unittest
+import numpy as np
+from scipy.constants import epsilon_0
 from rfutils.material_mapper import Material, MaterialsDB, \
                                     MaterialsDBVirtualFamily, MaterialMapper
+from rfutils.colecole.colecole import ColeCole
+from test.test_material_mapping import VMAT, write_vmat
+
+# Gabriel 4-pole Cole-Cole parameters of muscle
+MUSCLE = ColeCole(4.0, 0.2, [50.0, 7000.0, 1.2e6, 2.5e7],
+                  [7.234e-12, 353.678e-9, 318.310e-6, 2.274e-3],
+                  [0.1, 0.1, 0.1, 0.0])
 
 class TestMaterialMapper(unittest.TestCase):
     """Unit tests for material mapping.
@@ -65,6 +75,75 @@ class TestMaterialMapper(unittest.TestCase):
         self.assertIsInstance(matdb_vmat, MaterialsDBVirtualFamily)
         self.assertEqual(matdb_vmat._vmat_filename, self.vmat_filename)
 
+    def test_materialsdb_properties(self):
+        """Properties of all materials are returned by id at a frequency.
+        """
+        matdb = MaterialsDB()
+        self.assertEqual(matdb.add_material(Material(name="Air")), 0)
+        self.assertEqual(matdb.add_material(Material(name="Muscle"), MUSCLE), 1)
+        matdb.add_material(Material(name="Gel", epsr=70.0, sigma=0.5,
+                                    density=1000.0))
+        self.assertEqual(len(matdb), 3)
+        self.assertIn("Gel", matdb)
+        self.assertEqual(matdb.material_id("Gel"), 2)
+        with self.assertRaises(KeyError):
+            matdb.add_material(Material(name="Gel"))
+        for frequency in [64.0e6, 128.0e6, 297.0e6, 447.0e6]:
+            epsr, sigma = matdb.properties(frequency)
+            epsilon = ColeCole(MUSCLE.ef, MUSCLE.sigma, MUSCLE.deltas,
+                               MUSCLE.taus, MUSCLE.alphas, frequency).epsilon
+            self.assertAlmostEqual(epsr[1], epsilon.real)
+            self.assertAlmostEqual(sigma[1], -epsilon.imag * 2.0 * np.pi *
+                                   frequency * epsilon_0)
+            np.testing.assert_array_equal(epsr[[0, 2]], [1.0, 70.0])
+            np.testing.assert_array_equal(sigma[[0, 2]], [0.0, 0.5])
+        # muscle at 447 MHz: eps_r ~ 56, sigma ~ 0.8 S/m
+        self.assertAlmostEqual(epsr[1], 56.0, delta=1.0)
+        self.assertAlmostEqual(sigma[1], 0.8, delta=0.05)
+        muscle = matdb.material("Muscle", 447.0e6)
+        self.assertEqual((muscle.epsr, muscle.sigma), (epsr[1], sigma[1]))
+        self.assertEqual(matdb.material("Gel").density, 1000.0)
+
+    def test_materialsdb_cache(self):
+        """Frequencies are cached with least recently used eviction.
+        """
+        matdb = MaterialsDB(cache_size=2)
+        matdb.add_material(Material(name="Muscle"), MUSCLE)
+        first = matdb.properties(64.0e6)
+        self.assertIs(matdb.properties(64.0e6), first)
+        matdb.properties(128.0e6)
+        matdb.properties(64.0e6)
+        matdb.properties(297.0e6)
+        self.assertIs(matdb.properties(64.0e6), first)
+        self.assertFalse(first[0].flags.writeable)
+        matdb.add_material(Material(name="Air"))
+        self.assertEqual(len(matdb.properties(64.0e6)[0]), 2)
+
+    def test_materialsdb_vmat(self):
+        """The virtual family data base reads the material file on first use.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vmat_filename = os.path.join(tmp_dir, 'materials.vmat')
+            write_vmat(vmat_filename)
+            matdb_vmat = MaterialsDBVirtualFamily(vmat_filename)
+            self.assertEqual(len(matdb_vmat), 6)
+        epsr, sigma = matdb_vmat.properties(447.0e6)
+        self.assertEqual(epsr[matdb_vmat.material_id("Muscle")], 57.5)
+        self.assertEqual(sigma[matdb_vmat.material_id("Blood")], 1.35)
+        self.assertEqual(matdb_vmat.density[matdb_vmat.material_id("Fat")], 911.0)
+
+    def test_materialsdb_vmat_repeated(self):
+        """Repeated material names keep the first row.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vmat_filename = os.path.join(tmp_dir, 'materials.vmat')
+            write_vmat(vmat_filename, VMAT + "Muscle 6 60.0 1.0 0.9 1000 0 0 0 0\n")
+            matdb_vmat = MaterialsDBVirtualFamily(vmat_filename)
+            self.assertEqual(len(matdb_vmat), 6)
+        epsr, sigma = matdb_vmat.properties(447.0e6)
+        self.assertEqual(epsr[matdb_vmat.material_id("Muscle")], 57.5)
+        self.assertEqual(sigma[matdb_vmat.material_id("Muscle")], 0.80)
+
     def test_materialsdb_reader(self):
         """Test the ability to load a materials file and create a dictionary
         """
@@ -0,0 +1,265 @@
+"""
+Unit tests for rfutils.MaterialMapper mapping of derived properties onto a
+material table.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import h5py
+from rfutils.material_mapper import MaterialMapper, MaterialVolume
+from rfutils.material_mapper.material_volume import index_dtype
+from rfutils.material_mapper import material_mapper
+from rfutils.material_mapper.material_mapper import nearest_index
+from rfutils import xmat
+from rfutils.xmat.xmat_benchmark import plane_wave_fields
+
+# Name, id, Eps, Mu, Kappa, Rho, K, HeatCap, BloodFlow, Metabolic
+VMAT = """# test materials
+// kappa at 447 MHz
+Air 0 1.0 1.0 0.0 1.2 0.03 1000 0 0
+Fat 1 11.5 1.0 0.08 911 0.21 2348 33 0.5
+Bone_Marrow 2 5.6 1.0 0.08 1029 0.28 2666 32 5.7
+Muscle 3 57.5 1.0 0.80 1090 0.49 3421 39 1.0
+Blood 4 63.6 1.0 1.35 1050 0.52 3617 10000 0
+Skin 5 46.1 1.0 0.70 1109 0.37 3391 106 1.7
+"""
+
+def write_vmat(filename, text=VMAT):
+    """Write a material table in the .vmat layout.
+    """
+    with open(filename, 'w') as fh:
+        fh.write(text)
+
+def argmin_index(table, values):
+    """Reference nearest-material lookup, one voxel at a time.
+    """
+    return np.array([np.argmin(np.sqrt(np.square(table - k)))
+                     for k in np.ravel(values)]).reshape(np.shape(values))
+
+class TestMaterialMapping(unittest.TestCase):
+    """Unit tests for nearest-material mapping."""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.vmat_filename = os.path.join(self.tmp_dir.name, 'materials.vmat')
+        write_vmat(self.vmat_filename)
+        self.mapper = MaterialMapper(self.vmat_filename)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_materials(self):
+        """Typed property columns are read from the material file.
+        """
+        self.assertEqual(len(self.mapper.mat), 6)
+        np.testing.assert_array_equal(self.mapper.kappa,
+                                      [0.0, 0.08, 0.08, 0.8, 1.35, 0.7])
+        np.testing.assert_array_equal(self.mapper.eps,
+                                      [1.0, 11.5, 5.6, 57.5, 63.6, 46.1])
+        self.assertEqual(self.mapper.mat['HeatCap'].dtype, np.float64)
+        self.assertEqual(self.mapper.name_index['Muscle'], 3)
+        muscle = self.mapper.mat[self.mapper.name_index['Muscle']]
+        self.assertEqual(muscle[self.mapper.value_index['Kappa']], 0.8)
+        self.assertEqual(muscle['Material'], 'Muscle')
+
+    def test_material_cache(self):
+        """The parsed table is cached next to the file until the file changes.
+        """
+        self.assertTrue(os.path.exists(self.vmat_filename + '.npz'))
+        with mock.patch.object(material_mapper, 'parse_vmat',
+                               side_effect=AssertionError('parsed again')):
+            mapper = MaterialMapper(self.vmat_filename)
+        np.testing.assert_array_equal(mapper.mat, self.mapper.mat)
+        write_vmat(self.vmat_filename, VMAT + "Bone 6 12.4 1.0 0.08 1908 0.32 1313 10 0.2\n")
+        os.utime(self.vmat_filename, ns=(0, 0))
+        mapper = MaterialMapper(self.vmat_filename)
+        self.assertEqual(len(mapper.mat), 7)
+        self.assertEqual(mapper.name_index['Bone'], 6)
+        uncached = MaterialMapper(self.vmat_filename, cache=False)
+        np.testing.assert_array_equal(uncached.mat, mapper.mat)
+
+    def test_material_cache_refresh(self):
+        """A touched file is hashed once; a corrupt sidecar is rewritten.
+        """
+        sidecar = self.vmat_filename + '.npz'
+        os.utime(self.vmat_filename, ns=(0, 0))
+        with mock.patch.object(material_mapper, 'parse_vmat',
+                               side_effect=AssertionError('parsed again')):
+            MaterialMapper(self.vmat_filename)
+            with mock.patch.object(material_mapper, '_file_digest',
+                                   side_effect=AssertionError('hashed again')):
+                mapper = MaterialMapper(self.vmat_filename)
+        np.testing.assert_array_equal(mapper.mat, self.mapper.mat)
+        for damage in [b'', b'not a zip file']:
+            with open(sidecar, 'wb') as fh:
+                fh.write(damage)
+            mapper = MaterialMapper(self.vmat_filename)
+            np.testing.assert_array_equal(mapper.mat, self.mapper.mat)
+        with open(sidecar, 'rb') as fh:
+            data = fh.read()
+        with open(sidecar, 'wb') as fh:
+            fh.write(data[:len(data) // 2])
+        mapper = MaterialMapper(self.vmat_filename)
+        np.testing.assert_array_equal(mapper.mat, self.mapper.mat)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ['materials.vmat', 'materials.vmat.npz'])
+
+    def test_nearest_index_matches_argmin(self):
+        """Binary search gives the argmin result, ties included.
+        """
+        rng = np.random.default_rng(7)
+        table = rng.choice([0.0, 0.08, 0.3, 0.7, 0.8, 1.35], size=40)
+        values = np.concatenate([rng.uniform(-0.5, 2.0, 2000),
+                                 table,
+                                 # midpoints are equally near two entries
+                                 (table[:-1] + table[1:]) / 2.0,
+                                 [0.04, 0.75, -1.0, 10.0]])
+        np.testing.assert_array_equal(nearest_index(table, values),
+                                      argmin_index(table, values))
+
+    def test_nearest_index_non_finite(self):
+        """NaN and infinite values map like argmin.
+        """
+        table = np.array([0.5, 0.1, 0.9])
+        values = np.array([np.nan, np.inf, -np.inf, 1.0e300, 0.2])
+        with np.errstate(over='ignore', invalid='ignore'):
+            expected = argmin_index(table, values)
+        with np.errstate(over='ignore', invalid='ignore'):
+            index = nearest_index(table, values)
+        np.testing.assert_array_equal(index, expected)
+        table[2] = np.nan
+        np.testing.assert_array_equal(nearest_index(table, values[-1:]), [2])
+
+    def test_map_materials(self):
+        """Mapped volumes take their properties from the nearest material.
+        """
+        kappa = np.array([[[0.0, 0.05], [0.78, 2.0]],
+                          [[0.71, 0.4], [1.0, 0.08]]])
+        mapped_kappa, mapped_eps, mapped_rho = self.mapper.map_materials(kappa)
+        self.assertEqual(np.shape(mapped_kappa), np.shape(kappa))
+        ind = argmin_index(self.mapper.kappa, kappa)
+        np.testing.assert_array_equal(mapped_kappa, self.mapper.kappa[ind])
+        np.testing.assert_array_equal(mapped_eps, self.mapper.eps[ind])
+        np.testing.assert_array_equal(mapped_rho, self.mapper.rho[ind])
+        # fat and bone marrow share kappa: the first listed wins
+        self.assertEqual(mapped_eps[1, 1, 1], 11.5)
+
+    def test_nearest_materials(self):
+        """Permittivity separates materials of equal conductivity.
+        """
+        volumes = {'Eps': np.array([6.0, 11.0, 55.0, 1.0]),
+                   'Kappa': np.array([0.08, 0.08, 0.75, 0.01])}
+        np.testing.assert_array_equal(self.mapper.nearest_materials(volumes),
+                                      [2, 1, 3, 0])
+        # conductivity alone cannot tell fat from bone marrow
+        self.assertEqual(self.mapper.map_materials(volumes['Kappa'])[1][0], 11.5)
+        self.assertEqual(self.mapper.map_properties(volumes)[1][0], 5.6)
+        # non-finite voxels map like the conductivity-only lookup
+        volumes = {'Eps': np.array([np.nan, 6.0, 11.0, np.inf]),
+                   'Kappa': np.array([0.08, -np.inf, 0.08, np.nan])}
+        map_ind = self.mapper.nearest_materials(volumes)
+        np.testing.assert_array_equal(map_ind, [0, 0, 1, 0])
+        np.testing.assert_array_equal(map_ind[[1, 3]],
+                                      nearest_index(self.mapper.kappa, volumes['Kappa'][[1, 3]]))
+
+    def test_nearest_materials_normalized(self):
+        """The KD-tree finds the nearest material in normalized space.
+        """
+        rng = np.random.default_rng(3)
+        volumes = {'Eps': rng.uniform(1.0, 70.0, (6, 5, 4)),
+                   'Kappa': rng.uniform(0.0, 1.5, (6, 5, 4)),
+                   'Rho': rng.uniform(0.0, 1200.0, (6, 5, 4))}
+        scale = np.array([20.0, 0.5, 400.0])
+        table = np.column_stack([self.mapper.eps, self.mapper.kappa,
+                                 self.mapper.rho]) / scale
+        points = np.stack([volumes[p] for p in ['Eps', 'Kappa', 'Rho']],
+                          axis=-1) / scale
+        dist = np.sum(np.square(points[..., np.newaxis, :] - table), axis=-1)
+        map_ind = self.mapper.nearest_materials(volumes, scale, workers=2)
+        np.testing.assert_array_equal(map_ind, np.argmin(dist, axis=-1))
+        with self.assertRaises(ValueError):
+            self.mapper.nearest_materials({'Eps': volumes['Eps'],
+                                           'Kappa': volumes['Kappa'][0]})
+
+    def test_map_dielectric(self):
+        """Materials extracted by xmat map back onto the simulated tissue.
+        """
+        f0 = 447.0
+        grid = np.arange(8) * 1.0e-3
+        efield, hfield = plane_wave_fields(f0, 57.5, 0.8, grid, grid, grid)
+        dielectric = xmat.NormalDielectric(f0, grid, grid, grid, efield, hfield)
+        mapped_kappa, mapped_eps, _ = self.mapper.map_dielectric(dielectric)
+        np.testing.assert_array_equal(mapped_kappa[1:-2, 1:-2, 1:-2], 0.8)
+        np.testing.assert_array_equal(mapped_eps[1:-2, 1:-2, 1:-2], 57.5)
+
+    def test_compact_map_materials(self):
+        """A material index volume gives the mapped properties on access.
+        """
+        rng = np.random.default_rng(11)
+        kappa = rng.uniform(0.0, 1.5, (7, 6, 5))
+        volume = self.mapper.map_materials(kappa, compact=True)
+        self.assertIsInstance(volume, MaterialVolume)
+        self.assertEqual(volume.index.dtype, np.uint8)
+        self.assertEqual(volume.shape, kappa.shape)
+        for mapped, view in zip(self.mapper.map_materials(kappa),
+                                [volume.kappa, volume.eps, volume.rho]):
+            np.testing.assert_array_equal(np.asarray(view), mapped)
+            np.testing.assert_array_equal(view[2:4, :, 1], mapped[2:4, :, 1])
+        self.assertEqual(volume.kappa.shape, kappa.shape)
+        np.testing.assert_array_equal(volume.property_view('HeatCap')[0, 0],
+                                      self.mapper.mat['HeatCap'][volume.index[0, 0]])
+        with self.assertRaises(KeyError):
+            volume.property_view('Sar')
+        volumes = {'Eps': rng.uniform(1.0, 70.0, kappa.shape), 'Kappa': kappa}
+        compact = self.mapper.map_properties(volumes, compact=True)
+        np.testing.assert_array_equal(compact.index,
+                                      self.mapper.nearest_materials(volumes))
+
+    def test_map_materials_h5(self):
+        """HDF5-backed volumes are mapped chunk by chunk to HDF5 output.
+        """
+        rng = np.random.default_rng(5)
+        kappa = rng.uniform(0.0, 1.5, (9, 8, 7))
+        kappa_file = os.path.join(self.tmp_dir.name, 'kappa.h5')
+        output_file = os.path.join(self.tmp_dir.name, 'mapped.h5')
+        with h5py.File(kappa_file, 'w') as fh:
+            fh['kappa'] = kappa
+        expected = self.mapper.map_materials(kappa)
+        calls = []
+        for workers in [1, 2]:
+            with h5py.File(kappa_file, 'r') as fh:
+                self.mapper.map_materials_h5(fh['kappa'], output_file,
+                                             workers=workers, chunk_voxels=120,
+                                             progress=lambda *args: calls.append(args))
+            with h5py.File(output_file, 'r') as fh:
+                for key, mapped in zip(['kappa', 'eps', 'rho'], expected):
+                    np.testing.assert_array_equal(fh[key][()], mapped)
+                    self.assertEqual(fh[key].compression, 'gzip')
+                self.assertEqual(fh['materials']['Material'][3], b'Muscle')
+        # two planes per chunk: five chunks per run
+        self.assertEqual([done for done, _, _ in calls[:5]],
+                         [112, 224, 336, 448, 504])
+        self.assertEqual(calls[-1][:2], (504, 504))
+        self.mapper.map_materials_h5(kappa, output_file, workers=2,
+                                     compression_opts=None)
+        with h5py.File(output_file, 'r') as fh:
+            np.testing.assert_array_equal(fh['kappa'][()], expected[0])
+            self.assertEqual(fh['kappa'].compression_opts, 4)
+        self.mapper.map_materials_h5(kappa, output_file, compact=True,
+                                     chunk_voxels=100)
+        with h5py.File(output_file, 'r') as fh:
+            self.assertEqual(fh['material_index'].dtype, np.uint8)
+            np.testing.assert_array_equal(
+                fh['material_index'][()],
+                self.mapper.map_materials(kappa, compact=True).index)
+
+    def test_index_dtype(self):
+        """Index volumes use the smallest unsigned integer type.
+        """
+        self.assertEqual(index_dtype(256), np.uint8)
+        self.assertEqual(index_dtype(257), np.uint16)
+        self.assertEqual(index_dtype(70000), np.uint32)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Unit tests for reorder vopgen channels.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import hdf5storage
+from rfutils.vopgen.reorder_vopgen_channels import (read_channel_map,
+                                                    reorder_vopgen_channels)
+
+REMAP = """# Remap 4 tx
+1 4
+2 3
+
+3 1
+4 2
+"""
+
+class TestReorderVopgenChannels(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.remap_file = os.path.join(self.tmp_dir.name, 'remap.txt')
+        with open(self.remap_file, 'w') as fh:
+            fh.write(REMAP)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_remap(self, text):
+        """Write a channel map file and return its name.
+        """
+        remap_file = os.path.join(self.tmp_dir.name, 'bad_remap.txt')
+        with open(remap_file, 'w') as fh:
+            fh.write(text)
+        return remap_file
+
+    def test_read_channel_map(self):
+        """ Channel maps are 0-based (original, remapped) pairs.
+        """
+        np.testing.assert_array_equal(read_channel_map(self.remap_file, 4),
+                                      [[0, 3], [1, 2], [2, 0], [3, 1]])
+        with self.assertRaises(ValueError):
+            read_channel_map(self.remap_file, 5)
+        for text in ["1 2\n2 2\n", "1 2\n3 1\n", "1 2\n2 x\n", "1 2 3\n2 1 3\n"]:
+            with self.assertRaises(ValueError):
+                read_channel_map(self.write_remap(text))
+
+    def test_reorder_vopgen_channels(self):
+        """ Channels are copied block by block to their remapped index.
+        """
+        rng = np.random.default_rng(2)
+        for field_key in ['efMapArrayN', 'bfMapArrayN']:
+            field = rng.standard_normal((4, 5, 6, 3, 4)) + \
+                1j*rng.standard_normal((4, 5, 6, 3, 4))
+            fields = {'XDim': np.arange(4.0), 'YDim': np.arange(5.0),
+                      'ZDim': np.arange(6.0), field_key: field}
+            old_file = os.path.join(self.tmp_dir.name, field_key + '_old.mat')
+            new_file = os.path.join(self.tmp_dir.name, 'new.mat')
+            hdf5storage.savemat(old_file, fields, oned_as='column')
+            reorder_vopgen_channels(self.remap_file, old_file, new_file, block_bytes=100)
+            remapped = hdf5storage.loadmat(new_file)
+            np.testing.assert_array_equal(remapped[field_key][..., [3, 2, 0, 1]], field)
+            np.testing.assert_array_equal(remapped['YDim'], fields['YDim'])
+        with self.assertRaises(ValueError):
+            reorder_vopgen_channels(self.write_remap("1 1\n2 2\n"), old_file, new_file)
+        with self.assertRaises(ValueError):
+            reorder_vopgen_channels(self.remap_file, old_file, old_file)
+
+if __name__ == "__main__":
+    unittest.main()
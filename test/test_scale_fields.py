@@ -1,7 +1,11 @@
 """Unit tests for scale fields.
 """
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
+import hdf5storage
 import rfutils.vopgen as rfvopgen
 
 class TestScaleFields(unittest.TestCase):
@@ -33,7 +37,51 @@ class TestScaleFields(unittest.TestCase):
         self.assertIsInstance(rfvopgen.scale_fields(scales, vopfield3d),
                               dict)
 
-    
+
+    def test_scale_fields_channels(self):
+        """ Scale every channel of an in-memory field.
+        """
+        rng = np.random.default_rng(0)
+        field = rng.standard_normal((4, 5, 6, 3, 2)) + 1j*rng.standard_normal((4, 5, 6, 3, 2))
+        scales = np.array([2.0, 0.5j])
+        sf = rfvopgen.scale_fields(scales, {"XDim": np.arange(4.0), "bfMapArrayN": field})
+        self.assertTrue(np.allclose(sf["bfMapArrayN"], field*scales))
+        np.testing.assert_array_equal(sf["XDim"], np.arange(4.0))
+        with self.assertRaises(ValueError):
+            rfvopgen.scale_fields(np.ones(3), {"bfMapArrayN": field})
+
+    def test_scale_fields_h5(self):
+        """ Stream a MATLAB v7.3 field file into a new file and in place.
+        """
+        rng = np.random.default_rng(1)
+        field = rng.standard_normal((4, 5, 6, 3, 2)) + 1j*rng.standard_normal((4, 5, 6, 3, 2))
+        fields = {"XDim": np.arange(4.0), "YDim": np.arange(5.0),
+                  "ZDim": np.arange(6.0), "efMapArrayN": field}
+        scales = np.array([2.0, 0.5j])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            field_file = os.path.join(tmp_dir, "efMapArrayN_no_scale.mat")
+            scaled_file = os.path.join(tmp_dir, "efMapArrayN.mat")
+            hdf5storage.savemat(field_file, fields, oned_as='column')
+            calls = []
+            # 7 complex values per block
+            rfvopgen.scale_fields_h5(scales, field_file, scaled_file, block_bytes=7*16,
+                                     progress=lambda *args: calls.append(args))
+            scaled = hdf5storage.loadmat(scaled_file)
+            self.assertTrue(np.allclose(scaled["efMapArrayN"], field*scales))
+            np.testing.assert_array_equal(scaled["ZDim"], fields["ZDim"])
+            with open(field_file, 'rb') as src, open(scaled_file, 'rb') as dst:
+                self.assertEqual(src.read(128), dst.read(128))
+            self.assertEqual(calls[-1][:2], (field.size, field.size))
+            self.assertTrue(all(done1 - done0 <= 7 for (done0, _, _), (done1, _, _)
+                                in zip(calls[:-1], calls[1:])))
+
+            in_place_file = os.path.join(tmp_dir, "in_place.mat")
+            shutil.copyfile(field_file, in_place_file)
+            rfvopgen.scale_fields_h5(scales, in_place_file)
+            self.assertTrue(np.allclose(hdf5storage.loadmat(in_place_file)["efMapArrayN"],
+                                        field*scales))
+            with self.assertRaises(ValueError):
+                rfvopgen.scale_fields_h5(np.ones(3), field_file, scaled_file)
 
     def tearDown(self):
         pass
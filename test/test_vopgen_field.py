@@ -0,0 +1,60 @@
+"""Unit tests for the lazy vopgen field container.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import hdf5storage
+from rfutils.vopgen import VopgenField
+
+class TestVopgenField(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(4)
+        self.field = rng.standard_normal((4, 5, 6, 3, 2)) + \
+            1j*rng.standard_normal((4, 5, 6, 3, 2))
+        self.fields = {'XDim': np.arange(4.0), 'YDim': np.arange(5.0),
+                       'ZDim': np.linspace(0.0, 0.5, 6), 'bfMapArrayN': self.field}
+        self.field_file = os.path.join(self.tmp_dir.name, 'bfMapArrayN.mat')
+        hdf5storage.savemat(self.field_file, self.fields, oned_as='column')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_metadata(self):
+        """ Dimensions, kind and channels are read without the field.
+        """
+        with VopgenField(self.field_file) as field:
+            self.assertEqual(field.kind, 'bfMapArrayN')
+            self.assertEqual(field.shape, (4, 5, 6, 3, 2))
+            self.assertEqual(field.nchannels, 2)
+            self.assertEqual(field.ncomponents, 3)
+            self.assertEqual(field.dtype, np.complex128)
+            np.testing.assert_array_equal(field.ZDim, self.fields['ZDim'])
+            np.testing.assert_array_equal(field['YDim'], self.fields['YDim'])
+            self.assertIs(field['bfMapArrayN'], field)
+            self.assertEqual(field.z_index(0.29), 3)
+            with self.assertRaises(KeyError):
+                field['efMapArrayN']
+
+    def test_indexing(self):
+        """ Hyperslabs match the loadmat array in MATLAB axis order.
+        """
+        with VopgenField(self.field_file) as field:
+            for key in [(Ellipsis, 1), (slice(None), slice(None), 2, 0, 1),
+                        (1, 2, 3, 0, 1), (slice(None, None, -2),), (-1, Ellipsis),
+                        (slice(1, 3), Ellipsis, [1, 0])]:
+                np.testing.assert_array_equal(field[key], self.field[key])
+            np.testing.assert_array_equal(field.channel(0), self.field[..., 0])
+            np.testing.assert_array_equal(field.component(1, 1), self.field[:, :, :, 1, 1])
+            np.testing.assert_array_equal(field.z_slice(4), self.field[:, :, 4])
+            np.testing.assert_array_equal(np.asarray(field), self.field)
+            # a transposed view of the hyperslab, not a copy
+            self.assertTrue(field.channel(1).flags['F_CONTIGUOUS'])
+            with self.assertRaises(IndexError):
+                field[4]
+            with self.assertRaises(IndexError):
+                field[0, 0, 0, 0, 0, 0]
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Unit tests for the lazy vopgen field pipeline.
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import hdf5storage
+import rfutils.vopgen as rfvopgen
+from rfutils.vopgen import VopgenField, VopgenPipeline
+
+class TestVopgenPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rng = np.random.default_rng(5)
+        self.field = self.rng.standard_normal((6, 5, 7, 3, 4)) + \
+            1j*self.rng.standard_normal((6, 5, 7, 3, 4))
+        self.fields = {'XDim': np.arange(6.0), 'YDim': np.arange(5.0),
+                       'ZDim': np.linspace(0.0, 0.6, 7), 'bfMapArrayN': self.field}
+        self.field_file = os.path.join(self.tmp_dir.name, 'bfMapArrayN_orig.mat')
+        self.output_file = os.path.join(self.tmp_dir.name, 'bfMapArrayN.mat')
+        hdf5storage.savemat(self.field_file, self.fields, oned_as='column')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fused_steps(self):
+        """ scale -> reorder -> mask -> crop -> mask in one pass.
+        """
+        scales = np.array([1.0, 2.0j, 3.0, 0.5])
+        coil_map = np.array([[0, 3], [1, 2], [2, 0], [3, 1]])
+        mask1 = self.rng.random((6, 5, 7)) > 0.3
+        mask2 = self.rng.random((4, 3, 5))
+        pipeline = VopgenPipeline(self.field_file).scale(scales).reorder(coil_map) \
+            .mask(mask1).crop(x=(1, 5), y=(1, 4)).crop(z=(2, None)).mask(mask2)
+        self.assertEqual(pipeline.shape, (4, 3, 5, 3, 4))
+        self.assertEqual([name for name, _ in pipeline.steps],
+                         ['scale', 'reorder', 'mask', 'crop', 'crop', 'mask'])
+
+        expected = np.empty_like(self.field)
+        expected[..., coil_map[:, 1]] = (self.field*scales)[..., coil_map[:, 0]]
+        expected = (expected*mask1[..., None, None])[1:5, 1:4, 2:7]*mask2[..., None, None]
+        calls = []
+        pipeline.save(self.output_file, block_bytes=1000,
+                      progress=lambda *args: calls.append(args))
+        result = hdf5storage.loadmat(self.output_file)
+        self.assertTrue(np.allclose(result['bfMapArrayN'], expected))
+        np.testing.assert_array_equal(result['XDim'], self.fields['XDim'][1:5])
+        np.testing.assert_array_equal(result['ZDim'], self.fields['ZDim'][2:7])
+        self.assertEqual(calls[-1][:2], (expected.size, expected.size))
+        with VopgenField(self.output_file) as field:
+            self.assertEqual(field.shape, expected.shape)
+
+    def test_matches_streaming_tools(self):
+        """ The fused chain matches scale_fields_h5 then reorder_vopgen_channels.
+        """
+        scales = self.rng.standard_normal(4) + 1j*self.rng.standard_normal(4)
+        remap_file = os.path.join(self.tmp_dir.name, 'remap.txt')
+        with open(remap_file, 'w') as fh:
+            fh.write("# remap\n1 2\n2 1\n3 4\n4 3\n")
+        scaled_file = os.path.join(self.tmp_dir.name, 'scaled.mat')
+        reordered_file = os.path.join(self.tmp_dir.name, 'reordered.mat')
+        rfvopgen.scale_fields_h5(scales, self.field_file, scaled_file)
+        rfvopgen.reorder_vopgen_channels(remap_file, scaled_file, reordered_file)
+        VopgenPipeline(self.field_file).scale(scales).reorder(remap_file) \
+            .save(self.output_file)
+        self.assertTrue(np.allclose(hdf5storage.loadmat(self.output_file)['bfMapArrayN'],
+                                    hdf5storage.loadmat(reordered_file)['bfMapArrayN']))
+
+    def test_linear(self):
+        """ Linear channel maps may change the number of channels.
+        """
+        matrix = self.rng.standard_normal((2, 4))
+        pipeline = VopgenPipeline(self.field_file).linear(matrix).scale([1.0, -1.0])
+        self.assertEqual(pipeline.nchannels, 2)
+        pipeline.save(self.output_file, block_bytes=500)
+        expected = np.einsum('ij,...j->...i', matrix*[[1.0], [-1.0]], self.field)
+        self.assertTrue(np.allclose(hdf5storage.loadmat(self.output_file)['bfMapArrayN'],
+                                    expected))
+        with self.assertRaises(ValueError):
+            pipeline.scale(np.ones(4))
+        with self.assertRaises(ValueError):
+            pipeline.reorder([[0, 1], [1, 1]])
+        with self.assertRaises(ValueError):
+            pipeline.crop(z=(3, 3))
+        with self.assertRaises(ValueError):
+            pipeline.mask(np.ones((6, 5, 6)))
+
+if __name__ == "__main__":
+    unittest.main()
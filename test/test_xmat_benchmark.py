@@ -0,0 +1,38 @@
+"""
+Unit tests for the rfutils.xmat synthetic-field benchmark.
+
+"""
+import unittest
+from rfutils.xmat import xmat_benchmark
+
+class TestXmatBenchmark(unittest.TestCase):
+    """Unit tests for the xmat benchmark and accuracy suite."""
+    def test_run_benchmark(self):
+        """Every execution mode reports throughput, memory and accuracy.
+        """
+        results = xmat_benchmark.run_benchmark((10, 10, 24), workers=2,
+                                               isolate=False)
+        self.assertEqual([res['mode'] for res in results], xmat_benchmark.MODES)
+        for res in results:
+            self.assertGreater(res['voxels_per_second'], 0.0)
+            self.assertGreater(res['peak_traced_mb'], 0.0)
+            # finite-difference error on a 1 mm grid
+            self.assertLess(res['eps_r_max_error'], 1.0e-3)
+            self.assertLess(res['sigma_max_error'], 1.0e-3)
+
+    def test_isolated_mode(self):
+        """A mode run in its own process reports its peak RSS.
+        """
+        res, = xmat_benchmark.run_benchmark((10, 10, 12), modes=['serial'])
+        if xmat_benchmark.resource is not None:
+            self.assertGreater(res['peak_rss_mb'], 0.0)
+        self.assertLess(res['eps_r_max_error'], 1.0e-3)
+
+    def test_unknown_mode(self):
+        """Unknown execution modes are rejected.
+        """
+        with self.assertRaises(ValueError):
+            xmat_benchmark.run_benchmark((10, 10, 12), modes=['gpu'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Unit tests for rfutils.xmat slab-streamed extraction from HDF5 exports.
+
+"""
+import os
+import tempfile
+import unittest
+import numpy as np
+import h5py
+from rfutils import xmat
+from rfutils.xmat.xmat_benchmark import plane_wave_fields, write_cst_field
+
+class TestXmatStream(unittest.TestCase):
+    """Unit tests for slab-streamed material extraction."""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.f0 = 447.0
+        grid = np.linspace(-0.02, 0.02, 11)
+        self.zdim = np.linspace(0.0, 0.05, 26)
+        khat = np.array([1.0, 2.0, 2.0]) / 3.0
+        pol_re = np.array([2.0, -1.0, 0.0]) / np.sqrt(5.0)
+        efield, hfield = plane_wave_fields(self.f0, 50.0, 0.6, grid, grid, self.zdim,
+                                           khat, pol_re + 1.0j * np.cross(khat, pol_re))
+        self.efile = os.path.join(self.tmp_dir.name, 'e-field.h5')
+        self.hfile = os.path.join(self.tmp_dir.name, 'h-field.h5')
+        self.jfile = os.path.join(self.tmp_dir.name, 'current.h5')
+        write_cst_field(self.efile, 'E-Field', grid, grid, self.zdim, efield)
+        write_cst_field(self.hfile, 'H-Field', grid, grid, self.zdim, hfield)
+        write_cst_field(self.jfile, 'Conduction Current Density', grid, grid,
+                        self.zdim, 0.6 * efield)
+        # reference from the in-memory path on the same single precision data
+        with h5py.File(self.efile, 'r') as fh:
+            self.efield = xmat.xmat_stream.read_cst_slab(fh['E-Field'], 0,
+                                                         len(self.zdim))
+        with h5py.File(self.hfile, 'r') as fh:
+            self.hfield = xmat.xmat_stream.read_cst_slab(fh['H-Field'], 0,
+                                                         len(self.zdim))
+        with h5py.File(self.efile, 'r') as fh:
+            xdim, ydim, zdim = [fh['Mesh line ' + c][()] * 0.001 for c in 'xyz']
+        self.normal_dielectric = xmat.NormalDielectric(self.f0, xdim, ydim,
+                                                       zdim, self.efield,
+                                                       self.hfield)
+
+    def test_slab_thickness(self):
+        """Slab thickness follows the memory budget.
+        """
+        self.assertEqual(xmat.xmat_stream.slab_thickness(10, 10, 0), 1)
+        self.assertEqual(xmat.xmat_stream.slab_thickness(10, 10, 100 * 320 * 12),
+                         10)
+
+    def test_streamed_matches_in_memory(self):
+        """Streaming in thin slabs reproduces the in-memory extraction.
+        """
+        output_file = os.path.join(self.tmp_dir.name, 'materials.h5')
+        max_slab_bytes = 11 * 11 * xmat.xmat_stream.BYTES_PER_VOXEL * 6
+        xmat.extract_materials_h5(self.f0, self.efile, self.hfile, output_file,
+                                  jfield_file=self.jfile,
+                                  max_slab_bytes=max_slab_bytes)
+        with h5py.File(output_file, 'r') as fh:
+            self.assertEqual(fh.attrs['frequency'], self.f0)
+            sigma = np.transpose(fh['sigma_eff'][()], (2, 1, 0))
+            epsr = np.transpose(fh['epsilon_r'][()], (2, 1, 0))
+            epsr_w = np.transpose(fh['epsilon_r_weighted'][()], (2, 1, 0))
+            sigma_j = np.transpose(fh['sigma_eff_from_currents'][()],
+                                   (2, 1, 0, 3))
+        np.testing.assert_array_equal(sigma, self.normal_dielectric.sigma_eff)
+        np.testing.assert_array_equal(epsr, self.normal_dielectric.epsilon_r)
+        np.testing.assert_array_equal(epsr_w,
+                                      self.normal_dielectric.epsilon_r_weighted)
+        np.testing.assert_allclose(sigma_j, 0.6, rtol=1e-5)
+
+    def test_streamed_single_precision(self):
+        """Single precision streaming writes float32 results.
+        """
+        output_file = os.path.join(self.tmp_dir.name, 'materials_single.h5')
+        xmat.extract_materials_h5(self.f0, self.efile, self.hfile, output_file,
+                                  max_slab_bytes=0, precision='single')
+        with h5py.File(output_file, 'r') as fh:
+            self.assertEqual(fh['epsilon_r'].dtype, np.float32)
+            epsr = np.transpose(fh['epsilon_r'][()], (2, 1, 0))
+        interior = np.s_[:, :, 1:-2]
+        np.testing.assert_allclose(epsr[interior],
+                                   self.normal_dielectric.epsilon_r[interior],
+                                   rtol=1e-4)
+
+    def test_mismatched_mesh(self):
+        """Exports on different grids are rejected before any output.
+        """
+        output_file = os.path.join(self.tmp_dir.name, 'materials_mismatch.h5')
+        with h5py.File(self.hfile, 'r') as fh:
+            hfield = xmat.xmat_stream.read_cst_slab(fh['H-Field'], 0, len(self.zdim) - 1)
+        grid = np.linspace(-0.02, 0.02, 11)
+        write_cst_field(self.hfile, 'H-Field', grid, grid, self.zdim[:-1], hfield)
+        with self.assertRaises(ValueError):
+            xmat.extract_materials_h5(self.f0, self.efile, self.hfile, output_file)
+        self.assertFalse(os.path.exists(output_file))
+        write_cst_field(self.hfile, 'H-Field', grid, grid, self.zdim, self.hfield)
+        write_cst_field(self.jfile, 'Conduction Current Density', grid, 1.5 * grid,
+                        self.zdim, self.efield)
+        with self.assertRaises(ValueError):
+            xmat.extract_materials_h5(self.f0, self.efile, self.hfile, output_file,
+                                      jfield_file=self.jfile)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+"""
+Unit tests for rfutils.xmat using synthetic (analytic) field data.
+
+"""
+import unittest
+import numpy as np
+from rfutils import xmat
+from rfutils.xmat.xmat_benchmark import plane_wave_fields
+
+# propagation along z, polarized along x
+ZHAT = (0.0, 0.0, 1.0)
+XHAT = (1.0, 0.0, 0.0)
+
+class TestXmatSynthetic(unittest.TestCase):
+    """Unit tests for xmat material extraction from analytic fields."""
+    def setUp(self):
+        self.f0 = 447.0
+        self.eps_r = 50.0
+        self.sigma = 0.6
+        self.xdim = np.linspace(-0.01, 0.01, 6)
+        self.ydim = np.linspace(-0.01, 0.01, 7)
+        self.zdim = np.linspace(0.0, 0.05, 51)
+        self.efield, self.hfield = plane_wave_fields(self.f0, self.eps_r, self.sigma,
+                                                     self.xdim, self.ydim, self.zdim,
+                                                     ZHAT, XHAT)
+        self.normal_dielectric = xmat.NormalDielectric(self.f0, self.xdim,
+                                                       self.ydim, self.zdim,
+                                                       self.efield,
+                                                       self.hfield)
+
+    def test_plane_wave_materials(self):
+        """Extracted materials match the plane wave medium away from the edges.
+        """
+        epsr = self.normal_dielectric.epsilon_r
+        sigma = self.normal_dielectric.sigma_eff
+        self.assertEqual(np.shape(epsr), np.shape(self.efield)[0:3])
+        np.testing.assert_allclose(epsr[:, :, 1:-2], self.eps_r, rtol=1e-2)
+        np.testing.assert_allclose(sigma[:, :, 1:-2], self.sigma, rtol=1e-2)
+
+    def test_three_axis_materials(self):
+        """All three directional estimates and the |E_i|^2-weighted estimate
+        match an obliquely incident plane wave.
+        """
+        grid = np.linspace(-0.02, 0.02, 21)
+        khat = np.array([1.0, 2.0, 2.0]) / 3.0
+        pol_re = np.array([2.0, -1.0, 0.0]) / np.sqrt(5.0)
+        polarization = pol_re + 1.0j * np.cross(khat, pol_re)
+        efield, hfield = plane_wave_fields(self.f0, self.eps_r, self.sigma,
+                                           grid, grid, grid, khat, polarization)
+        xf = xmat.NormalDielectric(self.f0, grid, grid, grid, efield, hfield)
+        interior = np.s_[1:-2, 1:-2, 1:-2]
+        self.assertEqual(np.shape(xf.epsilon_r_xyz), np.shape(efield))
+        np.testing.assert_allclose(xf.epsilon_r_xyz[interior], self.eps_r,
+                                   rtol=1e-2)
+        np.testing.assert_allclose(xf.sigma_eff_xyz[interior], self.sigma,
+                                   rtol=1e-2)
+        np.testing.assert_allclose(xf.epsilon_r_weighted[interior], self.eps_r,
+                                   rtol=1e-2)
+        np.testing.assert_allclose(xf.sigma_eff_weighted[interior], self.sigma,
+                                   rtol=1e-2)
+        np.testing.assert_array_equal(xf.epsilon_r, xf.epsilon_r_xyz[..., 0])
+
+    def test_non_uniform_grid(self):
+        """Materials are recovered on a graded grid without resampling.
+        """
+        zdim = np.cumsum(np.concatenate(([0.0], 5.0e-4 * 1.03**np.arange(40))))
+        efield, hfield = plane_wave_fields(self.f0, self.eps_r, self.sigma,
+                                           self.xdim, self.ydim, zdim, ZHAT, XHAT)
+        xf = xmat.NormalDielectric(self.f0, self.xdim, self.ydim, zdim,
+                                   efield, hfield)
+        np.testing.assert_allclose(xf.epsilon_r[:, :, 1:-2], self.eps_r,
+                                   rtol=1e-2)
+        np.testing.assert_allclose(xf.sigma_eff[:, :, 1:-2], self.sigma,
+                                   rtol=1e-2)
+
+    def test_stencil_weights(self):
+        """Stencil weights reduce to the uniform central difference and are
+        exact for quadratics on non-uniform grids.
+        """
+        weights = xmat.xmat.stencil_weights(np.linspace(0.0, 1.0, 11))
+        np.testing.assert_allclose(weights[:, 1:-2],
+                                   [[-5.0] * 8, [0.0] * 8, [5.0] * 8],
+                                   atol=1e-12)
+        np.testing.assert_array_equal(weights[:, [0, -2, -1]], 0.0)
+        coords = np.array([0.0, 0.1, 0.3, 0.35, 0.6, 1.0])
+        weights = xmat.xmat.stencil_weights(coords, valid=slice(1, -1))
+        fval = coords**2
+        deriv = (weights[0, 1:-1] * fval[:-2] + weights[1, 1:-1] * fval[1:-1] +
+                 weights[2, 1:-1] * fval[2:])
+        np.testing.assert_allclose(deriv, 2.0 * coords[1:-1])
+
+    def test_parallel_matches_serial(self):
+        """Parallel extraction over x-slabs is bit-identical to the serial path.
+        """
+        xf = xmat.NormalDielectric(self.f0, self.xdim, self.ydim, self.zdim,
+                                   self.efield, self.hfield, workers=3)
+        np.testing.assert_array_equal(xf.epsilon_r_xyz,
+                                      self.normal_dielectric.epsilon_r_xyz)
+        np.testing.assert_array_equal(xf.sigma_eff_xyz,
+                                      self.normal_dielectric.sigma_eff_xyz)
+        np.testing.assert_array_equal(xf.sigma_eff_weighted,
+                                      self.normal_dielectric.sigma_eff_weighted)
+        np.testing.assert_array_equal(xf.epsilon_r_weighted,
+                                      self.normal_dielectric.epsilon_r_weighted)
+
+    def test_single_precision(self):
+        """Single precision stays complex64/float32 and tracks the double path.
+        """
+        xf = xmat.NormalDielectric(self.f0, self.xdim, self.ydim, self.zdim,
+                                   self.efield, self.hfield, precision='single')
+        self.assertEqual(xf.epsilon_r.dtype, np.float32)
+        self.assertEqual(xf.sigma_eff_weighted.dtype, np.float32)
+        interior = np.s_[:, :, 1:-2]
+        np.testing.assert_allclose(xf.epsilon_r[interior],
+                                   self.normal_dielectric.epsilon_r[interior],
+                                   rtol=1e-4)
+        np.testing.assert_allclose(xf.sigma_eff[interior],
+                                   self.normal_dielectric.sigma_eff[interior],
+                                   rtol=1e-4)
+        with self.assertRaises(ValueError):
+            xf.precision = 'half'
+
+    def test_masked_materials(self):
+        """Masked extraction matches the dense path at the masked voxels.
+        """
+        mask = np.zeros(np.shape(self.efield)[0:3], dtype=bool)
+        mask[1:4, 2:5, 10:30] = True
+        mask[0, 0, 0] = True
+        xf = xmat.NormalDielectric(self.f0, self.xdim, self.ydim, self.zdim,
+                                   self.efield, self.hfield, mask=mask)
+        sparse = xf.sparse_materials()
+        np.testing.assert_array_equal(sparse['index'], np.flatnonzero(mask))
+        np.testing.assert_array_equal(
+            sparse['epsilon_r_xyz'], self.normal_dielectric.epsilon_r_xyz[mask])
+        np.testing.assert_array_equal(
+            sparse['sigma_eff_weighted'],
+            self.normal_dielectric.sigma_eff_weighted[mask])
+        np.testing.assert_array_equal(xf.epsilon_r[mask],
+                                      self.normal_dielectric.epsilon_r[mask])
+        np.testing.assert_array_equal(xf.sigma_eff[~mask], 0.0)
+        np.testing.assert_array_equal(
+            xf.scatter(sparse['sigma_eff'], fill_value=np.nan)[mask],
+            sparse['sigma_eff'])
+        with self.assertRaises(ValueError):
+            xf.mask = mask[1:]
+        with self.assertRaises(ValueError):
+            self.normal_dielectric.sparse_materials()
+        with self.assertRaises(ValueError):
+            self.normal_dielectric.scatter(sparse['sigma_eff'])
+
+    def test_batch_materials(self):
+        """Batched extraction over stacked excitations matches one
+        NormalDielectric per excitation and combines them by |E|^2.
+        """
+        f0 = [self.f0, 2.0 * self.f0]
+        e_fields = np.empty((2,) + np.shape(self.efield), dtype=np.complex128)
+        h_fields = np.empty_like(e_fields)
+        for exc, freq in enumerate(f0):
+            e_fields[exc], h_fields[exc] = plane_wave_fields(
+                freq, self.eps_r, self.sigma, self.xdim, self.ydim, self.zdim, ZHAT, XHAT)
+        e_fields[1] *= 0.5
+        h_fields[1] *= 0.5
+        results = xmat.extract_materials_batch(f0, self.xdim, self.ydim,
+                                               self.zdim, e_fields, h_fields)
+        self.assertEqual(np.shape(results['epsilon_r']),
+                         (2,) + np.shape(self.efield)[0:3])
+        for exc, freq in enumerate(f0):
+            xf = xmat.NormalDielectric(freq, self.xdim, self.ydim, self.zdim,
+                                       e_fields[exc], h_fields[exc])
+            np.testing.assert_array_equal(results['epsilon_r'][exc],
+                                          xf.epsilon_r)
+            np.testing.assert_array_equal(results['sigma_eff_weighted'][exc],
+                                          xf.sigma_eff_weighted)
+        interior = np.s_[:, :, 1:-2]
+        np.testing.assert_allclose(results['epsilon_r_combined'][interior],
+                                   self.eps_r, rtol=1e-2)
+        np.testing.assert_allclose(results['sigma_eff_combined'][interior],
+                                   self.sigma, rtol=1e-2)
+
+    def test_efsq_floor(self):
+        """Voxels at or below the |E|^2 floor are zero instead of inf/NaN.
+        """
+        self.assertTrue(np.all(np.isfinite(self.normal_dielectric.epsilon_r_xyz)))
+        np.testing.assert_array_equal(
+            self.normal_dielectric.sigma_eff_xyz[..., 1:], 0.0)
+        efield = self.efield.copy()
+        efield[2, 3, 20, 0] = 1.0e-4
+        self.normal_dielectric.e_field = efield
+        self.normal_dielectric.efsq_floor = 1.0e-6
+        self.assertEqual(self.normal_dielectric.epsilon_r[2, 3, 20], 0.0)
+        self.assertEqual(self.normal_dielectric.sigma_eff_weighted[2, 3, 20], 0.0)
+        self.assertNotEqual(self.normal_dielectric.epsilon_r[2, 3, 21], 0.0)
+        self.normal_dielectric.current_density = np.ones_like(efield)
+        sigma_j = self.normal_dielectric.sigma_eff_from_currents
+        self.assertTrue(np.all(np.isfinite(sigma_j)))
+        self.assertEqual(sigma_j[2, 3, 20, 0], 0.0)
+
+    def test_materials_cached(self):
+        """Materials are extracted once and reused until inputs change.
+        """
+        epsr = self.normal_dielectric.epsilon_r
+        sigma = self.normal_dielectric.sigma_eff
+        self.assertIs(epsr, self.normal_dielectric.epsilon_r)
+        self.assertIs(sigma, self.normal_dielectric.sigma_eff)
+
+    def test_materials_invalidated(self):
+        """Changing frequency, grid or fields forces a new extraction.
+        """
+        epsr = self.normal_dielectric.epsilon_r
+        self.normal_dielectric.frequency = 2.0 * self.f0
+        self.assertEqual(self.normal_dielectric.frequency, 2.0 * self.f0)
+        epsr_2f = self.normal_dielectric.epsilon_r
+        self.assertIsNot(epsr, epsr_2f)
+        np.testing.assert_allclose(epsr_2f[:, :, 1:-2], 0.5 * self.eps_r,
+                                   rtol=1e-2)
+        self.normal_dielectric.zdim = 2.0 * self.zdim
+        self.assertIsNot(epsr_2f, self.normal_dielectric.epsilon_r)
+        self.normal_dielectric.h_field = 2.0 * self.hfield
+        sigma = self.normal_dielectric.sigma_eff
+        self.normal_dielectric.e_field = 2.0 * self.efield
+        self.assertIsNot(sigma, self.normal_dielectric.sigma_eff)
+
+    def test_conductivity_from_currents(self):
+        """Conductivity from currents is cached separately from the fields.
+        """
+        jfield = self.sigma * self.efield
+        self.normal_dielectric.current_density = jfield
+        sigma_j = self.normal_dielectric.sigma_eff_from_currents
+        np.testing.assert_allclose(sigma_j[:, :, :, 0], self.sigma)
+        self.assertIs(sigma_j, self.normal_dielectric.sigma_eff_from_currents)
+        self.normal_dielectric.current_density = 2.0 * jfield
+        np.testing.assert_allclose(
+            self.normal_dielectric.sigma_eff_from_currents[:, :, :, 0],
+            2.0 * self.sigma)
+
+if __name__ == "__main__":
+    unittest.main()